@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from apiflask import HTTPError
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.wrappers import Response
+
+from event_horizon import create_app
+from event_horizon.aio import adb
+from event_horizon.streams import authorize, stream_hub
+
+#: Live streams are served on the event loop rather than by the WSGI app, so
+#: an idle subscriber costs a queue and a task instead of a thread.
+STREAM_PATH = re.compile(r"^/api/events/(\d+)/stream$")
+
+
+class Application(WsgiToAsgi):
+    """Serves the app over ASGI, e.g. `uvicorn asgi:application`."""
+
+    def __init__(self, app):
+        super().__init__(app.wsgi_app)
+        self.app = app
+        self.threads = asyncio.Semaphore(app.config["ASGI_THREADS"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        match = STREAM_PATH.match(scope["path"])
+        if scope["type"] == "websocket":
+            if match:
+                await self.websocket(int(match[1]), scope, receive, send)
+            else:
+                await receive()
+                await send({"type": "websocket.close"})
+        elif match and scope["method"] == "GET":
+            await self.event_stream(int(match[1]), scope, receive, send)
+        else:
+            await self.http(scope, receive, send)
+
+    async def http(self, scope, receive, send):
+        # asgiref runs every request in the same thread by default, which
+        # would serialize the whole app. In a context of its own a request
+        # gets a thread of its own, up to ASGI_THREADS at a time, and its
+        # async views run on the server's loop.
+        async with self.threads, ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
+
+    async def event_stream(self, event_id, scope, receive, send):
+        try:
+            subscription = await self.subscribe(event_id, scope)
+        except HTTPError as e:
+            body = json.dumps({"detail": {}, "message": e.message}).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": e.status_code,
+                    "headers": [(b"content-type", b"application/json")],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+        await stream_hub.serve_sse(subscription, receive, send)
+
+    async def websocket(self, event_id, scope, receive, send):
+        await receive()
+        try:
+            subscription = await self.subscribe(event_id, scope)
+        except HTTPError as e:
+            await send({"type": "websocket.close", "code": 4000 + e.status_code})
+            return
+        await send({"type": "websocket.accept"})
+        await stream_hub.serve_websocket(subscription, receive, send)
+
+    async def subscribe(self, event_id, scope):
+        loop = asyncio.get_running_loop()
+        user_id = await loop.run_in_executor(
+            None, self._authorize, event_id, *_tokens(scope)
+        )
+        return stream_hub.subscribe(event_id, user_id, loop)
+
+    def _authorize(self, event_id, token, stream_token):
+        with self.app.app_context():
+            return authorize(event_id, token, stream_token)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                loop = asyncio.get_running_loop()
+                loop.set_default_executor(
+                    ThreadPoolExecutor(self.app.config["ASGI_THREADS"])
+                )
+                adb.use_loop(loop)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await adb.dispose()
+                adb.use_loop(None)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _tokens(scope):
+    """Returns the access token of the Authorization header and the stream
+    token of the query string.
+    """
+    token = None
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value.startswith(b"Bearer "):
+            token = value[7:].decode()
+    query = parse_qs(scope["query_string"].decode())
+    return token, query.get("token", [None])[0]
+
+
+app = create_app(os.getenv("FLASK_ENV", "development"))
+
+app.wsgi_app = DispatcherMiddleware(
+    Response("Not Found", status=HTTPStatus.NOT_FOUND), {"/api": app.wsgi_app}
+)
+
+application = Application(app)
@@ -0,0 +1,77 @@
+"""Measures alert evaluation throughput of EventAlertIndex.
+
+Usage: python -m benchmarks.alerting [--alerts N] [--records M]
+"""
+
+import argparse
+import random
+import time
+
+from event_horizon.alerting import EventAlertIndex
+
+
+def build_index(n_alerts, rng):
+    index = EventAlertIndex()
+    for i in range(n_alerts):
+        kind = i % 10
+        if kind < 7:
+            # Thresholds rarely fire, as in production: high ceilings, low floors.
+            op = rng.choice(["gt", "gte", "lt", "lte"])
+            value = (
+                rng.uniform(500, 10_000) if op in ("gt", "gte") else rng.uniform(0, 50)
+            )
+            condition = {"field": "data.latency", "op": op, "value": value}
+        elif kind < 9:
+            condition = {
+                "field": "data.region",
+                "op": "eq",
+                "value": f"region-{i % 50}",
+            }
+        else:
+            condition = {
+                "all": [
+                    {
+                        "field": "data.latency",
+                        "op": "gt",
+                        "value": rng.uniform(0, 10_000),
+                    },
+                    {"field": "data.status", "op": "in", "value": [500, 502, 503]},
+                ]
+            }
+        index.add((i, 1, "bench"), condition)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=20_000)
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = build_index(args.alerts, rng)
+    records = [
+        {
+            "data": {
+                "latency": rng.uniform(50, 600),
+                "region": f"region-{rng.randrange(100)}",
+                "status": rng.choice([200, 200, 200, 500]),
+            }
+        }
+        for _ in range(args.records)
+    ]
+
+    start = time.perf_counter()
+    matches = sum(1 for record in records for _ in index.match(record))
+    elapsed = time.perf_counter() - start
+
+    print(f"alerts:              {args.alerts}")
+    print(f"records:             {args.records}")
+    print(f"matches:             {matches}")
+    print(f"records/sec:         {args.records / elapsed:,.0f}")
+    print(f"alert evals/sec:     {args.records * args.alerts / elapsed:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
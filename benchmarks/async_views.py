@@ -0,0 +1,83 @@
+"""Compares requests/sec of an async view on the shared loop with AsyncSession
+against the old setup: an `async def` view calling the sync `db.session`,
+which Flask runs in a new event loop per request.
+
+Each request runs one query, `pg_sleep(--delay)` on PostgreSQL, from
+--concurrency client threads, as a threaded worker would.
+
+Usage: python -m benchmarks.async_views --database-url URL
+       [--requests N] [--concurrency C] [--delay SECONDS]
+"""
+
+import argparse
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from event_horizon import create_app
+from event_horizon.aio import adb
+from event_horizon.extensions import db
+
+
+def build_app(database_url, delay):
+    app = create_app("test", database_url)
+    if database_url.startswith("postgresql"):
+        stmt = db.select(db.func.pg_sleep(delay))
+    else:
+        stmt = db.select(1)
+
+    async def legacy():
+        db.session.execute(stmt)
+        return {"ok": True}
+
+    async def shared_loop():
+        async with adb.session() as session:
+            await session.execute(stmt)
+        return {"ok": True}
+
+    app.add_url_rule("/bench/legacy", view_func=legacy)
+    app.add_url_rule("/bench/async", view_func=shared_loop)
+    return app
+
+
+def run(app, path, requests, concurrency):
+    def worker(n):
+        client = app.test_client()
+        for _ in range(n):
+            assert client.get(path).status_code == 200
+
+    client = app.test_client()
+    client.get(path)
+    share, extra = divmod(requests, concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, [share + (i < extra) for i in range(concurrency)]))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    app = build_app(args.database_url, args.delay)
+    shared = run(app, "/bench/async", args.requests, args.concurrency)
+    # Restore Flask's default of a new event loop per request.
+    app.async_to_sync = types.MethodType(Flask.async_to_sync, app)
+    legacy = run(app, "/bench/legacy", args.requests, args.concurrency)
+
+    print(f"requests:            {args.requests}")
+    print(f"concurrency:         {args.concurrency}")
+    print(f"delay:               {args.delay}s")
+    print(f"legacy req/sec:      {legacy:,.0f}")
+    print(f"async req/sec:       {shared:,.0f}")
+    print(f"speedup:             {shared / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compares rows/sec of storing event data one `POST /events/<id>/data`
+request per row against `POST /events/<id>/data:batch` requests of
+--batch-size rows, which the view writes in INGEST_BATCH_SIZE chunks.
+
+Every --bad-every'th row of the batches fails in the database, so each
+chunk holding one falls back to inserting its rows one by one; 0 turns
+them off. The database must already have the schema.
+
+Usage: python -m benchmarks.ingest_batch --database-url URL
+       [--rows N] [--batch-size B] [--bad-every K]
+"""
+
+import argparse
+import time
+
+from benchmarks.ingest_buffer import seed
+from event_horizon import create_app
+
+
+def record(n, bad=False):
+    data = {"latency": n % 500, "region": f"region-{n % 4}"}
+    if bad:
+        # Valid JSON that PostgreSQL refuses to store as JSONB.
+        data["note"] = "\u0000"
+    return {"data": data, "timestamp": "2024-01-01T00:00:00"}
+
+
+def single(app, event_id, token, rows):
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    start = time.perf_counter()
+    for n in range(rows):
+        response = client.post(
+            f"/events/{event_id}/data", json=record(n), headers=headers
+        )
+        assert response.status_code == 201, response.json
+    return rows / (time.perf_counter() - start)
+
+
+def batched(app, event_id, token, rows, batch_size, bad_every):
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    stored = 0
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        body = [
+            record(n, bad=bad_every > 0 and n % bad_every == bad_every - 1)
+            for n in range(offset, min(offset + batch_size, rows))
+        ]
+        response = client.post(
+            f"/events/{event_id}/data:batch", json=body, headers=headers
+        )
+        assert response.status_code == 200, response.json
+        stored += response.json["data"]["accepted"]
+    return stored / (time.perf_counter() - start), stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--bad-every", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app("test", args.database_url)
+    event_id, token = seed(app)
+    per_request = single(app, event_id, token, args.rows)
+    per_batch, stored = batched(
+        app, event_id, token, args.rows, args.batch_size, args.bad_every
+    )
+
+    print(f"rows:                {args.rows}")
+    print(f"batch size:          {args.batch_size}")
+    print(f"chunk size:          {app.config['INGEST_BATCH_SIZE']}")
+    print(f"rows rejected:       {args.rows - stored}")
+    print(f"single rows/sec:     {per_request:,.0f}")
+    print(f"batched rows/sec:    {per_batch:,.0f}")
+    print(f"speedup:             {per_batch / per_request:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
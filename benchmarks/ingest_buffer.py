@@ -0,0 +1,88 @@
+"""Compares rows/sec of `POST /events/<id>/data` committing every request
+against the ingest buffer group-committing them.
+
+Requests are sent from --concurrency client threads, as a threaded worker
+would serve them. The database must already have the schema.
+
+Usage: python -m benchmarks.ingest_buffer --database-url URL
+       [--mode memory|wal|commit] [--requests N] [--concurrency C]
+"""
+
+import argparse
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+
+from event_horizon import create_app
+from event_horizon.buffer import ingest_buffer
+from event_horizon.extensions import db
+from event_horizon.models import Event, User
+
+
+def seed(app):
+    with app.app_context():
+        user = User(
+            email=f"{uuid.uuid4().hex[:12]}@example.com", password="Password123!"
+        )
+        db.session.add(user)
+        db.session.flush()
+        event = Event(
+            "ingest", "benchmark", datetime(2024, 1, 1), datetime(2025, 1, 1), user.id
+        )
+        db.session.add(event)
+        db.session.commit()
+        return event.id, create_access_token(identity=user.email, fresh=True)
+
+
+def run(app, event_id, token, requests, concurrency):
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"data": {"latency": 12.5}, "timestamp": "2024-01-01T00:00:00"}
+
+    def worker(n):
+        client = app.test_client()
+        for _ in range(n):
+            response = client.post(
+                f"/events/{event_id}/data", json=body, headers=headers
+            )
+            assert response.status_code in (201, 202), response.json
+
+    share, extra = divmod(requests, concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, [share + (i < extra) for i in range(concurrency)]))
+    ingest_buffer.flush()
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--mode", default="commit", choices=["memory", "wal", "commit"])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    app = create_app("test", args.database_url)
+    event_id, token = seed(app)
+    unbuffered = run(app, event_id, token, args.requests, args.concurrency)
+
+    app.config["INGEST_BUFFER"] = args.mode
+    app.config["INGEST_WAL_DIR"] = tempfile.mkdtemp(prefix="wal-")
+    ingest_buffer.init_app(app)
+    buffered = run(app, event_id, token, args.requests, args.concurrency)
+    ingest_buffer.close()
+
+    print(f"requests:            {args.requests}")
+    print(f"concurrency:         {args.concurrency}")
+    print(f"mode:                {args.mode}")
+    print(f"unbuffered rows/sec: {unbuffered:,.0f}")
+    print(f"buffered rows/sec:   {buffered:,.0f}")
+    print(f"speedup:             {buffered / unbuffered:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
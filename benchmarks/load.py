@@ -0,0 +1,197 @@
+"""Measures latency percentiles and requests/sec of the ingest, event list,
+event detail and event data routes, for the performance report and for
+catching regressions between runs.
+
+Seeds --events events with --data data points spread over them, then sends
+--requests requests to each route from --concurrency client threads, as a
+threaded worker would serve them. The database must already have the schema.
+With --no-cache the response cache is bypassed, so reads hit the database.
+
+--output saves the results as JSON. Given the JSON of an earlier run as
+--baseline, routes whose p95 latency rose or whose requests/sec fell by more
+than --tolerance are reported and the exit status is 1.
+
+Usage: python -m benchmarks.load --database-url URL [--events N] [--data M]
+       [--requests R] [--concurrency C] [--no-cache]
+       [--output FILE] [--baseline FILE] [--tolerance FRACTION]
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask_jwt_extended import create_access_token
+
+from event_horizon import create_app, partitions
+from event_horizon.buffer import ingest_buffer
+from event_horizon.extensions import cache, db
+from event_horizon.models import Event, EventData, User
+
+PER_PAGE = 20
+
+
+def seed(app, events, data, chunk=1_000):
+    """Returns the ids and resource ids of the seeded events and a token."""
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        if partitions.is_supported():
+            with db.engine.connect() as conn:
+                if partitions.is_partitioned(conn):
+                    partitions.ensure_partitions(0, now=start)
+
+        user = User(
+            email=f"{uuid.uuid4().hex[:12]}@example.com", password="Password123!"
+        )
+        db.session.add(user)
+        db.session.flush()
+        seeded = [
+            Event(f"load-{i}", "load test", start, start + timedelta(days=30), user.id)
+            for i in range(events)
+        ]
+        db.session.add_all(seeded)
+        db.session.flush()
+        ids = [(event.id, str(event.resource_id)) for event in seeded]
+
+        for offset in range(0, data, chunk):
+            rows = [
+                {
+                    "event_id": ids[n % events][0],
+                    "data": {"latency": n % 500, "region": f"region-{n % 4}"},
+                    "timestamp": start + timedelta(seconds=n),
+                }
+                for n in range(offset, min(offset + chunk, data))
+            ]
+            db.session.execute(db.insert(EventData), rows)
+        db.session.commit()
+        return ids, create_access_token(identity=user.email, fresh=True)
+
+
+def routes(ids):
+    """Maps each route to a function sending its `n`th request."""
+    pages = max(1, len(ids) // PER_PAGE)
+    body = {"data": {"latency": 12.5}, "timestamp": "2024-01-01T00:00:00"}
+    return {
+        "list": lambda client, n: client.get(
+            f"/events?page={n % pages + 1}&perPage={PER_PAGE}"
+        ),
+        "detail": lambda client, n: client.get(f"/events/{ids[n % len(ids)][1]}"),
+        "data": lambda client, n: client.get(f"/events/{ids[n % len(ids)][0]}/data"),
+        "ingest": lambda client, n: client.post(
+            f"/events/{ids[n % len(ids)][0]}/data", json=body
+        ),
+    }
+
+
+def run(app, send, token, requests, concurrency):
+    def worker(shard):
+        client = app.test_client()
+        client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        latencies = []
+        for n in range(shard, requests, concurrency):
+            start = time.perf_counter()
+            response = send(client, n)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code < 300, (response.status_code, response.json)
+        return latencies
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [t for ts in pool.map(worker, range(concurrency)) for t in ts]
+    ingest_buffer.flush()
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "rps": requests / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "cpu_seconds": time.process_time() - cpu,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change of every route from `baseline` and returns the names
+    of those that got slower by more than `tolerance`.
+    """
+    regressions = []
+    print(f"{'route':<8} {'rps':>8} {'p95':>8}")
+    for name, result in results["routes"].items():
+        before = baseline["routes"].get(name)
+        if before is None:
+            continue
+        rps = result["rps"] / before["rps"] - 1
+        p95 = result["p95_ms"] / before["p95_ms"] - 1
+        print(f"{name:<8} {rps:>+8.1%} {p95:>+8.1%}")
+        if rps < -tolerance or p95 > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--data", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    app = create_app("test", args.database_url)
+    if args.no_cache:
+        app.config["CACHE_TYPE"] = "NullCache"
+        cache.init_app(app)
+    ids, token = seed(app, args.events, args.data)
+    with app.app_context():
+        database = db.engine.dialect.name
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            "database": database,
+            "events": args.events,
+            "data": args.data,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": not args.no_cache,
+            "ingest_buffer": app.config["INGEST_BUFFER"],
+            "python": platform.python_version(),
+        },
+        "routes": {},
+    }
+    print(f"{'route':<8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, send in routes(ids).items():
+        result = run(app, send, token, args.requests, args.concurrency)
+        results["routes"][name] = result
+        print(
+            f"{name:<8} {result['rps']:>9,.1f} {result['p50_ms']:>8.2f}"
+            f" {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+        )
+    # Kilobytes on Linux.
+    results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
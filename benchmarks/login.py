@@ -0,0 +1,82 @@
+"""Measures `POST /auth/login` throughput and latency under concurrency with
+production Argon2 costs, for one or more sizes of the hashing pool.
+
+Requests are sent from --concurrency client threads, as a threaded worker
+would serve them. The database must already have the schema.
+
+Usage: python -m benchmarks.login --database-url URL
+       [--requests N] [--concurrency C] [--workers W [W ...]]
+"""
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from event_horizon import create_app
+from event_horizon.config import BaseConfig
+from event_horizon.extensions import db
+from event_horizon.models import User
+from event_horizon.utils import configure_passwords
+
+PASSWORD = "Password123!"
+
+
+def seed(app):
+    with app.app_context():
+        user = User(email=f"{uuid.uuid4().hex[:12]}@example.com", password=PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        return user.email
+
+
+def run(app, email, requests, concurrency):
+    body = {"email": email, "password": PASSWORD}
+
+    def worker(n):
+        client = app.test_client()
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            assert client.post("/auth/login", json=body).status_code == 200
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    share, extra = divmod(requests, concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        shares = [share + (i < extra) for i in range(concurrency)]
+        latencies = [t for ts in pool.map(worker, shares) for t in ts]
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    return requests / elapsed, percentiles[49], percentiles[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count()])
+    args = parser.parse_args()
+
+    app = create_app("test", args.database_url)
+    for key in ("ARGON2_TIME_COST", "ARGON2_MEMORY_COST", "ARGON2_PARALLELISM"):
+        app.config[key] = getattr(BaseConfig, key)
+    configure_passwords(app)
+    email = seed(app)
+
+    print(f"requests:    {args.requests}")
+    print(f"concurrency: {args.concurrency}")
+    print(f"{'workers':>7} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        app.config["PASSWORD_HASH_WORKERS"] = workers
+        configure_passwords(app)
+        rate, p50, p99 = run(app, email, args.requests, args.concurrency)
+        print(f"{workers:>7} {rate:>9,.1f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
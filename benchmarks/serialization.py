@@ -0,0 +1,65 @@
+"""Compares list response serialization through marshmallow and the
+stdlib encoder against RowSerializer and orjson.
+
+Usage: python -m benchmarks.serialization [--per-page N] [--pages M]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+
+import orjson
+
+from event_horizon.api import ResponseSchema
+from event_horizon.api.event.schemas import EventDTO
+from event_horizon.models import Event
+from event_horizon.serializers import RowSerializer
+
+
+def build_events(n):
+    now = datetime(2024, 1, 1)
+    events = []
+    for i in range(n):
+        event = Event(f"event-{i}", "benchmark", now, now, 1, {"raw": "30d"})
+        event.id, event.resource_id = i, uuid.uuid4()
+        event.created_at = event.updated_at = now
+        events.append(event)
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+
+    schema = EventDTO(many=True)
+    rows = RowSerializer(EventDTO(), Event)
+    events = build_events(args.per_page)
+    data = [tuple(getattr(e, c.key) for c in rows.columns) for e in events]
+    pagination = {"page": 1, "per_page": args.per_page, "total": args.per_page}
+
+    start = time.perf_counter()
+    for _ in range(args.pages):
+        body = ResponseSchema().dump(
+            {"data": schema.dump(events), "pagination": pagination}
+        )
+        json.dumps(body, sort_keys=True, separators=(",", ":"))
+    marshmallow = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.pages):
+        body = rows.body({"data": data, "pagination": pagination})
+        orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+    fast = time.perf_counter() - start
+
+    print(f"per page:            {args.per_page}")
+    print(f"marshmallow pages/s: {args.pages / marshmallow:,.0f}")
+    print(f"row serializer pg/s: {args.pages / fast:,.0f}")
+    print(f"speedup:             {marshmallow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Micro-benchmarks of functions on the request hot paths.
+
+They are kept out of the test suite and run with pytest-benchmark:
+
+Usage: python -m pytest benchmarks [--benchmark-json FILE]
+       [--benchmark-compare [NUM|ID]] [--benchmark-autosave]
+
+`--benchmark-autosave` keeps each run under `.benchmarks/`, and
+`--benchmark-compare-fail=mean:10%` fails the run on a regression.
+"""
+
+import pytest
+from argon2 import PasswordHasher
+
+from benchmarks.serialization import build_events
+from event_horizon.api import ResponseSchema, camelcase
+from event_horizon.api.event.schemas import EventDTO
+from event_horizon.config import BaseConfig
+from event_horizon.models import Event
+from event_horizon.serializers import RowSerializer
+from event_horizon.utils import PasswordHash, generate_links
+
+PASSWORD = "Password123!"
+
+
+@pytest.fixture(scope="module")
+def events():
+    return build_events(100)
+
+
+@pytest.fixture
+def password(monkeypatch):
+    # The production costs, verified on the calling thread.
+    hasher = PasswordHasher(
+        time_cost=BaseConfig.ARGON2_TIME_COST,
+        memory_cost=BaseConfig.ARGON2_MEMORY_COST,
+        parallelism=BaseConfig.ARGON2_PARALLELISM,
+    )
+    monkeypatch.setattr(PasswordHash, "hasher", hasher)
+    monkeypatch.setattr(PasswordHash, "executor", None)
+    return PasswordHash.new(PASSWORD)
+
+
+def test_camelcase(benchmark):
+    assert benchmark(camelcase, "event_resource_created_at") == "eventResourceCreatedAt"
+
+
+def test_schema_dump(benchmark, events):
+    schema = EventDTO(many=True)
+    pagination = {"page": 1, "per_page": len(events), "total": len(events)}
+
+    def dump():
+        return ResponseSchema().dump(
+            {"data": schema.dump(events), "pagination": pagination}
+        )
+
+    assert len(benchmark(dump)["data"]) == len(events)
+
+
+def test_row_serializer_body(benchmark, events):
+    rows = RowSerializer(EventDTO(), Event)
+    data = [tuple(getattr(e, c.key) for c in rows.columns) for e in events]
+    pagination = {"page": 1, "per_page": len(events), "total": len(events)}
+
+    body = benchmark(rows.body, {"data": data, "pagination": pagination})
+    assert len(body["data"]) == len(events)
+
+
+def test_password_verify(benchmark, password):
+    assert benchmark(password.__eq__, PASSWORD)
+
+
+def test_generate_links(benchmark):
+    hrefs = [f"/alerts/{i}" for i in range(20)]
+    assert len(benchmark(generate_links, "alerts", hrefs)) == 20
@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import threading
+import weakref
+from concurrent.futures import Future
+from functools import wraps
+
+from flask import has_request_context, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from event_horizon.engines import READ_METHODS, REPLICA, TimedAsyncQueuePool
+
+_DRIVERS = {
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_uri(uri):
+    """Returns the async driver equivalent of a sync database URI."""
+    scheme, sep, rest = uri.partition("://")
+    scheme = _DRIVERS.get(scheme, scheme)
+    if scheme == "postgresql+asyncpg":
+        rest = rest.replace("sslmode=", "ssl=")
+    return f"{scheme}{sep}{rest}"
+
+
+class LoopThread:
+    """An event loop running forever in a daemon thread."""
+
+    def __init__(self):
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self.loop.run_forever, name="aio-loop", daemon=True
+                ).start()
+            return self.loop
+
+
+class AsyncDatabase:
+    """Async data access over SQLAlchemy's `AsyncSession`.
+
+    Async views run on one long-lived event loop per process instead of a
+    new loop per request: the ASGI server's loop when served by `asgi.py`,
+    otherwise a loop in a background thread. Their database calls overlap
+    on that loop and share one async connection pool, while the request
+    thread only waits for the result.
+
+    Views that use `db.session` must stay plain `def` views, since blocking
+    calls on the shared loop would stall every other request.
+    """
+
+    def __init__(self, app=None):
+        self.config = None
+        self.main_loop = None
+        self._thread = LoopThread()
+        self._engines = weakref.WeakKeyDictionary()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.config = app.config
+        app.extensions["aio"] = self
+
+    def use_loop(self, loop):
+        """Runs async views on `loop` instead of the background thread."""
+        self.main_loop = loop
+
+    def async_to_sync(self, func):
+        """Replacement for `Flask.async_to_sync`."""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            loop = self.main_loop or self._thread.get()
+            context = contextvars.copy_context()
+            result = Future()
+
+            def start():
+                task = context.run(loop.create_task, func(*args, **kwargs))
+                task.add_done_callback(lambda task: _resolve(result, task))
+
+            loop.call_soon_threadsafe(start)
+            return result.result()
+
+        return wrapper
+
+    def session(self):
+        """Returns an `AsyncSession` on the current loop. During GET requests
+        it reads from the replica, if one is configured.
+        """
+        read = has_request_context() and request.method in READ_METHODS
+        return AsyncSession(
+            self.engine(REPLICA if read else None), expire_on_commit=False
+        )
+
+    def engine(self, bind=None):
+        loop = asyncio.get_running_loop()
+        engines = self._engines.setdefault(loop, {})
+        if bind not in engines:
+            uri = self._uri(bind)
+            if uri is None:
+                bind, uri = None, self._uri(None)
+            engines.setdefault(bind, create_async_engine(uri, **self._options(uri)))
+        return engines[bind]
+
+    def dialect(self):
+        """Returns the name of the primary database's dialect."""
+        return make_url(self._uri(None)).get_backend_name()
+
+    def engines(self):
+        """Returns the engines created on the current main loop."""
+        loop = self.main_loop or self._thread.loop
+        if loop is None:
+            return {}
+        return {
+            f"async:{bind or 'primary'}": engine
+            for bind, engine in self._engines.get(loop, {}).items()
+        }
+
+    async def dispose(self):
+        for engine in self._engines.pop(asyncio.get_running_loop(), {}).values():
+            await engine.dispose()
+
+    def _uri(self, bind):
+        if bind == REPLICA:
+            replica = self.config.get("SQLALCHEMY_REPLICA_URI")
+            return async_uri(replica) if replica else None
+        return self.config.get("SQLALCHEMY_ASYNC_DATABASE_URI") or async_uri(
+            self.config["SQLALCHEMY_DATABASE_URI"]
+        )
+
+    def _options(self, uri):
+        if not uri.startswith("postgresql"):
+            return {}
+        config = self.config
+        return {
+            "poolclass": TimedAsyncQueuePool,
+            "pool_size": config["DB_POOL_SIZE"],
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+            "pool_recycle": config["DB_POOL_RECYCLE"],
+            "pool_pre_ping": config["DB_POOL_PRE_PING"],
+            "connect_args": {
+                "server_settings": {
+                    "statement_timeout": str(config["DB_STATEMENT_TIMEOUT"])
+                }
+            },
+        }
+
+
+def _resolve(future, task):
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+adb = AsyncDatabase()
@@ -0,0 +1,474 @@
+import operator
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from blinker import Namespace
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy import event as sa_event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from event_horizon.cache import TTLCache
+from event_horizon.extensions import db
+from event_horizon.ingest import data_ingested
+from event_horizon.models import Alert, EventData, Notification
+from event_horizon.windows import AGGREGATES, SlidingWindow, is_number, parse_window
+
+_signals = Namespace()
+
+#: Sent after notifications are stored, with `event_id` and the
+#: `notifications` rows (dicts with `user_id`, `event_id` and `message`).
+alerts_fired = _signals.signal("alerts-fired")
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+THRESHOLD_OPS = ("gt", "gte", "lt", "lte")
+ORDERINGS = {COMPARISONS[op] for op in THRESHOLD_OPS}
+
+
+class ConditionError(ValueError):
+    pass
+
+
+def _getter(path):
+    if not isinstance(path, str) or not path:
+        raise ConditionError("field must be a non-empty string")
+    keys = path.split(".")
+
+    def get(record):
+        value = record
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+
+    return get
+
+
+def compile_condition(condition):
+    """Compiles an alert condition into a predicate over ingested records.
+
+    A record is a dict with `data` and `timestamp` keys, so fields are
+    addressed as e.g. `data.latency`. Conditions are either a comparison
+    `{"field": ..., "op": ..., "value": ...}` with op one of eq, ne, gt, gte,
+    lt, lte, in, contains or exists, or a combination
+    `{"all": [...]}`, `{"any": [...]}` or `{"not": {...}}`. Windowed
+    conditions are handled by `parse_aggregate` instead.
+    """
+    if not isinstance(condition, dict):
+        raise ConditionError("condition must be an object")
+
+    if "all" in condition or "any" in condition:
+        combine = all if "all" in condition else any
+        parts = condition.get("all", condition.get("any"))
+        if not isinstance(parts, list) or not parts:
+            raise ConditionError("all/any must be a non-empty list")
+        predicates = [compile_condition(part) for part in parts]
+        return lambda record: combine(p(record) for p in predicates)
+
+    if "not" in condition:
+        predicate = compile_condition(condition["not"])
+        return lambda record: not predicate(record)
+
+    get = _getter(condition.get("field"))
+    op = condition.get("op")
+    expected = condition.get("value")
+
+    if op == "exists":
+        return lambda record: get(record) is not None
+    if op == "in":
+        if not isinstance(expected, list):
+            raise ConditionError("value for 'in' must be a list")
+        return lambda record: get(record) in expected
+    if op == "contains":
+        return lambda record: _contains(get(record), expected)
+    if isinstance(op, str) and op in COMPARISONS:
+        compare = COMPARISONS[op]
+        return lambda record: _compare(compare, get(record), expected)
+
+    raise ConditionError(f"unsupported op {op!r}")
+
+
+def _compare(compare, actual, expected):
+    if actual is None:
+        return False
+    # JSON booleans are not numbers, though Python orders them as 0 and 1.
+    if compare in ORDERINGS and (
+        isinstance(actual, bool) or isinstance(expected, bool)
+    ):
+        return False
+    try:
+        return compare(actual, expected)
+    except TypeError:
+        return False
+
+
+def _contains(actual, expected):
+    try:
+        return actual is not None and expected in actual
+    except TypeError:
+        return False
+
+
+def parse_aggregate(condition):
+    """Parses a windowed condition such as
+    `{"aggregate": "avg", "field": "data.latency", "op": "gt", "value": 500,
+    "window": "5m"}`.
+
+    `field` may be omitted for `count`, which then counts every record.
+    Returns `(field, getter, seconds, aggregate, compare, threshold)`.
+    """
+    aggregate = condition.get("aggregate")
+    if aggregate not in AGGREGATES:
+        raise ConditionError(f"unsupported aggregate {aggregate!r}")
+    field = condition.get("field")
+    getter = None
+    if field is not None or aggregate != "count":
+        getter = _getter(field)
+    op = condition.get("op")
+    if op not in THRESHOLD_OPS and op not in ("eq", "ne"):
+        raise ConditionError(f"unsupported op {op!r}")
+    threshold = condition.get("value")
+    if not is_number(threshold):
+        raise ConditionError("value must be a number")
+    try:
+        seconds = parse_window(condition.get("window"))
+    except ValueError as e:
+        raise ConditionError(str(e))
+    return field, getter, seconds, aggregate, COMPARISONS[op], threshold
+
+
+def validate_condition(condition):
+    """Marshmallow validator for `Alert.condition` payloads."""
+    try:
+        if isinstance(condition, dict) and "aggregate" in condition:
+            parse_aggregate(condition)
+        else:
+            compile_condition(condition)
+    except ConditionError as e:
+        raise ValidationError(str(e))
+
+
+class EventAlertIndex:
+    """All alerts of one event, arranged so a record only touches the alerts
+    it can match.
+
+    Numeric threshold comparisons on a field are kept in sorted arrays and
+    resolved with a bisect, and equality comparisons in a hash map, so tens
+    of thousands of simple alerts cost O(log n + matches) per record. An
+    `all` condition is indexed by its first simple clause and only has its
+    full predicate checked when that clause matches. Anything else falls
+    back to its compiled predicate. Windowed conditions are only collected
+    here; `AlertEngine` evaluates them once per ingested chunk.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.thresholds = {}
+        self.equals = {}
+        self.predicates = []
+        self.windowed = []
+
+    def add(self, alert, condition):
+        """Indexes `alert`. Raises ConditionError for invalid conditions."""
+        if not isinstance(condition, dict):
+            raise ConditionError("condition must be an object")
+        if "aggregate" in condition:
+            self.windowed.append((alert, parse_aggregate(condition)))
+            self.size += 1
+            return
+
+        predicate = compile_condition(condition)
+        if _is_indexable(condition):
+            self._index(condition, alert, None)
+        elif "all" in condition and (
+            guard := next(filter(_is_indexable, condition["all"]), None)
+        ):
+            self._index(guard, alert, predicate)
+        else:
+            self.predicates.append((predicate, alert))
+        self.size += 1
+
+    def _index(self, clause, alert, check):
+        field, op, value = clause["field"], clause["op"], clause["value"]
+        if op == "eq":
+            _, values = self.equals.setdefault(field, (_getter(field), {}))
+            values.setdefault(value, []).append((alert, check))
+        else:
+            _, _, values, alerts = self.thresholds.setdefault(
+                (field, op), (_getter(field), op, [], [])
+            )
+            position = bisect_right(values, value)
+            values.insert(position, value)
+            alerts.insert(position, (alert, check))
+
+    def match(self, record):
+        for get, op, values, alerts in self.thresholds.values():
+            actual = get(record)
+            if not is_number(actual):
+                continue
+            if op == "gt":
+                candidates = alerts[: bisect_left(values, actual)]
+            elif op == "gte":
+                candidates = alerts[: bisect_right(values, actual)]
+            elif op == "lt":
+                candidates = alerts[bisect_right(values, actual) :]
+            else:
+                candidates = alerts[bisect_left(values, actual) :]
+            yield from _checked(candidates, record)
+
+        for get, values in self.equals.values():
+            actual = get(record)
+            if _is_hashable(actual):
+                yield from _checked(values.get(actual, ()), record)
+
+        for predicate, alert in self.predicates:
+            if predicate(record):
+                yield alert
+
+
+def _checked(candidates, record):
+    for alert, check in candidates:
+        if check is None or check(record):
+            yield alert
+
+
+def _is_indexable(clause):
+    if not isinstance(clause, dict) or not isinstance(clause.get("field"), str):
+        return False
+    op, value = clause.get("op"), clause.get("value")
+    if op in THRESHOLD_OPS:
+        return is_number(value)
+    return op == "eq" and _is_hashable(value)
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class AlertEngine:
+    """Evaluates alerts against newly ingested event data.
+
+    Alerts are indexed per event on first use and kept for `ALERT_INDEX_TTL`
+    seconds, or until an alert of that event changes in this process. Each
+    ingested chunk is matched against its event's index only, and matches
+    are written as `Notification` rows in one insert.
+
+    Windowed alerts share one `SlidingWindow` per (event, field, window),
+    rebuilt from `event_data` the first time it is needed after startup and
+    then updated incrementally. They notify when their condition becomes
+    true and re-arm once it is false again. Which of them are currently true
+    is kept per event and pruned whenever the event's index is rebuilt.
+    When the transaction that fed the windows rolls back, they are rebuilt
+    on next use and the alerts it fired are re-armed.
+    """
+
+    def __init__(self, app=None):
+        self.indexes = TTLCache()
+        self.windows = TTLCache()
+        self.window_buckets = 60
+        self._active = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.indexes = TTLCache(
+            maxsize=app.config["ALERT_INDEX_SIZE"], ttl=app.config["ALERT_INDEX_TTL"]
+        )
+        self.windows = TTLCache(
+            maxsize=app.config["ALERT_WINDOW_SIZE"], ttl=app.config["ALERT_WINDOW_TTL"]
+        )
+        self.window_buckets = app.config["ALERT_WINDOW_BUCKETS"]
+        self._active = {}
+        data_ingested.connect(self._on_ingest)
+        app.extensions["alert_engine"] = self
+
+    def index_for(self, event_id):
+        index = self.indexes.get(event_id)
+        if index is None:
+            stmt = db.select(Alert.id, Alert.user_id, Alert.condition).where(
+                Alert.event_id == event_id
+            )
+            index = EventAlertIndex()
+            for id, user_id, condition in db.session.execute(stmt):
+                try:
+                    index.add((id, user_id, _message(id, condition)), condition)
+                # Conditions stored before they were validated can be anything.
+                except (ConditionError, AttributeError, TypeError):
+                    current_app.logger.warning("skipping invalid alert %s", id)
+            self.indexes.set(event_id, index)
+            self._prune(event_id, {alert[0] for alert, _ in index.windowed})
+        return index
+
+    def _prune(self, event_id, alert_ids):
+        """Forgets the state of the event's alerts that are not in `alert_ids`."""
+        with self._lock:
+            active = self._active.pop(event_id, set()) & alert_ids
+            if active:
+                self._active[event_id] = active
+
+    def invalidate(self, event_id):
+        self.indexes.pop(event_id)
+
+    def forget(self, event_id, alert_id):
+        """Drops the state of a deleted alert, whose event may never be
+        indexed again.
+        """
+        with self._lock:
+            active = self._active.get(event_id, set())
+            active.discard(alert_id)
+            if not active:
+                self._active.pop(event_id, None)
+
+    def undo(self, windows, fired):
+        """Drops `windows` and re-arms the `fired` (event id, alert id) pairs
+        of a transaction that rolled back.
+        """
+        for key in windows:
+            self.windows.pop(key)
+        for event_id, alert_id in fired:
+            self.forget(event_id, alert_id)
+
+    def evaluate(self, event_id, records):
+        """Returns the notification rows produced by `records`."""
+        index = self.index_for(event_id)
+        if not index.size:
+            return []
+        fired = [alert for record in records for alert in index.match(record)]
+        if index.windowed:
+            fired.extend(self._evaluate_windows(event_id, index.windowed, records))
+        return [
+            {"user_id": user_id, "event_id": event_id, "message": message}
+            for _, user_id, message in fired
+        ]
+
+    def _evaluate_windows(self, event_id, windowed, records):
+        getters = {(event_id, f, seconds): g for _, (f, g, seconds, *_) in windowed}
+        windows = {key: self.windows.get(key) for key in getters}
+        # Backfills read event_data, so they run before taking the lock. They
+        # already include `records`, which the caller has written.
+        backfilled = set()
+        for key, window in windows.items():
+            if window is None:
+                windows[key] = self._backfill(event_id, getters[key], key[2])
+                backfilled.add(key)
+
+        fired = []
+        fed = db.session.info.setdefault("alert_windows", set())
+        fed.update(windows)
+        with self._lock:
+            for key, window in windows.items():
+                if key in backfilled:
+                    current = self.windows.get(key)
+                    if current is None:
+                        self.windows.set(key, window)
+                        continue
+                    # Another request built the window meanwhile.
+                    windows[key] = window = current
+                for record in records:
+                    _feed(window, getters[key], record)
+
+            active = self._active.setdefault(event_id, set())
+            for alert, (field, _, seconds, aggregate, compare, value) in windowed:
+                current = windows[(event_id, field, seconds)].value(aggregate)
+                if current is not None and compare(current, value):
+                    if alert[0] not in active:
+                        active.add(alert[0])
+                        fired.append(alert)
+                else:
+                    active.discard(alert[0])
+            if not active:
+                del self._active[event_id]
+        db.session.info.setdefault("alerts_fired", set()).update(
+            (event_id, alert[0]) for alert in fired
+        )
+        return fired
+
+    def _backfill(self, event_id, getter, seconds):
+        window = SlidingWindow(seconds, self.window_buckets)
+        latest = db.session.scalar(
+            db.select(db.func.max(EventData.timestamp)).where(
+                EventData.event_id == event_id
+            )
+        )
+        if latest is None:
+            return window
+
+        stmt = (
+            db.select(EventData.timestamp, EventData.data)
+            .where(
+                EventData.event_id == event_id,
+                EventData.timestamp > latest - timedelta(seconds=seconds),
+            )
+            .order_by(EventData.timestamp)
+        )
+        for timestamp, data in db.session.execute(
+            stmt.execution_options(yield_per=10_000)
+        ):
+            _feed(window, getter, {"data": data, "timestamp": timestamp})
+        return window
+
+    def _on_ingest(self, sender, event_id, rows):
+        notifications = self.evaluate(event_id, rows)
+        if notifications:
+            db.session.execute(db.insert(Notification), notifications)
+            alerts_fired.send(sender, event_id=event_id, notifications=notifications)
+
+
+def _feed(window, getter, record):
+    if getter is None:
+        window.add(record["timestamp"])
+        return
+    value = getter(record)
+    if is_number(value):
+        window.add(record["timestamp"], value)
+
+
+def _message(alert_id, condition):
+    message = condition.get("message") or f"Alert {alert_id} triggered"
+    return str(message)[:255]
+
+
+alert_engine = AlertEngine()
+
+
+@sa_event.listens_for(Alert, "after_insert")
+@sa_event.listens_for(Alert, "after_update")
+@sa_event.listens_for(Alert, "after_delete")
+def _invalidate_alert_index(mapper, connection, target):
+    for event_id in (target.event_id, *inspect(target).attrs.event_id.history.deleted):
+        alert_engine.invalidate(event_id)
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _keep_alert_state(session):
+    session.info.pop("alert_windows", None)
+    session.info.pop("alerts_fired", None)
+
+
+@sa_event.listens_for(Session, "after_soft_rollback")
+def _undo_alert_state(session, previous_transaction):
+    if previous_transaction.nested:
+        return
+    alert_engine.undo(
+        session.info.pop("alert_windows", ()), session.info.pop("alerts_fired", ())
+    )
+
+
+@sa_event.listens_for(Alert, "after_delete")
+def _forget_deleted_alert(mapper, connection, target):
+    alert_engine.forget(target.event_id, target.id)
@@ -1,11 +1,21 @@
+import base64
+import json
+import math
+from datetime import datetime, timezone
 from functools import wraps
 from http import HTTPStatus
+from urllib.parse import urlencode
 
 from apiflask import HTTPError, PaginationSchema, Schema
-from apiflask.fields import Field, Integer, List, Nested, String
+from apiflask.fields import Boolean, Field, Integer, List, Nested, String
 from apiflask.validators import Range
+from flask import request
 from flask_jwt_extended import verify_jwt_in_request
 
+from event_horizon.extensions import db
+from event_horizon.profiling import profiled
+from event_horizon.utils import generate_links
+
 
 def camelcase(s):
     parts = iter(s.split("_"))
@@ -20,6 +30,14 @@ class CamelCaseSchema(Schema):
     def on_bind_field(self, field_name, field_obj):
         field_obj.data_key = camelcase(field_obj.data_key or field_name)
 
+    def load(self, *args, **kwargs):
+        with profiled("validation"):
+            return super().load(*args, **kwargs)
+
+    def dump(self, *args, **kwargs):
+        with profiled("serialization"):
+            return super().dump(*args, **kwargs)
+
 
 class MetadataSchema(CamelCaseSchema):
     resource_id = String(required=True, data_key="id")
@@ -30,6 +48,8 @@ class MetadataSchema(CamelCaseSchema):
 class PaginationQuery(CamelCaseSchema):
     page = Integer(load_default=1)
     per_page = Integer(load_default=20, validate=Range(1, 100))
+    cursor = String()
+    count = Boolean()
 
 
 class RelationSchema(CamelCaseSchema):
@@ -41,6 +61,7 @@ class ResponseSchema(CamelCaseSchema):
     links = List(Nested(RelationSchema))
     data = Field(required=True)
     pagination = Nested(PaginationSchema)
+    next_cursor = String()
 
 
 def admin_required():
@@ -56,3 +77,139 @@ def admin_required():
         return decorator
 
     return wrapper
+
+
+def encode_cursor(timestamp: datetime, id: int) -> str:
+    """Returns an opaque keyset cursor for the row at (timestamp, id)."""
+    raw = json.dumps([timestamp.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    """Inverse of `encode_cursor`. Raises a 400 for malformed tokens.
+
+    Timestamps are stored as naive UTC, so one with an offset is converted.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        timestamp, id = json.loads(raw)
+        timestamp, id = datetime.fromisoformat(timestamp), int(id)
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid cursor")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp, id
+
+
+def cursor_link(param: str, token: str) -> str:
+    """Returns the current URL with `param` set to `token`."""
+    args = request.args.to_dict(flat=False)
+    args[param] = [token]
+    return f"{request.path}?{urlencode(args, doseq=True)}"
+
+
+class Page:
+    """The attributes of Flask-SQLAlchemy's `Pagination` that
+    `page_pagination` reads.
+
+    Without a `total`, `pages` is unknown and `has_next` must be given.
+    """
+
+    def __init__(self, items, page, per_page, total, has_next=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        if total is None:
+            self.pages = None
+            self.has_next = has_next
+        else:
+            self.pages = math.ceil(total / per_page) if total else 0
+            self.has_next = page < self.pages
+        self.has_prev = page > 1
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+
+
+def page_pagination(page: Page) -> dict:
+    """Returns the `pagination` field of an offset-paginated response.
+
+    Like apiflask's `pagination_builder`, but the links keep the request's
+    query arguments, and `total`, `pages` and `last` are left out when the
+    total is unknown.
+    """
+
+    def link(number):
+        return cursor_link("page", str(number))
+
+    pagination = {
+        "per_page": page.per_page,
+        "page": page.page,
+        "next": link(page.next_num) if page.has_next else "",
+        "prev": link(page.prev_num) if page.has_prev else "",
+        "first": link(1),
+        "current": link(page.page),
+    }
+    if page.total is not None:
+        pagination["total"] = page.total
+        pagination["pages"] = page.pages
+        pagination["last"] = link(max(page.pages, 1))
+    return pagination
+
+
+async def paginate(session, model, stmt, query_data, rows=False):
+    """Pages `stmt` and returns the `data`/`pagination`/`links` response fields.
+
+    By default this is offset pagination. Passing a `cursor` (empty for the
+    first page) switches to keyset pagination on (created_at, id), which
+    costs the same at any depth and skips the total count unless `count` is
+    explicitly requested.
+
+    With `rows`, `stmt` selects columns rather than `model` and `data` holds
+    the rows, which must include `id` and `created_at`.
+    """
+    fetch = session.execute if rows else session.scalars
+    per_page = query_data["per_page"]
+    keyset = "cursor" in query_data
+    total = None
+    if query_data.get("count", not keyset):
+        total = await session.scalar(
+            db.select(db.func.count()).select_from(stmt.order_by(None).subquery())
+        )
+
+    if not keyset:
+        page = query_data["page"]
+        if page < 1:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        # One extra row tells whether there is a next page without a count.
+        stmt = stmt.limit(per_page + 1).offset((page - 1) * per_page)
+        items = (await fetch(stmt)).all()
+        if not items and page != 1:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        return {
+            "data": items,
+            "pagination": page_pagination(Page(items, page, per_page, total, has_next)),
+        }
+
+    pagination = {"per_page": per_page}
+    if total is not None:
+        pagination["total"] = total
+
+    stmt = stmt.order_by(None).order_by(model.created_at.desc(), model.id.desc())
+    if query_data["cursor"]:
+        cursor = db.tuple_(*decode_cursor(query_data["cursor"]))
+        stmt = stmt.where(db.tuple_(model.created_at, model.id) < cursor)
+    items = (await fetch(stmt.limit(per_page + 1))).all()
+    if len(items) <= per_page:
+        return {"data": items, "pagination": pagination}
+
+    items = items[:per_page]
+    token = encode_cursor(items[-1].created_at, items[-1].id)
+    return {
+        "data": items,
+        "pagination": pagination,
+        "links": generate_links("next", [cursor_link("cursor", token)]),
+        "next_cursor": token,
+    }
@@ -1,5 +1,6 @@
 from apiflask.fields import Dict, Integer, String
 
+from event_horizon.alerting import validate_condition
 from event_horizon.api import CamelCaseSchema, MetadataSchema
 
 
@@ -11,4 +12,4 @@ class AlertDTO(MetadataSchema):
 class AlertRequestDTO(CamelCaseSchema):
     user_id = Integer(required=True)
     event_id = Integer(required=True)
-    condition = Dict(required=True)
+    condition = Dict(required=True, validate=validate_condition)
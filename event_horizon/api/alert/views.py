@@ -1,33 +1,35 @@
 from http import HTTPStatus
 
-from apiflask import APIBlueprint, EmptySchema, HTTPError, pagination_builder
+from apiflask import APIBlueprint, EmptySchema, HTTPError
 
-from event_horizon.api import PaginationQuery
+from event_horizon.aio import adb
+from event_horizon.api import PaginationQuery, paginate
 from event_horizon.api.alert.schemas import AlertDTO, AlertRequestDTO
+from event_horizon.cache import response_cache
 from event_horizon.extensions import db
 from event_horizon.models import Alert
+from event_horizon.serializers import RowSerializer
 
 alert_bp = APIBlueprint("alerts", __name__)
+alert_rows = RowSerializer(AlertDTO(), Alert)
 
 
 @alert_bp.get("/alerts")
 @alert_bp.input(PaginationQuery, location="query")
 @alert_bp.output(AlertDTO(many=True))
 async def list(query_data):
-    paginated_alerts = db.paginate(
-        db.select(Alert), page=query_data["page"], per_page=query_data["per_page"]
-    )
-
-    return {
-        "data": paginated_alerts.items,
-        "pagination": pagination_builder(paginated_alerts),  # type: ignore
-    }
+    async with adb.session() as session:
+        page = await paginate(
+            session, Alert, alert_rows.select(), query_data, rows=True
+        )
+    return alert_rows.response(page)
 
 
 @alert_bp.get("/alerts/<string:id>")
 @alert_bp.output(AlertDTO)
 async def get(id):
-    alert = db.session.query(Alert).filter(Alert.resource_id == id).first()  # type: ignore
+    async with adb.session() as session:
+        alert = await session.scalar(db.select(Alert).where(Alert.resource_id == id))
     if alert is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "alert not found")
     return {"data": alert}
@@ -36,17 +38,18 @@ async def get(id):
 @alert_bp.post("/alerts")
 @alert_bp.input(AlertRequestDTO)
 @alert_bp.output(AlertDTO, status_code=HTTPStatus.CREATED)
-async def create(json_data):
+def create(json_data):
     new_alert = Alert(**json_data)
     db.session.add(new_alert)
     db.session.commit()
+    response_cache.invalidate("events")
     return {"data": new_alert}
 
 
 @alert_bp.patch("/alerts/<string:id>")
 @alert_bp.input(AlertRequestDTO(partial=True))
 @alert_bp.output(AlertDTO)
-async def update(id, json_data):
+def update(id, json_data):
     alert = db.session.query(Alert).filter(Alert.resource_id == id).first()  # type: ignore
     if alert is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "alert not found")
@@ -54,16 +57,18 @@ async def update(id, json_data):
     for key, value in json_data.items():
         alert.__setattr__(key, value)
     db.session.commit()
+    response_cache.invalidate("events")
     return {"data": alert}
 
 
 @alert_bp.delete("/alerts/<string:id>")
 @alert_bp.output(EmptySchema, status_code=HTTPStatus.NO_CONTENT)
-async def delete(id):
+def delete(id):
     alert = db.session.query(Alert).filter(Alert.resource_id == id).first()  # type: ignore
     if alert is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "alert not found")
 
     db.session.delete(alert)
     db.session.commit()
+    response_cache.invalidate("events")
     return None
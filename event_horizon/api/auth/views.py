@@ -11,12 +11,14 @@ from flask_jwt_extended import (
     jwt_required,
 )
 
+from event_horizon.aio import adb
 from event_horizon.api.auth.schemas import (
     AuthResponseDTO,
     LoginRequestDTO,
     RegisterRequestDTO,
 )
 from event_horizon.api.user.schemas import UserDTO
+from event_horizon.cache import auth_cache, response_cache
 from event_horizon.extensions import db
 from event_horizon.models import TokenBlocklist, User
 
@@ -47,6 +49,7 @@ def register(json_data):
     try:
         db.session.add(new_user)
         db.session.commit()
+        response_cache.invalidate("users")
         session["user"] = new_user.id
         return {
             "data": {
@@ -63,14 +66,23 @@ def register(json_data):
 @auth_bp.post("/login")
 @auth_bp.input(LoginRequestDTO)
 @auth_bp.output(AuthResponseDTO)
-def login(json_data):
-    user = db.session.query(User).filter(User.email == json_data["email"]).first()  # type: ignore
+async def login(json_data):
+    async with adb.session() as session:
+        user = await session.scalar(
+            db.select(User).where(User.email == json_data["email"])  # type: ignore
+        )
 
-    if user is None:
-        raise HTTPError(HTTPStatus.BAD_REQUEST, "user not found")
+        if user is None:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "user not found")
 
-    if user.password != json_data["password"]:
-        raise HTTPError(HTTPStatus.UNAUTHORIZED, "incorrect password")
+        matches, rehashed = await user.password.verify(json_data["password"])
+        if not matches:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "incorrect password")
+
+        if rehashed is not None:
+            user.password = rehashed
+            await session.commit()
+            await session.refresh(user)
 
     access_token = create_access_token(
         identity=user.email, additional_claims={"is_admin": user.is_admin}, fresh=True
@@ -108,6 +120,7 @@ def logout():
     ttype = token["type"]
     db.session.add(TokenBlocklist(jti=jti, ttype=ttype))
     db.session.commit()
+    auth_cache.revoke(jti)
 
     return {"data": {"message": f"{ttype.capitalize()} token successfully revoked"}}
 
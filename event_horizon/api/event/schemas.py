@@ -1,7 +1,19 @@
-from apiflask.fields import DateTime, Dict, Integer, String
-from apiflask.validators import Length
+from datetime import timezone
+
+from apiflask.fields import (
+    DateTime,
+    Dict,
+    Float,
+    Integer,
+    List,
+    NaiveDateTime,
+    Nested,
+    String,
+)
+from apiflask.validators import Length, OneOf, Range
 
 from event_horizon.api import CamelCaseSchema, MetadataSchema
+from event_horizon.retention import validate_retention
 
 
 class EventDTO(MetadataSchema):
@@ -9,6 +21,7 @@ class EventDTO(MetadataSchema):
     description = String(required=True)
     start_date = DateTime(required=True)
     end_date = DateTime(required=True)
+    retention = Dict()
 
 
 class EventRequestDTO(CamelCaseSchema):
@@ -17,6 +30,7 @@ class EventRequestDTO(CamelCaseSchema):
     start_date = DateTime(required=True)
     end_date = DateTime(required=True)
     author_id = Integer(required=True)
+    retention = Dict(allow_none=True, validate=validate_retention)
 
 
 class EventDataDTO(MetadataSchema):
@@ -24,6 +38,51 @@ class EventDataDTO(MetadataSchema):
     timestamp = DateTime(required=True)
 
 
+class EventDataQuery(CamelCaseSchema):
+    # Timestamps are stored as naive UTC.
+    start = NaiveDateTime(data_key="from", timezone=timezone.utc)
+    end = NaiveDateTime(data_key="to", timezone=timezone.utc)
+    after = String()
+    limit = Integer(load_default=100, validate=Range(1, 1000))
+    order = String(load_default="desc", validate=OneOf(["asc", "desc"]))
+    where = List(String())
+
+
 class EventDataRequestDTO(CamelCaseSchema):
     data = Dict(required=True)
     timestamp = DateTime(required=True)
+
+
+class IngestErrorDTO(CamelCaseSchema):
+    index = Integer(required=True)
+    messages = Dict(required=True)
+
+
+class IngestResultDTO(CamelCaseSchema):
+    accepted = Integer(required=True)
+    rejected = Integer(required=True)
+    errors = List(Nested(IngestErrorDTO))
+
+
+class StreamTokenDTO(CamelCaseSchema):
+    token = String(required=True)
+    expires_in = Integer(required=True)
+
+
+class StatsQuery(CamelCaseSchema):
+    granularity = String(load_default="hour", validate=OneOf(["minute", "hour", "day"]))
+    field = String()
+    # Timestamps are stored as naive UTC.
+    start = NaiveDateTime(data_key="from", timezone=timezone.utc)
+    end = NaiveDateTime(data_key="to", timezone=timezone.utc)
+    limit = Integer(load_default=1000, validate=Range(1, 10_000))
+
+
+class StatsDTO(CamelCaseSchema):
+    bucket = DateTime(required=True)
+    field = String(required=True)
+    count = Integer(required=True)
+    sum = Float()
+    min = Float()
+    max = Float()
+    avg = Float()
@@ -1,43 +1,85 @@
+import csv
+from collections.abc import MutableSequence
 from http import HTTPStatus
 
-from apiflask import APIBlueprint, EmptySchema, HTTPError, pagination_builder
-from flask_jwt_extended import jwt_required
+from apiflask import APIBlueprint, EmptySchema, HTTPError
+from flask import Response, current_app, request
+from flask_jwt_extended import current_user, get_jwt_identity, jwt_required
 
-from event_horizon.api import PaginationQuery, admin_required
+from event_horizon.aio import adb
+from event_horizon.alerting import ConditionError
+from event_horizon.api import (
+    PaginationQuery,
+    admin_required,
+    cursor_link,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+)
 from event_horizon.api.event.schemas import (
     EventDataDTO,
+    EventDataQuery,
     EventDataRequestDTO,
     EventDTO,
     EventRequestDTO,
+    IngestResultDTO,
+    StatsDTO,
+    StatsQuery,
+    StreamTokenDTO,
 )
+from event_horizon.buffer import RowRejected, ingest_buffer
+from event_horizon.cache import response_cache
 from event_horizon.extensions import db
-from event_horizon.models import Event, EventData
+from event_horizon.ingest import (
+    CSV_MIMETYPE,
+    NDJSON_MIMETYPE,
+    LineTooLong,
+    ingest_records,
+    iter_lines,
+    notify_ingested,
+    parse_csv,
+    parse_ndjson,
+)
+from event_horizon.jsonb import parse_where, to_sql
+from event_horizon.models import Alert, Event, EventData, EventRollup
+from event_horizon.rollups import DIALECTS, RECORDS, rollup_writer
+from event_horizon.serializers import RowSerializer
+from event_horizon.streams import authorize, stream_hub, stream_token
 from event_horizon.utils import generate_links
 
 event_bp = APIBlueprint("events", __name__)
+event_rows = RowSerializer(EventDTO(), Event)
+event_data_rows = RowSerializer(EventDataDTO(), EventData)
 
 
 @event_bp.get("/events")
 @jwt_required()
+@response_cache.cached("events", per_user=False)
 @event_bp.input(PaginationQuery, location="query")
 @event_bp.output(EventDTO(many=True))
 async def list(query_data):
-    paginated_events = db.paginate(
-        db.select(Event).order_by(Event.created_at.desc()),
-        page=query_data["page"],
-        per_page=query_data["per_page"],
-    )
-    return {
-        "data": paginated_events.items,
-        "pagination": pagination_builder(paginated_events),  # type: ignore
-    }
+    async with adb.session() as session:
+        page = await paginate(
+            session,
+            Event,
+            event_rows.select().order_by(Event.created_at.desc()),
+            query_data,
+            rows=True,
+        )
+    return event_rows.response(page)
 
 
 @event_bp.get("/events/<string:id>")
 @jwt_required()
+@response_cache.cached("events", per_user=False)
 @event_bp.output(EventDTO)
 async def get(id):
-    event = db.session.query(Event).filter(Event.resource_id == id).first()  # type: ignore
+    async with adb.session() as session:
+        event = await session.scalar(
+            db.select(Event)
+            .where(Event.resource_id == id)
+            .options(db.selectinload(Event.alerts).load_only(Alert.id))  # type: ignore
+        )
     if event is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
     links = (
@@ -52,10 +94,11 @@ async def get(id):
 @jwt_required(fresh=True)
 @event_bp.input(EventRequestDTO)
 @event_bp.output(EventDTO, status_code=HTTPStatus.CREATED)
-async def create(json_data):
+def create(json_data):
     new_event = Event(**json_data)
     db.session.add(new_event)
     db.session.commit()
+    response_cache.invalidate("events", "users")
     return {"data": new_event}
 
 
@@ -63,7 +106,7 @@ async def create(json_data):
 @jwt_required(fresh=True)
 @event_bp.input(EventRequestDTO(partial=True))
 @event_bp.output(EventDTO)
-async def update(id, json_data):
+def update(id, json_data):
     event = db.session.query(Event).filter(Event.resource_id == id).first()  # type: ignore
     if event is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
@@ -71,50 +114,302 @@ async def update(id, json_data):
     for key, value in json_data.items():
         event.__setattr__(key, value)
     db.session.commit()
+    response_cache.invalidate("events", "users")
     return {"data": event}
 
 
 @event_bp.delete("/events/<string:id>")
 @admin_required()
 @event_bp.output(EmptySchema, status_code=HTTPStatus.NO_CONTENT)
-async def delete(id):
+def delete(id):
     event = db.session.query(Event).filter(Event.resource_id == id).first()  # type: ignore
     if event is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
 
     db.session.delete(event)
     db.session.commit()
+    response_cache.invalidate("events", "users")
     return None
 
 
-@event_bp.get("/events/<string:id>/data")
+@event_bp.get("/events/<int:id>/data")
 @jwt_required()
-@event_bp.output(EventDataDTO)
-async def get_data(id):
-    event_data = db.session.query(EventData).filter(EventData.event_id == id).all()  # type: ignore
-    return {"data": event_data}
+@event_bp.input(EventDataQuery, location="query")
+@event_bp.output(EventDataDTO(many=True))
+async def get_data(id, query_data):
+    """
+    List event data
 
+    Results are ordered by timestamp and paged with an opaque `after` cursor,
+    so every page is an index range scan on (event_id, timestamp, id) that
+    only touches the monthly partitions it needs.
 
-@event_bp.post("/events/<string:id>/data")
+    `where` filters on payload fields, e.g. `where=data.region:eq:us-east`
+    or `where=data.latency:gt:500`, and may be repeated. They are evaluated
+    by the database against the indexed JSONB data.
+    """
+    stmt = event_data_rows.select().where(EventData.event_id == id)
+    if "start" in query_data:
+        stmt = stmt.where(EventData.timestamp >= query_data["start"])
+    if "end" in query_data:
+        stmt = stmt.where(EventData.timestamp < query_data["end"])
+    if "where" in query_data:
+        if adb.dialect() != "postgresql":
+            raise HTTPError(
+                HTTPStatus.NOT_IMPLEMENTED, "where filters require PostgreSQL"
+            )
+        try:
+            stmt = stmt.where(
+                *(to_sql(EventData.data, parse_where(w)) for w in query_data["where"])
+            )
+        except ConditionError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+    key = db.tuple_(EventData.timestamp, EventData.id)
+    descending = query_data["order"] == "desc"
+    if "after" in query_data:
+        timestamp, data_id = decode_cursor(query_data["after"])
+        cursor = db.tuple_(timestamp, data_id)
+        # The plain bound on timestamp lets PostgreSQL prune partitions, which
+        # it cannot do from the row comparison alone.
+        if descending:
+            stmt = stmt.where(EventData.timestamp <= timestamp, key < cursor)
+        else:
+            stmt = stmt.where(EventData.timestamp >= timestamp, key > cursor)
+    if descending:
+        stmt = stmt.order_by(EventData.timestamp.desc(), EventData.id.desc())
+    else:
+        stmt = stmt.order_by(EventData.timestamp, EventData.id)
+
+    limit = query_data["limit"]
+    async with adb.session() as session:
+        event_data = (await session.execute(stmt.limit(limit + 1))).all()
+    links = None
+    if len(event_data) > limit:
+        event_data = event_data[:limit]
+        last = event_data[-1]
+        links = generate_links(
+            "next", [cursor_link("after", encode_cursor(last.timestamp, last.id))]
+        )
+    return event_data_rows.response(
+        {"data": event_data, **({"links": links} if links else {})}
+    )
+
+
+@event_bp.post("/events/<int:id>/data")
 @event_bp.input(EventDataRequestDTO)
 @jwt_required(fresh=True)
 @event_bp.output(EventDataDTO, status_code=HTTPStatus.CREATED)
-async def create_data(id, json_data):
+def create_data(id, json_data):
+    """
+    Store event data
+
+    When the server buffers ingestion, the row is written together with other
+    requests' rows and the response is 202 Accepted, without the row's id,
+    unless it waited for the commit.
+    """
+    if ingest_buffer.enabled:
+        row = {**json_data, "event_id": id}
+        try:
+            stored = ingest_buffer.append(row)
+        except RowRejected as e:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+        if stored is None:
+            return {"data": row}, HTTPStatus.ACCEPTED
+        return {"data": stored}
+
     new_event = EventData(**json_data, event_id=id)
     db.session.add(new_event)
+    notify_ingested(id, [{**json_data, "event_id": id}])
     db.session.commit()
     return {"data": new_event}
 
 
-@event_bp.put("/events/<string:id>/data/<int:data_id>")
+@event_bp.post("/events/<int:id>/data:batch")
+@jwt_required(fresh=True)
+@event_bp.output(IngestResultDTO)
+def create_data_batch(id):
+    """
+    Ingest a batch of event data
+
+    Accepts a JSON array or an NDJSON body. Rows that fail validation are
+    reported by index and do not prevent the rest of the batch from being stored.
+    """
+    if db.session.get(Event, id) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
+
+    if request.mimetype == NDJSON_MIMETYPE:
+        records = parse_ndjson(_request_lines())
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, MutableSequence):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "expected a JSON array")
+
+    return {"data": _ingest(id, records)}
+
+
+@event_bp.post("/events/<int:id>/data:stream")
+@jwt_required(fresh=True)
+@event_bp.output(IngestResultDTO)
+def stream_data(id):
+    """
+    Stream event data
+
+    Reads a CSV or NDJSON body incrementally and stores it in bounded chunks,
+    so memory use does not depend on the size of the upload.
+    """
+    if db.session.get(Event, id) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
+
+    if request.mimetype == CSV_MIMETYPE:
+        records = parse_csv(_request_lines())
+    elif request.mimetype == NDJSON_MIMETYPE:
+        records = parse_ndjson(_request_lines())
+    else:
+        raise HTTPError(
+            HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "expected text/csv or NDJSON"
+        )
+
+    return {"data": _ingest(id, records)}
+
+
+def _request_lines():
+    return iter_lines(request.stream, max_line=current_app.config["INGEST_MAX_LINE"])
+
+
+def _ingest(id, records):
+    """Stores `records` and returns the result. Chunks stored before an
+    unreadable line stay stored.
+    """
+    try:
+        result = ingest_records(
+            id,
+            records,
+            chunk_size=current_app.config["INGEST_BATCH_SIZE"],
+            max_errors=current_app.config["INGEST_MAX_ERRORS"],
+        )
+    except LineTooLong as e:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, str(e))
+    except csv.Error as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid CSV: {e}")
+    return result.as_dict()
+
+
+@event_bp.get("/events/<int:id>/stream")
+@jwt_required(optional=True)
+def stream(id):
+    """
+    Stream live event data
+
+    A `text/event-stream` of newly ingested data (`data` events) and of the
+    caller's alert notifications for the event (`notification` events).
+    Clients that fall behind get a `dropped` event with the number of
+    messages they missed. Browsers, which cannot send the Authorization
+    header from EventSource, pass a token from
+    `POST /events/<id>/stream/token` as `?token=`.
+
+    Served by `asgi.py`, the same path also accepts WebSocket connections.
+    """
+    if get_jwt_identity() is None:
+        user_id = authorize(id, stream_token=request.args.get("token"))
+    elif db.session.get(Event, id) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
+    else:
+        user_id = current_user.id
+
+    subscription = stream_hub.subscribe(id, user_id)
+    return Response(
+        stream_hub.sse(subscription),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@event_bp.post("/events/<int:id>/stream/token")
+@jwt_required()
+@event_bp.output(StreamTokenDTO)
+def create_stream_token(id):
+    """
+    Create a stream token
+
+    A token that opens only this event's stream, as `?token=`, and expires
+    after STREAM_TOKEN_EXPIRES seconds. Access tokens are never accepted in
+    the query string, where they would be written to access logs.
+    """
+    if db.session.get(Event, id) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
+
+    return {
+        "data": {
+            "token": stream_token(id, current_user.email),
+            "expires_in": current_app.config["STREAM_TOKEN_EXPIRES"],
+        }
+    }
+
+
+@event_bp.put("/events/<int:id>/data/<int:data_id>")
 @jwt_required(fresh=True)
 @event_bp.input(EventDataRequestDTO)
 @event_bp.output(EventDataDTO)
-async def update_data(id, data_id, json_data):
-    data = db.session.query(EventData).filter(EventData.resource_id == data_id).first()  # type: ignore
+def update_data(id, data_id, json_data):
+    """
+    Replace event data
+
+    The rollups of the days holding the old and new timestamp are
+    recomputed, so stats reflect the change.
+    """
+    data = db.session.scalar(
+        db.select(EventData).where(EventData.event_id == id, EventData.id == data_id)
+    )
     if data is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "event data not found")
+    previous = data.timestamp
     for key, value in json_data.items():
         data.__setattr__(key, value)
+    db.session.flush()
+    rollup_writer.refresh(id, [previous, data.timestamp])
     db.session.commit()
     return {"data": data}
+
+
+@event_bp.get("/events/<int:id>/stats")
+@jwt_required()
+@event_bp.input(StatsQuery, location="query")
+@event_bp.output(StatsDTO(many=True))
+async def get_stats(id, query_data):
+    """
+    Aggregated event data
+
+    Reads the pre-aggregated minute/hour/day rollups instead of raw data.
+    Without `field`, returns the number of records per bucket.
+    """
+    if adb.dialect() not in DIALECTS:
+        raise HTTPError(
+            HTTPStatus.NOT_IMPLEMENTED, "stats require PostgreSQL or SQLite"
+        )
+    stmt = db.select(EventRollup).where(
+        EventRollup.event_id == id,
+        EventRollup.granularity == query_data["granularity"],
+        EventRollup.field == query_data.get("field", RECORDS),
+    )
+    if "start" in query_data:
+        stmt = stmt.where(EventRollup.bucket >= query_data["start"])
+    if "end" in query_data:
+        stmt = stmt.where(EventRollup.bucket < query_data["end"])
+    stmt = stmt.order_by(EventRollup.bucket).limit(query_data["limit"])
+
+    async with adb.session() as session:
+        rollups = (await session.scalars(stmt)).all()
+
+    stats = []
+    for rollup in rollups:
+        row = {"bucket": rollup.bucket, "field": rollup.field, "count": rollup.count}
+        if rollup.field != RECORDS:
+            row.update(
+                sum=rollup.sum,
+                min=rollup.min,
+                max=rollup.max,
+                avg=rollup.sum / rollup.count if rollup.count else None,
+            )
+        stats.append(row)
+    return {"data": stats}
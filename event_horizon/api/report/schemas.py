@@ -1,14 +1,20 @@
 from apiflask.fields import Dict, Integer, String
+from apiflask.validators import OneOf
 
 from event_horizon.api import CamelCaseSchema, MetadataSchema
+from event_horizon.reports import FORMATS, validate_filters
 
 
 class ReportDTO(MetadataSchema):
     filters = Dict()
     format = String()
+    status = String()
+    rows_written = Integer()
+    error = String()
 
 
 class ReportRequestDTO(CamelCaseSchema):
     user_id = Integer(required=True)
     event_id = Integer(required=True)
-    condition = Dict(required=True)
+    filters = Dict(required=True, validate=validate_filters)
+    format = String(required=True, validate=OneOf(FORMATS))
@@ -1,76 +1,129 @@
+import os
 from http import HTTPStatus
 
-from apiflask import APIBlueprint, EmptySchema, HTTPError, pagination_builder
+from apiflask import APIBlueprint, EmptySchema, HTTPError
+from flask import send_file
+from flask_jwt_extended import current_user, get_jwt, jwt_required
 
-from event_horizon.api import PaginationQuery
+from event_horizon.aio import adb
+from event_horizon.api import PaginationQuery, paginate
 from event_horizon.api.report.schemas import ReportDTO, ReportRequestDTO
 from event_horizon.extensions import db
-from event_horizon.models import Report
+from event_horizon.jobs import job_queue
+from event_horizon.models import Event, Report
+from event_horizon.reports import generate_report
+from event_horizon.serializers import RowSerializer
 from event_horizon.utils import generate_links
 
 report_bp = APIBlueprint("reports", __name__)
+report_rows = RowSerializer(ReportDTO(), Report)
 
 
 @report_bp.get("/reports")
 @report_bp.input(PaginationQuery, location="query")
 @report_bp.output(ReportDTO(many=True))
 async def list(query_data):
-    paginated_reports = db.paginate(
-        db.select(Report), page=query_data["page"], per_page=query_data["per_page"]
-    )
-
-    return {
-        "data": paginated_reports.items,
-        "pagination": pagination_builder(paginated_reports),  # type: ignore
-    }
+    async with adb.session() as session:
+        page = await paginate(
+            session, Report, report_rows.select(), query_data, rows=True
+        )
+    return report_rows.response(page)
 
 
 @report_bp.get("/reports/<string:id>")
 @report_bp.output(ReportDTO)
 async def get(id):
-    report = db.session.query(Report).filter(Report.resource_id == id).first()  # type: ignore
+    async with adb.session() as session:
+        report = await session.scalar(
+            db.select(Report)
+            .where(Report.resource_id == id)
+            .options(db.joinedload(Report.event).load_only(Event.resource_id))  # type: ignore
+        )
     if report is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "report not found")
 
-    links = (
-        generate_links("events", [f"/{event.id}" for event in report.events])  # type: ignore
-        if len(report.events) > 0  # type: ignore
-        else None
-    )
-    return {"data": report, **({"links": links} if links else {})}
+    links = generate_links("events", [f"/events/{report.event.resource_id}"])
+    return {"data": report, "links": links}
 
 
 @report_bp.post("/reports")
 @report_bp.input(ReportRequestDTO)
 @report_bp.output(ReportDTO, status_code=HTTPStatus.CREATED)
-async def create(json_data):
+def create(json_data):
     new_report = Report(**json_data)
     db.session.add(new_report)
     db.session.commit()
+    job_queue.submit(generate_report, new_report.id)
     return {"data": new_report}
 
 
 @report_bp.patch("/reports/<string:id>")
 @report_bp.input(ReportRequestDTO(partial=True))
 @report_bp.output(ReportDTO)
-async def update(id, json_data):
-    report = db.session.query(Report).filter(Report.resource_id == id).first()  # type: ignore
+def update(id, json_data):
+    # Locked so a job publishing its file finishes first and `file_path`
+    # is current.
+    report = (
+        db.session.query(Report)
+        .filter(Report.resource_id == id)  # type: ignore
+        .with_for_update()
+        .first()
+    )
     if report is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "report not found")
 
     for key, value in json_data.items():
         report.__setattr__(key, value)
+    regenerate = "filters" in json_data or "format" in json_data
+    stale_path = report.file_path if regenerate else None
+    if regenerate:
+        report.status = "pending"
+        report.rows_written = 0
+        report.file_path = None
+        report.error = None
+        report.generation = Report.generation + 1
     db.session.commit()
+    if stale_path and os.path.exists(stale_path):
+        os.remove(stale_path)
+    if regenerate:
+        job_queue.submit(generate_report, report.id, report.generation)
     return {"data": report}
 
 
+@report_bp.get("/reports/<string:id>/download")
+@jwt_required()
+def download(id):
+    """
+    Download a generated report
+
+    Only the report's owner and admins may download it.
+    """
+    report = db.session.query(Report).filter(Report.resource_id == id).first()  # type: ignore
+    if report is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "report not found")
+    if report.user_id != current_user.id and not get_jwt()["is_admin"]:
+        raise HTTPError(HTTPStatus.FORBIDDEN, "report of another user")
+    if report.status != "done" or not report.file_path:
+        raise HTTPError(HTTPStatus.CONFLICT, "report not ready")
+
+    return send_file(
+        report.file_path,
+        mimetype="text/csv" if report.format == "csv" else "application/json",
+        as_attachment=True,
+        download_name=f"report-{report.resource_id}.{report.format}",
+    )
+
+
 @report_bp.delete("/reports/<string:id>")
 @report_bp.output(EmptySchema, status_code=HTTPStatus.NO_CONTENT)
-async def delete(id):
+def delete(id):
     report = db.session.query(Report).filter(Report.resource_id == id).first()  # type: ignore
     if report is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "report not found")
 
+    file_path = report.file_path
     db.session.delete(report)
     db.session.commit()
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
     return None
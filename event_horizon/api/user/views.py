@@ -1,39 +1,46 @@
 from http import HTTPStatus
 
-from apiflask import APIBlueprint, EmptySchema, HTTPError, pagination_builder
+from apiflask import APIBlueprint, EmptySchema, HTTPError
 from flask_jwt_extended import jwt_required
 
-from event_horizon.api import PaginationQuery, admin_required
+from event_horizon.aio import adb
+from event_horizon.api import PaginationQuery, admin_required, paginate
 from event_horizon.api.user.schemas import UserDTO, UserRequestDTO
+from event_horizon.cache import response_cache
 from event_horizon.extensions import db
-from event_horizon.models import User
+from event_horizon.models import Event, User
+from event_horizon.serializers import RowSerializer
 from event_horizon.utils import generate_links
 
 user_bp = APIBlueprint("users", __name__)
+user_rows = RowSerializer(UserDTO(), User)
 
 
 @user_bp.get("/users")
 @admin_required()
+# Only admins get this far, and they all see the same list.
+@response_cache.cached("users", per_user=False)
 @user_bp.input(PaginationQuery, location="query")
 @user_bp.output(UserDTO(many=True))
 @user_bp.doc(security="BearerAuth")
 async def list(query_data):
-    paginated_users = db.paginate(
-        db.select(User), page=query_data["page"], per_page=query_data["per_page"]
-    )
-
-    return {
-        "data": paginated_users.items,
-        "pagination": pagination_builder(paginated_users),  # type: ignore
-    }
+    async with adb.session() as session:
+        page = await paginate(session, User, user_rows.select(), query_data, rows=True)
+    return user_rows.response(page)
 
 
 @user_bp.get("/users/<string:id>")
 @jwt_required()
+@response_cache.cached("users")
 @user_bp.output(UserDTO)
 @user_bp.doc(security="BearerAuth")
 async def get(id):
-    user = db.session.query(User).filter(User.resource_id == id).first()  # type: ignore
+    async with adb.session() as session:
+        user = await session.scalar(
+            db.select(User)
+            .where(User.resource_id == id)
+            .options(db.selectinload(User.events).load_only(Event.id))  # type: ignore
+        )
     if user is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "user not found")
     links = (
@@ -49,10 +56,11 @@ async def get(id):
 @user_bp.input(UserRequestDTO)
 @user_bp.output(UserDTO, status_code=HTTPStatus.CREATED)
 @user_bp.doc(security="BearerAuth")
-async def create(json_data):
+def create(json_data):
     new_user = User(**json_data)
     db.session.add(new_user)
     db.session.commit()
+    response_cache.invalidate("users")
     return {"data": new_user}
 
 
@@ -61,7 +69,7 @@ async def create(json_data):
 @user_bp.input(UserRequestDTO(partial=True))
 @user_bp.output(UserDTO)
 @user_bp.doc(security="BearerAuth")
-async def update(id, json_data):
+def update(id, json_data):
     user = db.session.query(User).filter(User.resource_id == id).first()  # type: ignore
     if user is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "user not found")
@@ -69,6 +77,7 @@ async def update(id, json_data):
     for key, value in json_data.items():
         user.__setattr__(key, value)
     db.session.commit()
+    response_cache.invalidate("users")
     return {"data": user}
 
 
@@ -76,11 +85,12 @@ async def update(id, json_data):
 @admin_required()
 @user_bp.output(EmptySchema, status_code=HTTPStatus.NO_CONTENT)
 @user_bp.doc(security="BearerAuth")
-async def delete(id):
+def delete(id):
     user = db.session.query(User).filter(User.resource_id == id).first()  # type: ignore
     if user is None:
         raise HTTPError(HTTPStatus.NOT_FOUND, "user not found")
 
     db.session.delete(user)
     db.session.commit()
+    response_cache.invalidate("users")
     return None
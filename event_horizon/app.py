@@ -1,11 +1,16 @@
+import atexit
+import hmac
 import importlib as il
 import logging
 import logging.handlers
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
 
-from apiflask import APIFlask
+from apiflask import APIFlask, HTTPError
 from apiflask.fields import String
+from flask import Response, g, request
 from flask_cors import CORS
 from flask_jwt_extended import (
     create_access_token,
@@ -14,20 +19,44 @@ from flask_jwt_extended import (
     set_access_cookies,
 )
 
-from event_horizon.api import ResponseSchema
+from event_horizon.aio import adb
+from event_horizon.alerting import alert_engine
+from event_horizon.api import ResponseSchema, admin_required
+from event_horizon.buffer import ingest_buffer
+from event_horizon.cache import auth_cache
 from event_horizon.commands import register_commands
 from event_horizon.config import Development, Production, Test
-from event_horizon.extensions import db, jwt_manager, migrate
-from event_horizon.models import TokenBlocklist, User
+from event_horizon.engines import configure_engines, pool_stats
+from event_horizon.extensions import cache, db, jwt_manager, migrate
+from event_horizon.jobs import job_queue
+from event_horizon.logs import (
+    BoundedQueueHandler,
+    BoundedQueueListener,
+    JSONFormatter,
+    RequestContextFilter,
+)
+from event_horizon.metrics import CONTENT_TYPE, metrics
+from event_horizon.profiling import profiler
+from event_horizon.rollups import rollup_writer
+from event_horizon.streams import stream_hub
+from event_horizon.utils import configure_passwords
 
 __all__ = ["create_app"]
 
 
+class EventHorizon(APIFlask):
+    def async_to_sync(self, func):
+        """Runs async views on the shared loop of `adb` rather than a new
+        loop per request.
+        """
+        return adb.async_to_sync(func)
+
+
 def create_app(env=None, db_uri=None):
     if not env:
         env = os.getenv("FLASK_ENV", "development")
 
-    app = APIFlask(__name__, title="Event Horizon", instance_relative_config=True)
+    app = EventHorizon(__name__, title="Event Horizon", instance_relative_config=True)
     app.security_schemes = {
         "BearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}
     }
@@ -41,13 +70,12 @@ def create_app(env=None, db_uri=None):
     @jwt_manager.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         identity = jwt_data["sub"]
-        return db.session.query(User).filter(User.email == identity).first()  # type: ignore
+        return auth_cache.load_user(identity)
 
     @jwt_manager.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload: dict) -> bool:
         jti = jwt_payload["jti"]
-        token = db.session.query(TokenBlocklist).filter_by(jti=jti).first()
-        return token is not None
+        return auth_cache.is_revoked(jti)
 
     @app.after_request
     def refresh_expiring_jwts(response):
@@ -80,6 +108,45 @@ def create_app(env=None, db_uri=None):
             }
         }
 
+    @app.get("/stats/db")
+    @admin_required()
+    def db_stats():
+        """
+        Database pool stats
+
+        Pool usage and checkout wait times per engine, for sizing the pool.
+        """
+        engines = {key or "primary": engine for key, engine in db.engines.items()}
+        return {"data": {**pool_stats(engines), **pool_stats(adb.engines())}}
+
+    @app.get("/stats/profiles")
+    @admin_required()
+    def profiles():
+        """
+        Request profiles
+
+        The latest sampled and slow requests, newest first, optionally for one
+        `endpoint`. Each splits the wall time into validation, serialization,
+        SQL and view code, and lists its SQL statements with their timings.
+        """
+        return {"data": profiler.recent(request.args.get("endpoint"))}
+
+    @app.get("/metrics")
+    @app.doc(hide=True)
+    def prometheus_metrics():
+        """
+        Metrics in the Prometheus text format
+
+        Only for scrapers sending `METRICS_TOKEN` as a bearer token.
+        """
+        if not app.config["METRICS_ENABLED"]:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        token = app.config["METRICS_TOKEN"]
+        given = request.headers.get("Authorization", "").encode()
+        if not token or not hmac.compare_digest(given, f"Bearer {token}".encode()):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid metrics token")
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
     register_blueprints(app)
     register_extensions(app)
     register_commands(app, db)
@@ -99,24 +166,51 @@ def register_config(app, env):
 
 
 def register_logger(app):
-    handler = logging.handlers.RotatingFileHandler(
+    os.makedirs(os.path.dirname(app.config["LOG_FILE"]), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
         app.config["LOG_FILE"], maxBytes=app.config["LOG_SIZE"]
     )
-    handler.setLevel(app.config["LOG_LEVEL"])
-    handler.setFormatter(
-        logging.Formatter(
-            "[%(asctime)s] %(levelname)s [%(pathname)s at %(lineno)s]: %(message)s",
-            "%Y-%m-%d %H:%M:%S",
-        )
+    file_handler.setFormatter(JSONFormatter())
+
+    handler = BoundedQueueHandler(
+        app.config["LOG_QUEUE_SIZE"], app.config["LOG_DROP_POLICY"]
     )
+    handler.setLevel(app.config["LOG_LEVEL"])
+    handler.addFilter(RequestContextFilter())
+    listener = BoundedQueueListener(handler.queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
     app.logger.addHandler(handler)
+    app.extensions["log_queue"] = handler
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+    @app.after_request
+    def return_request_id(response):
+        if "request_id" in g:
+            response.headers["X-Request-ID"] = g.request_id
+        return response
 
 
 def register_extensions(app):
+    configure_engines(app)
+    configure_passwords(app)
     db.init_app(app)
+    adb.init_app(app)
     app.config["SESSION_SQLALCHEMY"] = db
     jwt_manager.init_app(app)
     migrate.init_app(app, db)
+    cache.init_app(app)
+    auth_cache.init_app(app)
+    alert_engine.init_app(app)
+    job_queue.init_app(app)
+    rollup_writer.init_app(app)
+    ingest_buffer.init_app(app)
+    stream_hub.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
 
 
 def register_blueprints(app):
@@ -0,0 +1,338 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime
+
+import orjson
+from sqlalchemy.exc import SQLAlchemyError
+
+from event_horizon.extensions import db
+from event_horizon.ingest import insert_rows, notify_ingested
+
+MODES = ("off", "memory", "wal", "commit")
+
+_start_lock = threading.Lock()
+
+
+class Segment:
+    """One file of the write-ahead log.
+
+    The file is locked for as long as it is open, so recovery can tell the
+    segments of live processes from those left behind by dead ones.
+    """
+
+    def __init__(self, path, file):
+        self.path = path
+        self.file = file
+        self.written = 0
+        self.synced = 0
+        self._lock = threading.Lock()
+
+    def sync(self, position):
+        """Makes everything up to `position` durable. Concurrent callers share
+        one fsync, so a busy log costs far fewer fsyncs than appends.
+        """
+        with self._lock:
+            if self.synced >= position or self.file.closed:
+                return
+            written = self.written
+            os.fsync(self.file.fileno())
+            self.synced = written
+
+    def remove(self):
+        with self._lock:
+            os.unlink(self.path)
+            self.file.close()
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+class WriteAheadLog:
+    """Buffered rows appended as JSON lines to segment files in `directory`.
+
+    Appends go to the current segment until `rotate()` starts a new one. A
+    segment is removed once its rows are committed; whatever is left on disk
+    after a crash is picked up by `recover()`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment = self._open()
+
+    def append(self, rows):
+        """Writes `rows` to the current segment and returns it along with the
+        position to `sync()` them up to. Callers serialize appends.
+        """
+        data = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+        self.segment.file.write(data)
+        self.segment.written += len(data)
+        return self.segment, self.segment.written
+
+    def rotate(self):
+        segment, self.segment = self.segment, self._open()
+        return segment
+
+    def recover(self):
+        """Yields each segment no live process holds, with its rows."""
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".wal"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                continue
+            # Another process recovered and removed it before we got the lock.
+            if os.fstat(file.fileno()).st_nlink == 0:
+                file.close()
+                continue
+            yield Segment(path, file), list(_decode(file))
+
+    def close(self):
+        if self.segment.written:
+            self.segment.close()
+        else:
+            self.segment.remove()
+
+    def _open(self):
+        path = os.path.join(self.directory, f"{os.getpid()}-{time.time_ns()}.wal")
+        file = open(path, "ab", buffering=0)
+        fcntl.flock(file, fcntl.LOCK_EX)
+        return Segment(path, file)
+
+
+def _decode(lines):
+    for line in lines:
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # A torn write at the end of the segment was never acknowledged.
+            break
+        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        yield row
+
+
+class RowRejected(ValueError):
+    """The database refused to store a row buffered in "commit" mode."""
+
+
+class _Batch:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.errors = {}
+        self.stored = {}
+        self.failure = None
+        self.done = threading.Event()
+
+    def reject(self, position, message):
+        self.errors[position] = message
+
+    def store(self, written):
+        """Hands the rows written, in order, back to the positions of the
+        rows that were not rejected.
+        """
+        positions = (p for p in range(len(self.rows)) if p not in self.errors)
+        self.stored = dict(zip(positions, written))
+
+
+class IngestBuffer:
+    """Group-commits rows of `POST /events/<id>/data`.
+
+    With `INGEST_BUFFER` enabled, requests append their row to a shared
+    batch and a flusher thread writes the batch out in one transaction
+    every `INGEST_BUFFER_INTERVAL` ms, or sooner once it holds
+    `INGEST_BUFFER_ROWS` rows. Requests are acknowledged according to the
+    mode: "memory" as soon as the row is buffered, "wal" once it is fsynced
+    to the write-ahead log and "commit" once the batch is committed.
+
+    Rows acknowledged before the commit are retried until the database
+    takes them; rows the database rejects are logged and dropped. Appends
+    wait while `INGEST_BUFFER_MAX_ROWS` rows are pending.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = "off"
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def init_app(self, app):
+        mode = app.config["INGEST_BUFFER"]
+        if mode not in MODES:
+            raise ValueError(f"INGEST_BUFFER must be one of {', '.join(MODES)}")
+        self.app = app
+        self.mode = mode
+        self.interval = app.config["INGEST_BUFFER_INTERVAL"] / 1000
+        self.rows = app.config["INGEST_BUFFER_ROWS"]
+        self.max_rows = app.config["INGEST_BUFFER_MAX_ROWS"]
+        self.directory = app.config["INGEST_WAL_DIR"]
+        app.extensions["ingest_buffer"] = self
+
+    def append(self, row):
+        """Buffers `row` and returns once it is as durable as the mode
+        promises. In "commit" mode, returns the row as stored, ids included,
+        or raises `RowRejected` with why the database refused it.
+        """
+        self._start()
+        with self._space:
+            while len(self._batch.rows) >= self.max_rows:
+                self._space.wait()
+            batch = self._batch
+            position = len(batch.rows)
+            batch.rows.append(row)
+            if self._wal is not None:
+                segment, end = self._wal.append([row])
+            if len(batch.rows) >= self.rows:
+                self._wake.set()
+
+        if self.mode == "wal":
+            segment.sync(end)
+        elif self.mode == "commit":
+            batch.done.wait()
+            if batch.failure is not None:
+                raise batch.failure
+            if position in batch.errors:
+                raise RowRejected(batch.errors[position])
+            return batch.stored[position]
+        return None
+
+    def flush(self):
+        """Writes out the rows buffered so far in one transaction."""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            batch = self._batch
+            if not batch.rows:
+                return
+            self._batch = _Batch()
+            segment = self._wal.rotate() if self._wal is not None else None
+            self._space.notify_all()
+
+        self._write(batch)
+        if segment is not None:
+            if batch.failure is None:
+                segment.remove()
+            else:
+                segment.close()
+        batch.done.set()
+
+    def close(self):
+        """Stops the flusher once the buffered rows are written out."""
+        if self._pid != os.getpid():
+            return
+        self._closing = True
+        self._wake.set()
+        self._thread.join()
+        if self._wal is not None:
+            self._wal.close()
+        self._pid = None
+
+    def _start(self):
+        # The flusher belongs to the process appending, not to the one that
+        # created the app and forked the workers.
+        if self._pid == os.getpid():
+            return
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            self._lock = threading.Lock()
+            self._space = threading.Condition(self._lock)
+            self._wake = threading.Event()
+            self._batch = _Batch()
+            self._closing = False
+            self._wal = None
+            if self.mode == "wal":
+                self._wal = WriteAheadLog(self.directory)
+            self._thread = threading.Thread(
+                target=self._run, name="ingest-flusher", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+            self._pid = os.getpid()
+
+    def _run(self):
+        if self._wal is not None:
+            self._recover()
+        while not self._closing:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def _recover(self):
+        for segment, rows in self._wal.recover():
+            batch = _Batch(rows)
+            if rows:
+                self._write(batch)
+            if batch.failure is None:
+                segment.remove()
+            else:
+                segment.close()
+
+    def _write(self, batch):
+        try:
+            self._commit(batch)
+        except Exception as e:
+            batch.failure = e
+            self.app.logger.error("ingest buffer flush failed", exc_info=e)
+
+    def _commit(self, batch):
+        with self.app.app_context():
+            while True:
+                try:
+                    batch.errors.clear()
+                    written = insert_rows(
+                        batch.rows, batch.reject, returning=self.mode == "commit"
+                    )
+                    self._notify(written)
+                    db.session.commit()
+                    batch.store(written)
+                    break
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    self.app.logger.error("ingest buffer flush failed", exc_info=e)
+                    # Requests waiting on the commit report the failure
+                    # themselves; acknowledged rows are retried.
+                    if self.mode == "commit" or self._closing:
+                        batch.failure = e
+                        return
+                    time.sleep(self.interval)
+
+            if batch.errors and self.mode != "commit":
+                self.app.logger.warning(
+                    "ingest buffer dropped %d rows, e.g. %s",
+                    len(batch.errors),
+                    next(iter(batch.errors.values())),
+                )
+
+    def _notify(self, written):
+        by_event = {}
+        for row in written:
+            by_event.setdefault(row["event_id"], []).append(row)
+        # A failing listener loses what it wrote, not the buffered rows.
+        for event_id, rows in by_event.items():
+            try:
+                with db.session.begin_nested():
+                    notify_ingested(event_id, rows)
+            except Exception as e:
+                if getattr(e, "connection_invalidated", False):
+                    raise
+                self.app.logger.error("ingest listeners failed", exc_info=e)
+
+
+ingest_buffer = IngestBuffer()
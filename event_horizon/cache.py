@@ -0,0 +1,256 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from http import HTTPStatus
+
+from flask import Response, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event as sa_event
+from sqlalchemy import inspect
+
+from event_horizon.extensions import cache, db
+from event_horizon.models import TokenBlocklist, User
+
+_missing = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is _missing:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BloomFilter:
+    """Fixed-size bloom filter sized for `capacity` keys at `error_rate`.
+
+    Membership tests can return false positives but never false negatives,
+    so a miss is a definitive "not present".
+    """
+
+    def __init__(self, capacity=100_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+
+class AuthCache:
+    """Caches the JWT user lookup and token revocation check.
+
+    Users are cached detached from any session and merged into the current
+    one without a query. Revocation results are cached per jti; with the
+    bloom filter enabled, tokens that were never revoked skip the database
+    entirely and the filter is topped up from `TokenBlocklist` every
+    `AUTH_BLOOM_REFRESH` seconds so revocations from other workers are seen.
+    """
+
+    def __init__(self, app=None):
+        self.users = TTLCache()
+        self.tokens = TTLCache()
+        self.bloom = None
+        self._bloom_refresh = 0
+        self._bloom_expires = 0.0
+        self._bloom_last_id = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        size = app.config["AUTH_CACHE_SIZE"]
+        ttl = app.config["AUTH_CACHE_TTL"]
+        self.users = TTLCache(maxsize=size, ttl=ttl)
+        self.tokens = TTLCache(maxsize=size, ttl=ttl)
+        self.bloom = None
+        if app.config["AUTH_BLOOM_FILTER"]:
+            self.bloom = BloomFilter(
+                app.config["AUTH_BLOOM_CAPACITY"], app.config["AUTH_BLOOM_ERROR_RATE"]
+            )
+            self._bloom_refresh = app.config["AUTH_BLOOM_REFRESH"]
+            self._bloom_expires = 0.0
+            self._bloom_last_id = 0
+        app.extensions["auth_cache"] = self
+
+    def load_user(self, email):
+        user = self.users.get(email)
+        if user is None:
+            user = db.session.query(User).filter(User.email == email).first()  # type: ignore
+            if user is None:
+                return None
+            db.session.expunge(user)
+            self.users.set(email, user)
+        return db.session.merge(user, load=False)
+
+    def invalidate_user(self, email):
+        self.users.pop(email)
+
+    def is_revoked(self, jti):
+        if self.bloom is not None:
+            self._refresh_bloom()
+            if jti not in self.bloom:
+                return False
+
+        revoked = self.tokens.get(jti)
+        if revoked is None:
+            revoked = (
+                db.session.query(TokenBlocklist.id).filter_by(jti=jti).first()
+                is not None
+            )
+            self.tokens.set(jti, revoked)
+        return revoked
+
+    def revoke(self, jti):
+        self.tokens.set(jti, True)
+        if self.bloom is not None:
+            self.bloom.add(jti)
+
+    def _refresh_bloom(self):
+        if time.monotonic() < self._bloom_expires:
+            return
+        with self._lock:
+            if time.monotonic() < self._bloom_expires:
+                return
+            stmt = (
+                db.select(TokenBlocklist.id, TokenBlocklist.jti)
+                .where(TokenBlocklist.id > self._bloom_last_id)
+                .order_by(TokenBlocklist.id)
+            )
+            for id, jti in db.session.execute(stmt.execution_options(yield_per=10_000)):
+                self.bloom.add(jti)  # type: ignore
+                self._bloom_last_id = id
+            self._bloom_expires = time.monotonic() + self._bloom_refresh
+
+
+class ResponseCache:
+    """Caches serialized GET responses in the Flask-Caching backend.
+
+    Entries are keyed by namespace, the namespace generation, the JWT identity
+    (when `per_user` is set) and the full request path including the query
+    string. Write views call `invalidate`, which replaces the generation token
+    so every entry of the namespace is orphaned at once without scanning keys.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def cached(self, namespace, per_user=True, timeout=None):
+        """Decorator for GET views, placed below the auth decorators."""
+
+        def wrapper(fn):
+            @wraps(fn)
+            def decorator(*args, **kwargs):
+                key = self._key(namespace, per_user)
+                entry = cache.get(key)
+                if entry is None:
+                    self._count(hit=False)
+                    response = make_response(fn(*args, **kwargs))
+                    if response.status_code != HTTPStatus.OK:
+                        return response
+                    body = response.get_data()
+                    entry = (body, response.mimetype, hashlib.sha1(body).hexdigest())
+                    cache.set(key, entry, timeout=timeout)
+                else:
+                    self._count(hit=True)
+
+                body, mimetype, etag = entry
+                if request.if_none_match.contains_weak(etag):
+                    response = Response(status=HTTPStatus.NOT_MODIFIED)
+                else:
+                    response = Response(body, mimetype=mimetype)
+                response.set_etag(etag)
+                return response
+
+            return decorator
+
+        return wrapper
+
+    def _count(self, hit):
+        # Threaded workers serve requests concurrently, and `+=` is not atomic.
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            cache.set(f"gen:{namespace}", uuid.uuid4().hex, timeout=0)
+
+    def _key(self, namespace, per_user):
+        identity = get_jwt_identity() if per_user else None
+        generation = self._generation(namespace)
+        return f"view:{namespace}:{generation}:{identity}:{request.full_path}"
+
+    def _generation(self, namespace):
+        key = f"gen:{namespace}"
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, uuid.uuid4().hex, timeout=0)
+            generation = cache.get(key)
+        return generation
+
+
+auth_cache = AuthCache()
+response_cache = ResponseCache()
+
+
+@sa_event.listens_for(User, "after_update")
+@sa_event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    for email in (target.email, *inspect(target).attrs.email.history.deleted):
+        auth_cache.invalidate_user(email)
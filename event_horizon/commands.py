@@ -1,6 +1,8 @@
+import click
 from sqlalchemy.orm import configure_mappers
 
-from event_horizon.models import User
+from event_horizon import jsonb, partitions, retention, rollups
+from event_horizon.models import Event, User
 
 
 def register_commands(app, db):
@@ -9,6 +11,8 @@ def register_commands(app, db):
         db.drop_all()
         configure_mappers()
         db.create_all()
+        if partitions.is_supported():
+            partitions.ensure_partitions(app.config["EVENT_DATA_PARTITION_MONTHS"])
 
         if app.config["FLASK_ENV"] == "development":
             user = User(
@@ -33,3 +37,93 @@ def register_commands(app, db):
         print(
             f"Initialized the database{'' if app.config['FLASK_ENV'] == 'production' else ' with 10 demo users'}."
         )
+
+    @app.cli.command("create-partitions")
+    @click.option("--months", type=int, help="Months to create ahead of now.")
+    def create_partitions(months):
+        """Create upcoming monthly event_data partitions.
+
+        Run this at least monthly (e.g. from cron) so new data never lands in
+        the default partition.
+        """
+        if not partitions.is_supported():
+            print("event_data is only partitioned on PostgreSQL.")
+            return
+        with db.engine.connect() as conn:
+            if not partitions.is_partitioned(conn):
+                print("event_data is not partitioned, run partition-event-data first.")
+                return
+
+        if months is None:
+            months = app.config["EVENT_DATA_PARTITION_MONTHS"]
+        created = partitions.ensure_partitions(months)
+        with db.engine.connect() as conn:
+            existing = partitions.partitions(conn)
+        print(
+            f"Created {len(created)} partitions, event_data is partitioned "
+            f"from {existing[0]:%Y-%m} to {existing[-1]:%Y-%m}."
+        )
+
+    @app.cli.command("partition-event-data")
+    def partition_event_data():
+        """Convert an unpartitioned event_data table to monthly partitions."""
+        if not partitions.is_supported():
+            print("event_data is only partitioned on PostgreSQL.")
+            return
+        with db.engine.connect() as conn:
+            if partitions.is_partitioned(conn):
+                print("event_data is already partitioned.")
+                return
+
+        copied = partitions.convert()
+        partitions.ensure_partitions(app.config["EVENT_DATA_PARTITION_MONTHS"])
+        print(f"Partitioned event_data, copied {copied} rows.")
+
+    @app.cli.command("migrate-jsonb")
+    def migrate_jsonb():
+        """Convert JSON columns to JSONB and index event data payloads."""
+        if db.engine.dialect.name != "postgresql":
+            print("JSONB requires PostgreSQL.")
+            return
+        converted = jsonb.migrate()
+        print(f"Converted {', '.join(converted) or 'no columns'} to JSONB.")
+
+    @app.cli.command("index-event-data")
+    @click.argument("fields", nargs=-1, required=True)
+    def index_event_data(fields):
+        """Add expression indexes for range filters on FIELDS (e.g. data.latency)."""
+        if db.engine.dialect.name != "postgresql":
+            print("Payload indexes require PostgreSQL.")
+            return
+        for field in fields:
+            print(f"Created {jsonb.create_key_index(field)}.")
+
+    @app.cli.command("rebuild-rollups")
+    @click.option("--event-id", type=int, help="Only rebuild this event.")
+    def rebuild_rollups(event_id):
+        """Recompute event rollups from raw event data."""
+        if not rollups.is_supported():
+            print("Rollups require PostgreSQL or SQLite.")
+            return
+        event_ids = (
+            [event_id]
+            if event_id is not None
+            else db.session.scalars(db.select(Event.id)).all()
+        )
+        for id in event_ids:
+            rollups.rebuild(id)
+            print(f"Rebuilt rollups for event {id}.")
+
+    @app.cli.command("enforce-retention")
+    def enforce_retention():
+        """Delete event data and rollups past their retention policy.
+
+        Schedule this (e.g. daily from cron) alongside create-partitions.
+        """
+        removed = retention.enforce()
+        partitions_dropped = removed.pop("partitions")
+        print(
+            f"Dropped {partitions_dropped} partitions, deleted "
+            + ", ".join(f"{count} {level}" for level, count in removed.items())
+            + " rows."
+        )
@@ -20,16 +20,130 @@ class BaseConfig(object):
     # Flask-Sqlalchemy
     SQLALCHEMY_ECHO = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Reads of GET requests go to the replica when one is configured
+    SQLALCHEMY_REPLICA_URI = os.getenv("DATABASE_REPLICA_URL")
+    # Async views use asyncpg; derived from SQLALCHEMY_DATABASE_URI when unset
+    SQLALCHEMY_ASYNC_DATABASE_URI = os.getenv("DATABASE_ASYNC_URL")
+
+    # Connection pool (PostgreSQL only); DB_STATEMENT_TIMEOUT is in ms and
+    # lifted by maintenance commands
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 30 * 60
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 30_000))
+
+    # Requests served at once under asgi.py, each on a thread of its own;
+    # async views share one event loop
+    ASGI_THREADS = int(os.getenv("ASGI_THREADS", 32))
 
     # Flask-JWT
     JWT_SECRET_KEY = secret_key
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=1)
 
-    # Flask-cache
-    CACHE_TYPE = "simple"
+    # Passwords: Argon2 cost per hash, ARGON2_MEMORY_COST in KiB. Hashes made
+    # with other parameters are replaced on the next login. At most
+    # PASSWORD_HASH_WORKERS hashes run at once.
+    ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+    ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 64 * 1024))
+    ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 4))
+
+    # Auth cache: user lookups and revocation checks are cached for
+    # AUTH_CACHE_TTL seconds, which bounds how long another worker may take to
+    # see a logout. The bloom filter is topped up every AUTH_BLOOM_REFRESH seconds.
+    AUTH_CACHE_SIZE = 10_000
+    AUTH_CACHE_TTL = 30
+    AUTH_BLOOM_FILTER = False
+    AUTH_BLOOM_CAPACITY = 1_000_000
+    AUTH_BLOOM_ERROR_RATE = 0.001
+    AUTH_BLOOM_REFRESH = 5
+
+    # Monthly event_data partitions kept ahead of the current month
+    EVENT_DATA_PARTITION_MONTHS = 3
+
+    # Retention: defaults for events without their own policy, per level
+    # ("raw", "minute", "hour", "day"), e.g. {"raw": "30d", "minute": "365d"}.
+    # Levels left out are kept forever.
+    RETENTION_POLICY = {}
+    RETENTION_BATCH_SIZE = 5000
+    RETENTION_LOCK_TIMEOUT = "5s"
+
+    # Rollups: minute/hour/day aggregates maintained on ingest
+    ROLLUPS_ENABLED = True
+
+    # Background jobs: JOB_QUEUE is "process", "thread" or "sync"
+    JOB_QUEUE = os.getenv("JOB_QUEUE", "process")
+    JOB_WORKERS = 2
+
+    # Reports
+    REPORT_DIR = os.path.join(base_dir, "instance", "reports")
+    REPORT_BATCH_SIZE = 10_000
+    REPORT_PROGRESS_INTERVAL = 50_000
+
+    # Flask-cache: set CACHE_TYPE=RedisCache and CACHE_REDIS_URL to share the
+    # response cache between workers.
+    CACHE_TYPE = os.getenv("CACHE_TYPE", "SimpleCache")
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
     CACHE_DEFAULT_TIMEOUT = 60
 
+    # Ingestion
+    INGEST_BATCH_SIZE = 1000
+    INGEST_MAX_ERRORS = 100
+    # Longest line, in bytes, of a CSV or NDJSON upload.
+    INGEST_MAX_LINE = 1024 * 1024
+    # Single rows are group-committed by a flusher every INGEST_BUFFER_INTERVAL
+    # ms or INGEST_BUFFER_ROWS rows unless INGEST_BUFFER is "off". Requests are
+    # acknowledged once the row is buffered ("memory"), fsynced to the
+    # write-ahead log in INGEST_WAL_DIR ("wal") or committed ("commit").
+    INGEST_BUFFER = os.getenv("INGEST_BUFFER", "off")
+    INGEST_BUFFER_INTERVAL = 50
+    INGEST_BUFFER_ROWS = 1000
+    INGEST_BUFFER_MAX_ROWS = 100_000
+    INGEST_WAL_DIR = os.path.join(base_dir, "instance", "wal")
+
+    # Alerting: per-event alert indexes are rebuilt after ALERT_INDEX_TTL seconds
+    ALERT_INDEX_SIZE = 10_000
+    ALERT_INDEX_TTL = 30
+    # Sliding windows for aggregate alerts are rebuilt from event_data after
+    # ALERT_WINDOW_TTL seconds; ALERT_WINDOW_BUCKETS sets their time resolution
+    ALERT_WINDOW_SIZE = 10_000
+    ALERT_WINDOW_TTL = 24 * 60 * 60
+    ALERT_WINDOW_BUCKETS = 60
+
+    # Live streams: each subscriber buffers up to STREAM_QUEUE_SIZE messages and
+    # loses the oldest when it falls behind. Idle streams are pinged every
+    # STREAM_HEARTBEAT seconds.
+    STREAM_QUEUE_SIZE = 1000
+    STREAM_HEARTBEAT = 15
+    STREAM_MAX_SUBSCRIBERS = 10_000
+    # Lifetime in seconds of the `?token=` of streams opened without a header
+    STREAM_TOKEN_EXPIRES = 60
+
+    # Profiling: a PROFILE_SAMPLE_RATE fraction of requests plus every request
+    # slower than PROFILE_SLOW_MS is profiled; 0 turns either off. The latest
+    # PROFILE_BUFFER_SIZE profiles are served at /stats/profiles.
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", 0))
+    PROFILE_BUFFER_SIZE = 200
+    PROFILE_MAX_STATEMENTS = 100
+
+    # Metrics: request, database, cache and ingestion metrics at /metrics, for
+    # scrapers that send METRICS_TOKEN as a bearer token. Off without one.
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    METRICS_ENABLED = bool(METRICS_TOKEN)
+
+    # Logging: records are written as JSON lines by a background thread. Up to
+    # LOG_QUEUE_SIZE records wait for the disk, then LOG_DROP_POLICY applies:
+    # "drop_new", "drop_oldest" or "block".
+    LOG_FILE = os.path.join(base_dir, "logs", "app.log")
+    LOG_LEVEL = logging.INFO
+    LOG_SIZE = 1024 * 1024
+    LOG_QUEUE_SIZE = 10_000
+    LOG_DROP_POLICY = os.getenv("LOG_DROP_POLICY", "drop_new")
+
     # Flask-API
     SYNC_LOCAL_SPEC = True
     LOCAL_SPEC_PATH = os.path.join(base_dir, "openapi.json")
@@ -52,18 +166,26 @@ class Development(BaseConfig):
         f"postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{PGHOST}/{PGDATABASE}"
     )
 
-    LOG_FILE = os.path.join(base_dir, "logs", "app.log")
-    LOG_LEVEL = logging.INFO
-    LOG_SIZE = 1024 * 1024
-
 
 class Production(BaseConfig):
     FLASK_ENV = "production"
 
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 10_000))
+
+    AUTH_BLOOM_FILTER = True
+
 
 class Test(BaseConfig):
     FLASK_ENV = "test"
     TESTING = True
+    JOB_QUEUE = "sync"
+    DB_POOL_SIZE = 2
+    DB_MAX_OVERFLOW = 5
+    ARGON2_TIME_COST = 1
+    ARGON2_MEMORY_COST = 8
+    ARGON2_PARALLELISM = 1
     SQLALCHEMY_DATABASE_URI = os.getenv(
         "DATABASE_TEST", "postgresql+psycopg2:///postgres@localhost/eventhorizon_test"
     )
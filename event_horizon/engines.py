@@ -0,0 +1,194 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+#: Bind key of the read replica engine in `SQLALCHEMY_BINDS`.
+REPLICA = "replica"
+
+#: Request methods whose reads may be served by the replica.
+READ_METHODS = ("GET", "HEAD")
+
+#: Upper bounds, in seconds, of the pool wait-time histogram buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+
+class PoolWaitStats:
+    """How long connection checkouts waited on a pool, as a histogram."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+        self.buckets = [0] * len(WAIT_BUCKETS)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, timed_out=False):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.timeouts += timed_out
+            self.buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "wait_seconds_total": self.total,
+                "wait_seconds_max": self.max,
+                "timeouts": self.timeouts,
+                "buckets": dict(zip(map(str, WAIT_BUCKETS), self.buckets)),
+            }
+
+
+class _TimedPool:
+    """Records how long each checkout waits in `wait_stats`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.wait_stats.observe(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.observe(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class RoutingSession(Session):
+    """Sends the reads of GET requests to the read replica, if one is
+    configured, and everything else to the primary.
+
+    Writes always go to the primary, including flushes and DML issued from
+    a GET view. Outside of requests (CLI commands, background jobs) the
+    primary is used. A session created with a `bind` uses only that.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.bind is not None:
+            return self.bind
+        if (
+            bind is None
+            and REPLICA in self._db.engines
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+            and has_request_context()
+            and request.method in READ_METHODS
+        ):
+            return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def engine_options(config, uri):
+    """Returns the engine options for `uri`. PostgreSQL gets a timed,
+    pre-pinged pool sized per environment and a server-side statement
+    timeout; other engines keep their defaults.
+    """
+    if not uri.startswith("postgresql"):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "connect_args": {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        },
+    }
+
+
+def configure_engines(app):
+    """Fills in `SQLALCHEMY_ENGINE_OPTIONS` and the replica bind from the
+    `DB_*` settings. Must run before `db.init_app`.
+    """
+    config = app.config
+    config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        engine_options(config, config["SQLALCHEMY_DATABASE_URI"]),
+    )
+    replica = config.get("SQLALCHEMY_REPLICA_URI")
+    if replica:
+        binds = config.setdefault("SQLALCHEMY_BINDS", {})
+        binds.setdefault(REPLICA, {"url": replica, **engine_options(config, replica)})
+
+
+def pool_stats(engines):
+    """Returns the size, usage and wait times of each engine's pool."""
+    stats = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        entry = {"status": pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        if isinstance(pool, _TimedPool):
+            entry["wait"] = pool.wait_stats.as_dict()
+        stats[name] = entry
+    return stats
+
+
+def without_statement_timeout(conn):
+    """Lifts the statement timeout for the current transaction, for
+    maintenance commands that are expected to run long.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def count_queries(budget=None):
+    """Records the SQL statements run by any engine, sync or async, inside
+    the block. Raises `QueryBudgetExceeded` on exit if there were more than
+    `budget`, which makes it a guard against N+1 queries in tests::
+
+        with count_queries(budget=4):
+            client.get(f"/events/{id}")
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    if budget is not None and len(statements) > budget:
+        raise QueryBudgetExceeded(
+            f"{len(statements)} queries, budget is {budget}:\n" + "\n".join(statements)
+        )
@@ -1,3 +1,4 @@
+from flask_caching import Cache
 from flask_jwt_extended import JWTManager
 from flask_login import LoginManager
 from flask_migrate import Migrate
@@ -5,7 +6,10 @@ from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 
-db = SQLAlchemy()
+from event_horizon.engines import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+cache = Cache()
 csrf = CSRFProtect()
 migrate = Migrate()
 session = Session()
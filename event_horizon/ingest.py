@@ -0,0 +1,218 @@
+import csv
+import json
+import math
+import re
+from itertools import islice
+
+from blinker import Namespace
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from event_horizon.api.event.schemas import EventDataRequestDTO
+from event_horizon.extensions import db
+from event_horizon.models import EventData
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+CSV_MIMETYPE = "text/csv"
+
+# A JSON number: no leading zeros, signs other than "-", or special values.
+_NUMBER = re.compile(
+    r"-?(?:0|[1-9][0-9]*)(?P<fraction>\.[0-9]+)?(?P<exponent>[eE][+-]?[0-9]+)?"
+)
+
+_signals = Namespace()
+
+#: Sent once event data is written, with `event_id` and the stored `rows`
+#: (dicts with `event_id`, `data` and `timestamp`). Receivers write in the
+#: sender's transaction and leave the commit to it, so the data and what is
+#: derived from it are stored together.
+data_ingested = _signals.signal("data-ingested")
+
+
+class IngestResult:
+    """Summary of an ingestion run.
+
+    Every rejected record is counted, but only the first `max_errors`
+    error details are kept so that huge uploads stay bounded in memory.
+    """
+
+    def __init__(self, max_errors=100):
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def reject(self, index, messages):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"index": index, "messages": messages})
+
+    def as_dict(self):
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+def chunked(iterable, size):
+    """Yields lists of at most `size` items from `iterable`."""
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+class LineTooLong(ValueError):
+    pass
+
+
+def iter_lines(stream, chunk_size=64 * 1024, encoding="utf-8", max_line=1024 * 1024):
+    """Yields decoded lines from a binary stream without reading it all.
+
+    Only one chunk plus the current partial line is held in memory at a time.
+    Line endings are kept so that quoted CSV fields spanning lines still parse.
+    Raises LineTooLong once a line grows past `max_line` bytes.
+    """
+    pending = b""
+    while chunk := stream.read(chunk_size):
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if len(line) > max_line:
+                raise LineTooLong(f"lines may be at most {max_line} bytes")
+            yield (line + b"\n").decode(encoding, errors="replace")
+        if len(pending) > max_line:
+            raise LineTooLong(f"lines may be at most {max_line} bytes")
+    if pending:
+        yield pending.decode(encoding, errors="replace")
+
+
+def parse_csv(lines):
+    """Yields one record per CSV row.
+
+    The `timestamp` column becomes the record timestamp and every other
+    column is stored in `data`, with values written as finite JSON numbers
+    converted to numbers. Anything else, such as "007" or "nan", stays a
+    string.
+    """
+    for row in csv.DictReader(lines):
+        row.pop(None, None)
+        timestamp = row.pop("timestamp", None)
+        yield {
+            "timestamp": timestamp,
+            "data": {key: _coerce(value) for key, value in row.items()},
+        }
+
+
+def _coerce(value):
+    match = _NUMBER.fullmatch(value or "")
+    if match is None:
+        return value
+    if match["fraction"] is None and match["exponent"] is None:
+        return int(value)
+    number = float(value)
+    return number if math.isfinite(number) else value
+
+
+def parse_ndjson(lines):
+    """Yields one decoded record per non-blank line.
+
+    Lines that are not valid JSON, including the NaN and Infinity that
+    Python accepts, are yielded as a ValidationError so the caller can
+    reject them without aborting the whole upload.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line, parse_constant=_reject_constant)
+        except ValueError:
+            yield ValidationError({"_schema": ["Invalid JSON."]})
+
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def ingest_records(event_id, records, chunk_size=1000, max_errors=100):
+    """Validates and stores `records` for `event_id` in chunks.
+
+    Each chunk is written with a single multi-row INSERT inside its own
+    savepoint and committed on success. If the chunk fails, its rows are
+    retried one by one so that only the offending rows are rejected.
+    """
+    schema = EventDataRequestDTO()
+    result = IngestResult(max_errors=max_errors)
+
+    for chunk in chunked(enumerate(records), chunk_size):
+        indices, rows = [], []
+        for index, raw in chunk:
+            try:
+                if isinstance(raw, ValidationError):
+                    raise raw
+                row = schema.load(raw)
+            except ValidationError as e:
+                result.reject(index, e.messages)
+                continue
+            indices.append(index)
+            rows.append({**row, "event_id": event_id})
+
+        if rows:
+            _write_chunk(indices, rows, result)
+
+    return result
+
+
+def notify_ingested(event_id, rows):
+    data_ingested.send(
+        current_app._get_current_object(),  # type: ignore
+        event_id=event_id,
+        rows=rows,
+    )
+
+
+def insert_rows(rows, reject, returning=False):
+    """Inserts `rows` into `event_data` and returns the rows written, leaving
+    the commit to the caller. With `returning`, the rows are returned as
+    stored, ids included.
+
+    The rows go in one multi-row INSERT inside a savepoint. If it fails, they
+    are retried one by one and `reject(position, message)` is called for each
+    row that still fails. Losing the connection is raised rather than
+    blamed on the rows.
+    """
+    stmt = db.insert(EventData)
+    if returning:
+        stmt = stmt.returning(*EventData.__table__.c, sort_by_parameter_order=True)
+
+    def execute(rows):
+        with db.session.begin_nested():
+            result = db.session.execute(stmt, rows)
+        return [dict(row) for row in result.mappings()] if returning else rows
+
+    db.session.connection()
+    try:
+        return execute(rows)
+    except SQLAlchemyError as e:
+        if getattr(e, "connection_invalidated", False):
+            raise
+
+    written = []
+    for position, row in enumerate(rows):
+        try:
+            written.extend(execute([row]))
+        except SQLAlchemyError as e:
+            if getattr(e, "connection_invalidated", False):
+                raise
+            reject(position, str(getattr(e, "orig", e)))
+    return written
+
+
+def _write_chunk(indices, rows, result):
+    written = insert_rows(
+        rows, lambda i, message: result.reject(indices[i], {"_schema": [message]})
+    )
+    if written:
+        notify_ingested(rows[0]["event_id"], written)
+    db.session.commit()
+    result.accepted += len(written)
@@ -0,0 +1,92 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_worker_app = None
+
+
+def _init_worker(env, db_uri):
+    global _worker_app
+    from event_horizon.app import create_app
+
+    _worker_app = create_app(env, db_uri)
+
+
+def _run_in_worker(fn, args):
+    with _worker_app.app_context():  # type: ignore
+        return fn(*args)
+
+
+def _run_with_app(app, fn, args):
+    with app.app_context():
+        return fn(*args)
+
+
+class JobQueue:
+    """Runs background jobs off the request thread.
+
+    The backend is picked by `JOB_QUEUE`: "process" runs jobs in a local
+    process pool whose workers each build their own app, "thread" uses a
+    thread pool sharing this app, and "sync" runs jobs inline (for tests).
+    Views only call `submit` with a module-level function and picklable
+    arguments, so a broker-backed queue can replace this class later.
+
+    Pools are created on the first `submit`, so processes that never queue
+    a job, such as CLI commands, start no workers.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = "sync"
+        self.workers = 1
+        self.executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config["JOB_QUEUE"]
+        self.workers = app.config["JOB_WORKERS"]
+        self.executor = None
+        app.extensions["job_queue"] = self
+
+    def submit(self, fn, *args):
+        if self.mode not in ("process", "thread"):
+            return fn(*args)
+
+        executor = self._executor()
+        if self.mode == "process":
+            future = executor.submit(_run_in_worker, fn, args)
+        else:
+            future = executor.submit(_run_with_app, self.app, fn, args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _executor(self):
+        with self._lock:
+            if self.executor is not None:
+                return self.executor
+            if self.mode == "process":
+                self.executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(
+                        self.app.config["FLASK_ENV"],  # type: ignore
+                        self.app.config["SQLALCHEMY_DATABASE_URI"],  # type: ignore
+                    ),
+                )
+            else:
+                self.executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="job"
+                )
+            return self.executor
+
+    def _log_failure(self, future):
+        error = future.exception()
+        if error is not None and self.app is not None:
+            self.app.logger.error("background job failed", exc_info=error)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,233 @@
+import json
+import re
+
+from sqlalchemy import text, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+
+from event_horizon import partitions
+from event_horizon.alerting import COMPARISONS, ConditionError
+from event_horizon.engines import without_statement_timeout
+from event_horizon.extensions import db
+from event_horizon.models import EventData
+
+#: Ops accepted by `?where=`, the same as in alert conditions.
+OPS = (*COMPARISONS, "in", "contains", "exists")
+
+_KEY_RE = re.compile(r"^\w+$")
+
+
+def parse_where(spec):
+    """Parses a `field:op:value` filter such as `data.region:eq:us-east`
+    into an alert-style condition.
+
+    Values are read as JSON when possible, so `data.latency:gt:500` compares
+    numbers and `data.code:eq:"500"` a string. `in` takes a comma separated
+    list and `exists` no value.
+    """
+    field, _, rest = spec.partition(":")
+    op, _, raw = rest.partition(":")
+    if op not in OPS:
+        raise ConditionError(f"unsupported op {op!r}")
+    if op == "exists":
+        return {"field": field, "op": op}
+    if not raw:
+        raise ConditionError(f"missing value for {field!r}")
+    if op == "in":
+        return {
+            "field": field,
+            "op": op,
+            "value": [_literal(v) for v in raw.split(",")],
+        }
+    return {"field": field, "op": op, "value": _literal(raw)}
+
+
+def _literal(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def to_sql(column, condition):
+    """Compiles an alert-style condition on `data.*` fields into a predicate
+    on the JSONB `column` with the same semantics as `compile_condition`.
+
+    Equality becomes containment (`@>`), which the GIN index on
+    `event_data.data` serves, and numeric range comparisons compare the
+    JSONB value at the path, which a `create_key_index` expression index
+    serves. String ranges compare the text in the "C" collation, i.e. by
+    code point like Python, since JSONB would order strings by the
+    database's collation; the expression index does not serve them.
+    """
+    if not isinstance(condition, dict):
+        raise ConditionError("condition must be an object")
+    column = type_coerce(column, JSONB)
+
+    if "all" in condition or "any" in condition:
+        combine = db.and_ if "all" in condition else db.or_
+        parts = condition.get("all", condition.get("any"))
+        if not isinstance(parts, list) or not parts:
+            raise ConditionError("all/any must be a non-empty list")
+        return combine(*(to_sql(column, part) for part in parts))
+
+    if "not" in condition:
+        # Missing fields make comparisons NULL, which NOT would keep NULL.
+        return db.not_(db.func.coalesce(to_sql(column, condition["not"]), False))
+
+    path = _path(condition.get("field"))
+    op, value = condition.get("op"), condition.get("value")
+    target = column[path]
+    exists = db.func.jsonb_typeof(target) != "null"
+
+    if op == "exists":
+        return exists
+    if op == "eq":
+        return _equals(column, path, value)
+    if op == "ne":
+        return db.and_(exists, db.not_(_equals(column, path, value)))
+    if op == "in":
+        if not isinstance(value, list) or not value:
+            raise ConditionError("value for 'in' must be a non-empty list")
+        return db.or_(*(_equals(column, path, v) for v in value))
+    if op == "contains":
+        matches = [column.contains(_nest(path, [value]))]
+        if isinstance(value, str):
+            matches.append(target.has_key(value))
+            matches.append(
+                db.and_(
+                    db.func.jsonb_typeof(target) == "string",
+                    column[path].astext.contains(value, autoescape=True),
+                )
+            )
+        return db.or_(*matches)
+    if op in COMPARISONS:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ConditionError(f"value for {op!r} must be a number or string")
+        if isinstance(value, str):
+            return db.and_(
+                db.func.jsonb_typeof(target) == "string",
+                COMPARISONS[op](column[path].astext.collate("C"), value),
+            )
+        return db.and_(
+            db.func.jsonb_typeof(target) == "number",
+            COMPARISONS[op](target, type_coerce(value, JSONB)),
+        )
+
+    raise ConditionError(f"unsupported op {op!r}")
+
+
+def _path(field):
+    if not isinstance(field, str) or not field.startswith("data."):
+        raise ConditionError("only data.* fields can be filtered")
+    return tuple(field.split(".")[1:])
+
+
+def _nest(path, value):
+    for key in reversed(path):
+        value = {key: value}
+    return value
+
+
+def _equals(column, path, value):
+    if value is None:
+        return db.false()
+    if isinstance(value, (dict, list)):
+        return column[path] == type_coerce(value, JSONB)
+    return column.contains(_nest(path, value))
+
+
+def migrate():
+    """Converts `event_data.data` and `alerts.condition` to JSONB and adds
+    the GIN index on `event_data.data`.
+
+    Changing the column type rewrites the table under an exclusive lock, so
+    run this during a maintenance window. Returns the columns converted.
+    """
+    converted = []
+    with db.engine.begin() as conn:
+        without_statement_timeout(conn)
+        for table, column in (("event_data", "data"), ("alerts", "condition")):
+            data_type = conn.scalar(
+                text(
+                    "SELECT data_type FROM information_schema.columns"
+                    " WHERE table_name = :table AND column_name = :column"
+                ),
+                {"table": table, "column": column},
+            )
+            if data_type == "json":
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table} ALTER COLUMN {column}"
+                        f" TYPE jsonb USING {column}::jsonb"
+                    )
+                )
+                converted.append(f"{table}.{column}")
+    create_index("ix_event_data_data", "data jsonb_path_ops", using="gin")
+    return converted
+
+
+def create_key_index(field):
+    """Adds a btree index on `(event_id, data #> path)` so range filters on
+    `field` are index scans. Returns the index name.
+    """
+    path = _path(field)
+    if not all(_KEY_RE.match(key) for key in path):
+        raise ConditionError("indexed keys may only contain letters, digits and _")
+    name = f"ix_event_data_data_{'_'.join(path)}"[:63]
+    create_index(name, f"event_id, (data #> '{{{','.join(path)}}}')")
+    return name
+
+
+def create_index(name, columns, using="btree"):
+    """Creates an index on `event_data` without blocking writes.
+
+    A partitioned table cannot be indexed concurrently, so the index is
+    created on the parent only, built concurrently on each partition and
+    then attached. Partitions created later inherit it.
+    """
+    table = EventData.__tablename__
+    with db.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        # CREATE INDEX CONCURRENTLY cannot run in a transaction, so the
+        # timeout is lifted for the session and restored afterwards.
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            _create_index(conn, table, name, columns, using)
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+
+
+def _create_index(conn, table, name, columns, using):
+    if not partitions.is_partitioned(conn):
+        conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}"
+                f" ON {table} USING {using} ({columns})"
+            )
+        )
+        return
+
+    conn.execute(
+        text(
+            f"CREATE INDEX IF NOT EXISTS {name}"
+            f" ON ONLY {table} USING {using} ({columns})"
+        )
+    )
+    for partition in partitions.children(conn):
+        child = f"{partition}_{name.removeprefix('ix_event_data_')}"[:63]
+        conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child}"
+                f" ON {partition} USING {using} ({columns})"
+            )
+        )
+        attached = conn.scalar(
+            text(
+                "SELECT 1 FROM pg_inherits"
+                " WHERE inhrelid = to_regclass(:child)"
+                " AND inhparent = to_regclass(:name)"
+            ),
+            {"child": child, "name": name},
+        )
+        if not attached:
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
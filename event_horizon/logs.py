@@ -0,0 +1,121 @@
+import copy
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+
+DROP_POLICIES = ("drop_new", "drop_oldest", "block")
+
+#: Attributes every `LogRecord` has, so anything else came from `extra`.
+_RESERVED = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the request id, user and route of the current request to
+    records, while still on the request's thread.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            try:
+                record.user = get_jwt_identity()
+            except RuntimeError:
+                record.user = None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records to a `QueueListener` through a bounded queue, so the
+    caller never waits on the handlers doing I/O.
+
+    When the queue is full, "drop_new" drops the record being logged,
+    "drop_oldest" drops the oldest queued one and "block" waits for room.
+    Dropped records are counted in `dropped`.
+    """
+
+    def __init__(self, maxsize, policy="drop_new"):
+        if policy not in DROP_POLICIES:
+            raise ValueError(
+                f"LOG_DROP_POLICY must be one of {', '.join(DROP_POLICIES)}"
+            )
+        super().__init__(queue.Queue(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def enqueue(self, record):
+        if self.policy == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                pass
+        with self._lock:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message and traceback here, since the arguments and the
+        # exception may change once the caller moves on, but leave the rest
+        # of the formatting to the listener's thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BoundedQueueListener(QueueListener):
+    """A `QueueListener` whose `stop()` waits for room in a full queue
+    instead of failing, so the records still queued at exit are written.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
@@ -0,0 +1,297 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from event_horizon.aio import adb
+from event_horizon.cache import response_cache
+from event_horizon.engines import WAIT_BUCKETS, _TimedPool
+from event_horizon.extensions import db
+from event_horizon.ingest import data_ingested
+from event_horizon.streams import stream_hub
+
+#: Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")
+)  # fmt: skip
+
+#: Upper bounds of the queries-per-request histogram buckets.
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, float("inf"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Queries run and seconds spent in the database by the current request.
+# Async views see it too, since they run in a copy of the request's context.
+_queries = ContextVar("queries", default=None)
+
+
+class Metric:
+    """A metric family whose samples are keyed by a tuple of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """Yields (name, labels, value) for every sample of the family."""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, key=(), amount=1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, key=(), amount=1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, key=(), amount=1):
+        self.inc(key, -amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, key=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def set(self, key, counts, total):
+        """Replaces a sample with per-bucket `counts` and their `total`, for
+        histograms recorded elsewhere.
+        """
+        with self._lock:
+            self._values[key] = [list(counts), total]
+
+    def samples(self):
+        for name, labels, (counts, total) in super().samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{name}_bucket", {**labels, "le": bound}, cumulative
+            yield f"{name}_sum", labels, total
+            yield f"{name}_count", labels, cumulative
+
+
+class Metrics:
+    """Request, database, cache and ingestion metrics of this process, in the
+    Prometheus text exposition format.
+
+    Recording is a dict update under a lock, so the hot path costs a few
+    microseconds per request. Values that other components already track,
+    such as pool waits and cache hits, are read when `render()` is called
+    by the collectors registered with `collector`.
+    """
+
+    def __init__(self, app=None):
+        self.families = []
+        self.collectors = []
+        self.requests = self.histogram(
+            "http_request_duration_seconds",
+            "Request latency.",
+            ("blueprint", "endpoint", "method", "status"),
+        )
+        self.in_flight = self.gauge(
+            "http_requests_in_flight", "Requests being served.", ("endpoint",)
+        )
+        self.request_queries = self.histogram(
+            "http_request_db_queries",
+            "Database queries run per request.",
+            ("endpoint",),
+            QUERY_BUCKETS,
+        )
+        self.request_db_seconds = self.histogram(
+            "http_request_db_seconds",
+            "Time spent in database queries per request.",
+            ("endpoint",),
+        )
+        self.ingested_rows = self.counter(
+            "ingest_rows_total", "Event data rows stored."
+        )
+        self.collector(self._collect)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config["METRICS_ENABLED"]:
+            return
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.after_request(self._after_request)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor):
+            event.listen(Engine, "before_cursor_execute", _before_cursor)
+            event.listen(Engine, "after_cursor_execute", _after_cursor)
+        data_ingested.connect(self._on_ingest)
+        app.extensions["metrics"] = self
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Registers `fn`, which returns metric families read at scrape time."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        families = list(self.families)
+        for collect in self.collectors:
+            families.extend(collect())
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for name, labels, value in family.samples():
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, family):
+        self.families.append(family)
+        return family
+
+    def _before_request(self):
+        queries = [0, 0.0]
+        _queries.set(queries)
+        g.metrics = (time.perf_counter(), queries, request.endpoint)
+        self.in_flight.inc((g.metrics[2],))
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        recorded = g.pop("metrics", None)
+        if recorded is None:
+            return
+        start, (queries, seconds), endpoint = recorded
+        elapsed = time.perf_counter() - start
+        _queries.set(None)
+        req = request._get_current_object()  # type: ignore
+
+        self.in_flight.dec((endpoint,))
+        self.requests.observe(
+            elapsed,
+            (req.blueprint, endpoint, req.method, g.pop("metrics_status", 500)),
+        )
+        self.request_queries.observe(queries, (endpoint,))
+        self.request_db_seconds.observe(seconds, (endpoint,))
+
+    def _on_ingest(self, sender, event_id, rows):
+        self.ingested_rows.inc(amount=len(rows))
+
+    def _collect(self):
+        engines = {key or "primary": engine for key, engine in db.engines.items()}
+        cache = Counter(
+            "response_cache_requests_total", "Cached view lookups.", ("result",)
+        )
+        cache.inc(("hit",), response_cache.hits)
+        cache.inc(("miss",), response_cache.misses)
+        streams = Gauge("stream_subscribers", "Live stream subscribers.")
+        streams.set((), sum(map(len, stream_hub.subscribers.values())))
+        families = [*pool_families({**engines, **adb.engines()}), cache, streams]
+
+        log_queue = current_app.extensions.get("log_queue")
+        if log_queue is not None:
+            depth = Gauge("log_queue_depth", "Log records waiting to be written.")
+            depth.set((), log_queue.depth)
+            dropped = Counter("log_records_dropped_total", "Log records dropped.")
+            dropped.inc(amount=log_queue.dropped)
+            families += [depth, dropped]
+        return families
+
+
+def pool_families(engines):
+    """Returns the usage and checkout wait histograms of `engines`' pools."""
+    checked_out = Gauge("db_pool_checked_out", "Connections checked out.", ("engine",))
+    wait = Histogram(
+        "db_pool_wait_seconds",
+        "Time connection checkouts waited on the pool.",
+        ("engine",),
+        WAIT_BUCKETS,
+    )
+    timeouts = Counter(
+        "db_pool_timeouts_total", "Checkouts that timed out.", ("engine",)
+    )
+    for name, engine in engines.items():
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            checked_out.set((name,), pool.checkedout())
+        if isinstance(pool, _TimedPool):
+            stats = pool.wait_stats.as_dict()
+            wait.set((name,), stats["buckets"].values(), stats["wait_seconds_total"])
+            timeouts.inc((name,), stats["timeouts"])
+    return [checked_out, wait, timeouts]
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if _queries.get() is not None:
+        conn.info["metrics_start"] = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    queries = _queries.get()
+    start = conn.info.pop("metrics_start", None)
+    if queries is not None and start is not None:
+        queries[0] += 1
+        queries[1] += time.perf_counter() - start
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+def _escape(value):
+    if isinstance(value, float):
+        return _number(value)
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+metrics = Metrics()
@@ -1,11 +1,46 @@
-from sqlalchemy import Text, TypeDecorator
-from sqlalchemy import text as sa_text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import PrimaryKeyConstraint, Text, TypeDecorator
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import validates
+from sqlalchemy.sql.functions import FunctionElement
 
 from event_horizon.extensions import db
 from event_horizon.utils import PasswordHash
 
+#: JSON stored as JSONB on PostgreSQL, so it can be indexed and queried.
+JSONType = db.JSON().with_variant(JSONB(), "postgresql")
+
+
+class new_uuid(FunctionElement):
+    """A random UUID generated by the database, for server defaults."""
+
+    type = UUID(as_uuid=True)
+    inherit_cache = True
+
+
+@compiles(new_uuid)
+def _new_uuid(element, compiler, **kw):
+    return "uuid_generate_v4()"
+
+
+@compiles(new_uuid, "sqlite")
+def _new_uuid_sqlite(element, compiler, **kw):
+    return "lower(hex(randomblob(16)))"
+
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def _primary_key(constraint, compiler, **kw):
+    # A partitioned table's primary key must include its partition key, so
+    # it is added here rather than in the model, where other engines would
+    # get a composite key they cannot autoincrement.
+    ddl = compiler.visit_primary_key_constraint(constraint, **kw)
+    key = constraint.table.info.get("partition_key")
+    if not key or not ddl:
+        return ddl
+    columns = [*constraint.columns, *(constraint.table.c[name] for name in key)]
+    quoted = ", ".join(compiler.preparer.format_column(c) for c in columns)
+    return ddl[: ddl.index("PRIMARY KEY")] + f"PRIMARY KEY ({quoted})"
+
 
 class Password(TypeDecorator):
     """Allows storing and retrieving password hashes using PasswordHash."""
@@ -26,6 +61,8 @@ class Password(TypeDecorator):
 
     def validator(self, password):
         """Provides a validator/converter for @validates usage."""
+        if isinstance(password, PasswordHash):
+            return password
         if len(password) < 8 or len(password) > 24:
             raise ValueError("Password must be between 8 and 24 characters.")
         elif not any(char.isdigit() for char in password):
@@ -58,9 +95,7 @@ class BaseModel(db.Model):
     __abstract__ = True
 
     id = db.Column(db.Integer, primary_key=True)
-    resource_id = db.Column(
-        UUID(as_uuid=True), unique=True, server_default=sa_text("uuid_generate_v4()")
-    )
+    resource_id = db.Column(UUID(as_uuid=True), unique=True, server_default=new_uuid())
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(
         db.DateTime, server_default=db.func.now(), onupdate=db.func.now()
@@ -90,6 +125,7 @@ class TokenBlocklist(BaseModel):
 
 class User(BaseModel):
     __tablename__ = "users"
+    __table_args__ = (db.Index("ix_users_created_at_id", "created_at", "id"),)
 
     fname = db.Column(db.String(80), nullable=True)
     lname = db.Column(db.String(80), nullable=True)
@@ -113,35 +149,66 @@ class User(BaseModel):
 
 class Event(BaseModel):
     __tablename__ = "events"
+    __table_args__ = (db.Index("ix_events_created_at_id", "created_at", "id"),)
 
     name = db.Column(db.String(80), nullable=False)
     description = db.Column(db.Text, nullable=False)
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    author = db.relationship("User", backref=db.backref("events", lazy=True))
-
-    def __init__(self, name, description, start_date, end_date, author_id):
+    # Backref collections, here and in the models below, are never lazy
+    # loaded: views load what they need with `selectinload`, so an N+1
+    # raises instead of quietly issuing a query per row.
+    author = db.relationship("User", backref=db.backref("events", lazy="raise_on_sql"))
+    retention = db.Column(db.JSON, nullable=True)
+
+    def __init__(
+        self, name, description, start_date, end_date, author_id, retention=None
+    ):
         self.name = name
         self.description = description
         self.start_date = start_date
         self.end_date = end_date
         self.author_id = author_id
+        self.retention = retention
 
     def __repr__(self):
         return f"<Event {self.name}>"
 
 
 class EventData(BaseModel):
+    """A data point of an event.
+
+    On PostgreSQL the table is range partitioned by month on `timestamp`
+    (see `event_horizon.partitions`), which is why `timestamp` is added to
+    the primary key there and `resource_id` is indexed rather than unique.
+    Other engines keep a regular table keyed by `id`.
+    """
+
     __tablename__ = "event_data"
+    __table_args__ = (
+        db.Index("ix_event_data_event_id_timestamp_id", "event_id", "timestamp", "id"),
+        db.Index(
+            "ix_event_data_data",
+            "data",
+            postgresql_using="gin",
+            postgresql_ops={"data": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        {
+            "postgresql_partition_by": "RANGE (timestamp)",
+            "info": {"partition_key": ("timestamp",)},
+        },
+    )
 
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    resource_id = db.Column(UUID(as_uuid=True), index=True, server_default=new_uuid())
     event_id = db.Column(
         db.Integer, db.ForeignKey("events.id", ondelete="CASCADE"), nullable=False
     )
     event = db.relationship(
-        "Event", backref=db.backref("data", lazy=True, passive_deletes=True)
+        "Event", backref=db.backref("data", lazy="raise_on_sql", passive_deletes=True)
     )
-    data = db.Column(db.JSON, nullable=False)
+    data = db.Column(JSONType, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False)
 
     def __init__(self, event_id, data, timestamp):
@@ -153,14 +220,40 @@ class EventData(BaseModel):
         return f"<EventData {self.id}>"
 
 
+class EventRollup(db.Model):
+    """Per-bucket aggregates of one numeric field of an event's data.
+
+    The `*` field holds the number of records in the bucket.
+    """
+
+    __tablename__ = "event_rollups"
+
+    event_id = db.Column(
+        db.Integer,
+        db.ForeignKey("events.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    granularity = db.Column(db.String(8), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    field = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    sum = db.Column(db.Float, nullable=False, default=0)
+    min = db.Column(db.Float, nullable=True)
+    max = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f"<EventRollup {self.event_id} {self.granularity} {self.bucket}>"
+
+
 class Alert(BaseModel):
     __tablename__ = "alerts"
+    __table_args__ = (db.Index("ix_alerts_created_at_id", "created_at", "id"),)
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    user = db.relationship("User", backref=db.backref("alerts", lazy=True))
+    user = db.relationship("User", backref=db.backref("alerts", lazy="raise_on_sql"))
     event_id = db.Column(db.Integer, db.ForeignKey("events.id"), nullable=False)
-    event = db.relationship("Event", backref=db.backref("alerts", lazy=True))
-    condition = db.Column(db.JSON, nullable=False)
+    event = db.relationship("Event", backref=db.backref("alerts", lazy="raise_on_sql"))
+    condition = db.Column(JSONType, nullable=False)
 
     def __init__(self, user_id, event_id, condition):
         self.user_id = user_id
@@ -173,13 +266,23 @@ class Alert(BaseModel):
 
 class Report(BaseModel):
     __tablename__ = "reports"
+    __table_args__ = (db.Index("ix_reports_created_at_id", "created_at", "id"),)
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    user = db.relationship("User", backref=db.backref("reports", lazy=True))
+    user = db.relationship("User", backref=db.backref("reports", lazy="raise_on_sql"))
     event_id = db.Column(db.Integer, db.ForeignKey("events.id"), nullable=False)
-    event = db.relationship("Event", backref=db.backref("report_data", lazy=True))
+    event = db.relationship(
+        "Event", backref=db.backref("report_data", lazy="raise_on_sql")
+    )
     filters = db.Column(db.JSON, nullable=False)
     format = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    file_path = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    # Bumped whenever the report is regenerated, so a job can tell whether
+    # it is still the current one.
+    generation = db.Column(db.Integer, nullable=False, default=0)
 
     def __init__(self, user_id, event_id, filters, format):
         self.user_id = user_id
@@ -195,9 +298,13 @@ class Notification(BaseModel):
     __tablename__ = "notifications"
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    user = db.relationship("User", backref=db.backref("notifications", lazy=True))
+    user = db.relationship(
+        "User", backref=db.backref("notifications", lazy="raise_on_sql")
+    )
     event_id = db.Column(db.Integer, db.ForeignKey("events.id"), nullable=False)
-    event = db.relationship("Event", backref=db.backref("notif_data", lazy=True))
+    event = db.relationship(
+        "Event", backref=db.backref("notif_data", lazy="raise_on_sql")
+    )
     message = db.Column(db.String(255), nullable=False)
     read_status = db.Column(db.Boolean, nullable=False, default=False)
 
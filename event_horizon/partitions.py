@@ -0,0 +1,182 @@
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from event_horizon.engines import without_statement_timeout
+from event_horizon.extensions import db
+from event_horizon.models import EventData
+
+TABLE = EventData.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_PARTITION_RE = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def is_supported():
+    """`event_data` is only partitioned on PostgreSQL; other engines keep it
+    as a regular table.
+    """
+    return db.engine.dialect.name == "postgresql"
+
+
+def is_partitioned(conn):
+    return bool(
+        conn.scalar(
+            text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": TABLE},
+        )
+    )
+
+
+def children(conn):
+    """Returns the names of all partitions, including the default one."""
+    return conn.scalars(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = to_regclass(:name)"
+        ),
+        {"name": TABLE},
+    ).all()
+
+
+def partitions(conn):
+    """Returns the months that have their own partition, oldest first."""
+    months = []
+    for name in children(conn):
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(conn, month):
+    """Creates the partition for `month` unless it exists.
+
+    The partition is built as a plain table, filled with any rows of that
+    month that landed in the default partition, and then attached, so it
+    can be created after the fact without rejecting existing data.
+    """
+    name = partition_name(month)
+    if conn.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None:
+        return False
+    without_statement_timeout(conn)
+
+    start, end = month.isoformat(sep=" "), add_months(month, 1).isoformat(sep=" ")
+    conn.execute(
+        text(
+            f"CREATE TABLE {name}"
+            f" (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}"
+            ' WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *)'
+            f" INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name}"
+            f" FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+    )
+    return True
+
+
+def drop_partition(conn, month, lock_timeout):
+    """Detaches and drops the partition for `month`. Gives up after
+    `lock_timeout` rather than queueing writes behind its lock.
+    """
+    name = partition_name(month)
+    conn.execute(
+        text("SELECT set_config('lock_timeout', :timeout, true)"),
+        {"timeout": lock_timeout},
+    )
+    conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+
+
+def ensure_partitions(months_ahead, now=None):
+    """Creates the partitions for the current month and `months_ahead`
+    months after it, plus one for every month that has rows in the default
+    partition. Each partition is created in its own transaction.
+
+    Returns the names of the partitions created.
+    """
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION}"
+                f" PARTITION OF {TABLE} DEFAULT"
+            )
+        )
+        stray = conn.scalars(
+            text(
+                "SELECT DISTINCT date_trunc('month', \"timestamp\")"
+                f" FROM {DEFAULT_PARTITION}"
+            )
+        ).all()
+
+    current = month_start(now or datetime.now(timezone.utc))
+    months = {add_months(current, n) for n in range(months_ahead + 1)}
+    created = []
+    for month in sorted(months | set(stray)):
+        with db.engine.begin() as conn:
+            if create_partition(conn, month):
+                created.append(partition_name(month))
+    return created
+
+
+def convert():
+    """Moves an `event_data` table created before partitioning into the
+    partitioned layout, in one transaction.
+
+    Returns the number of rows copied.
+    """
+    legacy = f"{TABLE}_unpartitioned"
+    table = EventData.__table__
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    with db.engine.begin() as conn:
+        without_statement_timeout(conn)
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+        for index in table.indexes:
+            conn.execute(
+                text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_old")
+            )
+        table.create(conn)
+        conn.execute(
+            text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+        )
+        months = conn.scalars(
+            text(f"SELECT DISTINCT date_trunc('month', \"timestamp\") FROM {legacy}")
+        ).all()
+        for month in months:
+            create_partition(conn, month)
+
+        copied = conn.execute(
+            text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy}")
+        ).rowcount
+        conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'),"
+                f" coalesce(max(id), 0) + 1, false) FROM {TABLE}"
+            )
+        )
+        conn.execute(text(f"DROP TABLE {legacy}"))
+    return copied
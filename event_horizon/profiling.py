@@ -0,0 +1,154 @@
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#: Phases timed separately; the rest of the wall time is the view's own.
+PHASES = ("validation", "serialization", "sql")
+
+# The profile of the current request, when it is being profiled. Async views
+# see it too, since they run in a copy of the request's context.
+_profile = ContextVar("profile", default=None)
+
+
+class Profile:
+    """Where the wall time of one request went."""
+
+    def __init__(self, sampled, max_statements):
+        self.sampled = sampled
+        self.max_statements = max_statements
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+        self.statements = []
+        self.dropped_statements = 0
+
+    def record_statement(self, statement, seconds):
+        self.phases["sql"] += seconds
+        if len(self.statements) < self.max_statements:
+            self.statements.append({"sql": statement, "seconds": seconds})
+        else:
+            self.dropped_statements += 1
+
+
+@contextmanager
+def profiled(phase):
+    """Adds the time spent in the block to `phase` of the current request's
+    profile, if it has one. Nested blocks of the same phase count once.
+    """
+    profile = _profile.get()
+    if profile is None or phase in profile.active:
+        yield
+        return
+    profile.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[phase] += time.perf_counter() - start
+        profile.active.discard(phase)
+
+
+class Profiler:
+    """Profiles a sample of requests plus every slow one.
+
+    A `PROFILE_SAMPLE_RATE` fraction of requests is profiled at random, and
+    with `PROFILE_SLOW_MS` set, every request is timed and kept if it took
+    at least that long. A profile splits the wall time into marshmallow
+    validation, serialization, SQL and the view's own code, and lists the
+    SQL statements with their timings, without parameters. The latest
+    `PROFILE_BUFFER_SIZE` profiles are kept in a ring buffer.
+
+    Both settings default to off, so unprofiled apps pay nothing.
+    """
+
+    def __init__(self, app=None):
+        self.rate = 0.0
+        self.slow = 0.0
+        self.max_statements = 100
+        self.profiles = deque(maxlen=100)
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        return self.rate > 0 or self.slow > 0
+
+    def init_app(self, app):
+        self.rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.slow = app.config["PROFILE_SLOW_MS"] / 1000
+        self.max_statements = app.config["PROFILE_MAX_STATEMENTS"]
+        self.profiles = deque(maxlen=app.config["PROFILE_BUFFER_SIZE"])
+        app.extensions["profiler"] = self
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor):
+            event.listen(Engine, "before_cursor_execute", _before_cursor)
+            event.listen(Engine, "after_cursor_execute", _after_cursor)
+
+    def recent(self, endpoint=None):
+        """Returns the kept profiles, newest first."""
+        return [
+            profile
+            for profile in reversed(self.profiles)
+            if endpoint is None or profile["endpoint"] == endpoint
+        ]
+
+    def _before_request(self):
+        sampled = random.random() < self.rate
+        if sampled or self.slow:
+            _profile.set(Profile(sampled, self.max_statements))
+
+    def _after_request(self, response):
+        g.profile_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        profile = _profile.get()
+        if profile is None:
+            return
+        _profile.set(None)
+        wall = time.perf_counter() - profile.start
+        if not profile.sampled and wall < self.slow:
+            return
+
+        phases = {"wall": wall, **profile.phases}
+        phases["view"] = max(0.0, wall - sum(profile.phases.values()))
+        self.profiles.append(
+            {
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "status": g.get("profile_status", 500),
+                "started_at": profile.started_at.isoformat(),
+                "reason": "sampled" if profile.sampled else "slow",
+                "seconds": phases,
+                "statements": profile.statements,
+                "dropped_statements": profile.dropped_statements,
+            }
+        )
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if _profile.get() is not None:
+        conn.info["profile_start"] = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    start = conn.info.pop("profile_start", None)
+    if profile is not None and start is not None:
+        profile.record_statement(statement, time.perf_counter() - start)
+
+
+profiler = Profiler()
@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from flask import current_app
+from marshmallow import ValidationError
+
+from event_horizon.alerting import ConditionError, compile_condition
+from event_horizon.extensions import db
+from event_horizon.jsonb import to_sql
+from event_horizon.models import EventData, Report
+
+FORMATS = ("csv", "json")
+FILTER_KEYS = ("from", "to", "condition")
+
+
+def validate_filters(filters):
+    """Marshmallow validator for `Report.filters` payloads.
+
+    Supported keys are `from` and `to` (ISO timestamps bounding the event
+    data) and `condition`, which uses the alert condition syntax.
+    """
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValidationError(f"unknown filters: {', '.join(sorted(unknown))}")
+    for key in ("from", "to"):
+        if key in filters:
+            try:
+                datetime.fromisoformat(filters[key])
+            except (TypeError, ValueError):
+                raise ValidationError(f"{key} must be an ISO timestamp")
+    if "condition" in filters:
+        try:
+            compile_condition(filters["condition"])
+        except ConditionError as e:
+            raise ValidationError(str(e))
+
+
+def report_path(report):
+    return os.path.join(
+        current_app.config["REPORT_DIR"], f"{report.resource_id}.{report.format}"
+    )
+
+
+def generate_report(report_id, generation=None):
+    """Exports the event data matched by a report to disk.
+
+    Rows are read through a server-side cursor and written as they arrive,
+    so memory use does not grow with the size of the report. Status and
+    the number of rows written so far are written on a separate connection
+    so they are visible while the export is still running. A failed export
+    leaves no partial file behind.
+
+    Each job writes to a temporary file of its own and only touches the
+    report while `generation` (by default the report's current one) is
+    current, so a job superseded by a regeneration never publishes its
+    file or status.
+    """
+    report = db.session.get(Report, report_id)
+    if report is None:
+        return
+    if generation is None:
+        generation = report.generation
+
+    if not _update(report_id, generation, status="running", rows_written=0, error=None):
+        return
+    path = report_path(report)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = None
+    try:
+        fd, part = tempfile.mkstemp(
+            prefix=f".{os.path.basename(path)}.",
+            suffix=".part",
+            dir=os.path.dirname(path),
+        )
+        with open(fd, "w", newline="") as out:
+            writer = _write_csv if report.format == "csv" else _write_json
+            written = writer(out, report_id, generation, _rows(report))
+        _update(
+            report_id,
+            generation,
+            then=lambda: os.replace(part, path),
+            status="done",
+            rows_written=written,
+            file_path=path,
+        )
+    except Exception as e:
+        _update(report_id, generation, status="failed", error=str(e)[:255])
+        raise
+    finally:
+        if part is not None and os.path.exists(part):
+            os.remove(part)
+
+
+def _rows(report):
+    stmt = db.select(EventData.id, EventData.timestamp, EventData.data).where(
+        EventData.event_id == report.event_id
+    )
+    filters = report.filters or {}
+    if "from" in filters:
+        stmt = stmt.where(
+            EventData.timestamp >= datetime.fromisoformat(filters["from"])
+        )
+    if "to" in filters:
+        stmt = stmt.where(EventData.timestamp < datetime.fromisoformat(filters["to"]))
+    predicate = None
+    if "condition" in filters:
+        predicate = compile_condition(filters["condition"])
+        if db.engine.dialect.name == "postgresql":
+            # Narrow the scan in SQL where the condition allows it; the
+            # predicate is still checked on every row.
+            try:
+                stmt = stmt.where(to_sql(EventData.data, filters["condition"]))
+            except ConditionError:
+                pass
+
+    stmt = stmt.order_by(EventData.timestamp, EventData.id).execution_options(
+        stream_results=True, yield_per=current_app.config["REPORT_BATCH_SIZE"]
+    )
+    for id, timestamp, data in db.session.execute(stmt):
+        if predicate is None or predicate({"data": data, "timestamp": timestamp}):
+            yield id, timestamp, data
+
+
+def _write_csv(out, report_id, generation, rows):
+    writer = csv.writer(out)
+    writer.writerow(["id", "timestamp", "data"])
+    written = 0
+    for id, timestamp, data in rows:
+        writer.writerow([id, timestamp.isoformat(), json.dumps(data)])
+        written = _tick(report_id, generation, written)
+    return written
+
+
+def _write_json(out, report_id, generation, rows):
+    out.write("[")
+    written = 0
+    for id, timestamp, data in rows:
+        if written:
+            out.write(",\n")
+        json.dump({"id": id, "timestamp": timestamp.isoformat(), "data": data}, out)
+        written = _tick(report_id, generation, written)
+    out.write("]\n")
+    return written
+
+
+def _tick(report_id, generation, written):
+    written += 1
+    if written % current_app.config["REPORT_PROGRESS_INTERVAL"] == 0:
+        _update(report_id, generation, rows_written=written)
+    return written
+
+
+def _update(report_id, generation, then=None, **values):
+    """Updates the report if `generation` is still current and returns
+    whether it was. `then` is called before the update commits, while the
+    report row is still locked.
+    """
+    with db.engine.begin() as conn:
+        current = conn.execute(
+            db.update(Report)
+            .where(Report.id == report_id, Report.generation == generation)
+            .values(**values)
+        ).rowcount
+        if current and then is not None:
+            then()
+    return current
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy.exc import OperationalError
+
+from event_horizon import partitions
+from event_horizon.extensions import db
+from event_horizon.models import Event, EventData, EventRollup
+from event_horizon.windows import parse_window
+
+#: What a policy can expire: raw event data and each rollup granularity.
+LEVELS = ("raw", "minute", "hour", "day")
+
+
+def validate_retention(policy):
+    """Marshmallow validator for `Event.retention` payloads such as
+    `{"raw": "30d", "minute": "365d"}`. Levels that are missing fall back to
+    `RETENTION_POLICY`; null keeps the level forever.
+    """
+    unknown = set(policy) - set(LEVELS)
+    if unknown:
+        raise ValidationError(f"unknown retention levels: {', '.join(sorted(unknown))}")
+    for level, spec in policy.items():
+        if spec is not None:
+            try:
+                parse_window(spec)
+            except ValueError as e:
+                raise ValidationError(f"{level}: {e}")
+
+
+def cutoffs(retention, defaults, now):
+    """Returns, for each level, the time before which data is expired, or
+    None if it is kept forever.
+    """
+    policy = {**defaults, **(retention or {})}
+    return {
+        level: None
+        if policy.get(level) is None
+        else now - timedelta(seconds=parse_window(policy[level]))
+        for level in LEVELS
+    }
+
+
+def enforce(now=None):
+    """Removes the event data and rollups that are past their event's
+    retention policy.
+
+    Months of raw data that every event has expired are dropped as whole
+    partitions. Everything else is deleted in batches of
+    `RETENTION_BATCH_SIZE` rows, each in its own short transaction, so
+    retention never holds locks that ingest would wait on.
+
+    Returns the number of partitions dropped and rows deleted per level.
+    """
+    config = current_app.config
+    # Timestamps are stored as naive UTC.
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    batch_size = config["RETENTION_BATCH_SIZE"]
+    policies = {
+        id: cutoffs(retention, config["RETENTION_POLICY"], now)
+        for id, retention in db.session.execute(db.select(Event.id, Event.retention))
+    }
+    db.session.commit()
+
+    removed = {"partitions": 0, **dict.fromkeys(LEVELS, 0)}
+    raw_cutoffs = [policy["raw"] for policy in policies.values()]
+    if raw_cutoffs and None not in raw_cutoffs and partitions.is_supported():
+        removed["partitions"] = _drop_partitions(
+            min(raw_cutoffs), config["RETENTION_LOCK_TIMEOUT"]
+        )
+
+    for event_id, policy in policies.items():
+        if policy["raw"] is not None:
+            removed["raw"] += _delete_batches(
+                EventData,
+                (EventData.id, EventData.timestamp),
+                (EventData.event_id == event_id, EventData.timestamp < policy["raw"]),
+                batch_size,
+            )
+        for granularity in LEVELS[1:]:
+            if policy[granularity] is not None:
+                removed[granularity] += _delete_batches(
+                    EventRollup,
+                    (
+                        EventRollup.event_id,
+                        EventRollup.granularity,
+                        EventRollup.bucket,
+                        EventRollup.field,
+                    ),
+                    (
+                        EventRollup.event_id == event_id,
+                        EventRollup.granularity == granularity,
+                        EventRollup.bucket < policy[granularity],
+                    ),
+                    batch_size,
+                )
+    return removed
+
+
+def _drop_partitions(cutoff, lock_timeout):
+    with db.engine.connect() as conn:
+        if not partitions.is_partitioned(conn):
+            return 0
+        months = partitions.partitions(conn)
+
+    dropped = 0
+    for month in months:
+        if partitions.add_months(month, 1) > cutoff:
+            break
+        try:
+            with db.engine.begin() as conn:
+                partitions.drop_partition(conn, month, lock_timeout)
+        except OperationalError:
+            current_app.logger.warning(
+                "could not lock %s, leaving it to batched deletes",
+                partitions.partition_name(month),
+            )
+            break
+        dropped += 1
+    return dropped
+
+
+def _delete_batches(model, key, where, batch_size):
+    removed = 0
+    while True:
+        batch = db.select(*key).where(*where).limit(batch_size)
+        result = db.session.execute(
+            db.delete(model)
+            .where(*where, db.tuple_(*key).in_(batch))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        removed += result.rowcount
+        if result.rowcount < batch_size:
+            return removed
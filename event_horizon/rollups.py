@@ -0,0 +1,205 @@
+from datetime import datetime, time, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+
+from event_horizon.engines import without_statement_timeout
+from event_horizon.extensions import db
+from event_horizon.ingest import chunked, data_ingested
+from event_horizon.models import Event, EventData, EventRollup
+from event_horizon.retention import cutoffs
+from event_horizon.windows import is_number
+
+GRANULARITIES = ("minute", "hour", "day")
+
+#: Rollups are merged with INSERT .. ON CONFLICT, as these dialects write it.
+DIALECTS = ("postgresql", "sqlite")
+
+#: Rollup field used for the number of records, regardless of their payload.
+RECORDS = "*"
+
+_TRUNCATE = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def aggregate(event_id, records):
+    """Folds records into rollup rows keyed by (granularity, bucket, field).
+
+    Every record counts towards the `*` field, and each top-level numeric
+    value in `data` also contributes to the count, sum, min and max of its
+    own field.
+    """
+    buckets = {}
+    for record in records:
+        timestamp = record["timestamp"]
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        values = [(RECORDS, None)] + [
+            (field, value)
+            for field, value in (record.get("data") or {}).items()
+            if is_number(value)
+        ]
+        for granularity in GRANULARITIES:
+            bucket = _TRUNCATE[granularity](timestamp)
+            for field, value in values:
+                key = (granularity, bucket, field)
+                row = buckets.get(key)
+                if row is None:
+                    buckets[key] = row = {
+                        "event_id": event_id,
+                        "granularity": granularity,
+                        "bucket": bucket,
+                        "field": field,
+                        "count": 0,
+                        "sum": 0.0,
+                        "min": value,
+                        "max": value,
+                    }
+                row["count"] += 1
+                if value is not None:
+                    row["sum"] += value
+                    row["min"] = min(row["min"], value)
+                    row["max"] = max(row["max"], value)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def is_supported():
+    return db.engine.dialect.name in DIALECTS
+
+
+def upsert_statement():
+    """Returns an INSERT .. ON CONFLICT that merges rows into `event_rollups`."""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(EventRollup)
+        least, greatest = db.func.least, db.func.greatest
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(EventRollup)
+        least, greatest = db.func.min, db.func.max
+    else:
+        raise NotImplementedError(f"rollups are not supported on {dialect}")
+
+    table = EventRollup.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in table.primary_key.columns],
+        set_={
+            "count": table.c.count + stmt.excluded.count,
+            "sum": table.c.sum + stmt.excluded.sum,
+            "min": db.func.coalesce(
+                least(table.c.min, stmt.excluded.min), stmt.excluded.min
+            ),
+            "max": db.func.coalesce(
+                greatest(table.c.max, stmt.excluded.max), stmt.excluded.max
+            ),
+        },
+    )
+
+
+def upsert(rows):
+    """Merges rollup rows in one statement, leaving the commit to the caller.
+    Rows arrive sorted by key so concurrent writers lock them in the same
+    order.
+    """
+    if rows:
+        db.session.execute(upsert_statement(), rows)
+
+
+def rebuild(event_id, batch_size=10_000):
+    """Recomputes the rollups of one event from its raw data."""
+    without_statement_timeout(db.session.connection())
+    recompute(event_id, batch_size=batch_size)
+    db.session.commit()
+
+
+def recompute(event_id, start=None, end=None, batch_size=10_000):
+    """Replaces the rollups of `event_id` in [start, end) with ones computed
+    from its raw data, leaving the commit to the caller.
+
+    The bounds must be midnights, so that every bucket in the range is
+    recomputed whole. Days whose raw data may be past the event's retention
+    are never recomputed, since their rollups can outlive it.
+    """
+    expired = _raw_cutoff(event_id)
+    if expired is not None and (start is None or start < expired):
+        start = expired
+        if end is not None and end <= start:
+            return
+    bounds = []
+    if start is not None:
+        bounds.append((EventRollup.bucket >= start, EventData.timestamp >= start))
+    if end is not None:
+        bounds.append((EventRollup.bucket < end, EventData.timestamp < end))
+    db.session.execute(
+        db.delete(EventRollup).where(
+            EventRollup.event_id == event_id, *(rollup for rollup, _ in bounds)
+        )
+    )
+    stmt = (
+        db.select(EventData.timestamp, EventData.data)
+        .where(EventData.event_id == event_id, *(data for _, data in bounds))
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for chunk in chunked(db.session.execute(stmt), batch_size):
+        records = [{"timestamp": ts, "data": data} for ts, data in chunk]
+        db.session.execute(upsert_statement(), aggregate(event_id, records))
+
+
+def _raw_cutoff(event_id):
+    """Returns the first midnight after which none of the event's raw data
+    is past its retention policy, or None if it is kept forever.
+    """
+    policy = db.session.scalar(db.select(Event.retention).where(Event.id == event_id))
+    # Timestamps are stored as naive UTC.
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    cutoff = cutoffs(policy, current_app.config["RETENTION_POLICY"], now)["raw"]
+    if cutoff is None:
+        return None
+    midnight = datetime.combine(cutoff.date(), time())
+    return midnight if midnight == cutoff else midnight + timedelta(days=1)
+
+
+class RollupWriter:
+    """Keeps `event_rollups` up to date as event data is ingested or changed.
+
+    On databases other than PostgreSQL and SQLite it stays off and logs why.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+        self.enabled = app.config["ROLLUPS_ENABLED"] and backend in DIALECTS
+        if app.config["ROLLUPS_ENABLED"] and not self.enabled:
+            app.logger.warning("rollups are not supported on %s, disabling", backend)
+        if self.enabled:
+            data_ingested.connect(self._on_ingest)
+        else:
+            data_ingested.disconnect(self._on_ingest)
+        app.extensions["rollups"] = self
+
+    def refresh(self, event_id, timestamps):
+        """Recomputes the days of rollups holding `timestamps`, after rows
+        there were changed rather than added.
+        """
+        if not self.enabled:
+            return
+        days = set()
+        for timestamp in timestamps:
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            days.add(timestamp.replace(hour=0, minute=0, second=0, microsecond=0))
+        for day in sorted(days):
+            recompute(event_id, day, day + timedelta(days=1))
+
+    def _on_ingest(self, sender, event_id, rows):
+        upsert(aggregate(event_id, rows))
+
+
+rollup_writer = RollupWriter()
@@ -0,0 +1,101 @@
+import orjson
+from apiflask import fields
+from flask import current_app
+
+from event_horizon.api import camelcase
+from event_horizon.extensions import db
+from event_horizon.profiling import profiled
+
+# How each field type dumps a non-null value, as an expression on `v`. Other
+# fields fall back to their own `_serialize`.
+_CONVERTERS = {
+    fields.String: "str(v)",
+    fields.Integer: "int(v)",
+    fields.Float: "float(v)",
+    fields.Boolean: "bool(v)",
+    fields.Dict: "v",
+    fields.Raw: "v",
+}
+
+_OPTIONS = (
+    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+class RowSerializer:
+    """Dumps rows of `model` columns the way `schema` dumps `model` objects,
+    without going through marshmallow for every field of every object.
+
+    `select()` returns a statement for just the columns the schema needs.
+    Each row it returns is turned into a dict by a function generated from
+    the schema, and `response()` encodes the whole payload with orjson.
+    The output is the same as the view's `output` schema and the base
+    `ResponseSchema` would produce::
+
+        rows = RowSerializer(EventDTO(), Event)
+        page = await paginate(session, Event, rows.select(), query_data, rows=True)
+        return rows.response(page)
+    """
+
+    def __init__(self, schema, model):
+        self.schema = schema
+        self.model = model
+        self.columns = []
+        self._indexes = {}
+        self.dump = self._compile()
+
+    def select(self):
+        return db.select(*self.columns)
+
+    def body(self, payload):
+        """Returns `payload` with its rows dumped and camel-cased keys."""
+        body = {camelcase(key): value for key, value in payload.items()}
+        body["data"] = [self.dump(row) for row in payload["data"]]
+        return body
+
+    def response(self, payload, status=200):
+        option = _OPTIONS
+        if current_app.debug:
+            option |= orjson.OPT_INDENT_2
+        with profiled("serialization"):
+            content = orjson.dumps(
+                self.body(payload), default=current_app.json.default, option=option
+            )
+        return current_app.response_class(
+            content + b"\n", status=status, mimetype="application/json"
+        )
+
+    def _compile(self):
+        namespace = {}
+        items = []
+        # `id` and `created_at` are the keyset cursor of `paginate`.
+        for key in ("id", "created_at"):
+            self._column(key)
+        for name, field in self.schema.dump_fields.items():
+            index = self._column(field.attribute or name)
+            expression = _expression(field)
+            if expression is None:
+                namespace[f"f{index}"] = field
+                expression = f"f{index}._serialize(v, {name!r}, row)"
+            items.append(
+                f"{field.data_key or name!r}: "
+                f"None if (v := row[{index}]) is None else {expression}"
+            )
+        source = "def dump(row):\n    return {" + ", ".join(items) + "}\n"
+        exec(compile(source, f"<{type(self.schema).__name__} rows>", "exec"), namespace)
+        return namespace["dump"]
+
+    def _column(self, key):
+        if key not in self._indexes:
+            self._indexes[key] = len(self.columns)
+            self.columns.append(getattr(self.model, key))
+        return self._indexes[key]
+
+
+def _expression(field):
+    if isinstance(field, fields.DateTime):
+        return "v.isoformat()" if field.format in (None, "iso") else None
+    for cls in type(field).__mro__:
+        if cls in _CONVERTERS:
+            return _CONVERTERS[cls]
+    return None
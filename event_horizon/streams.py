@@ -0,0 +1,324 @@
+import asyncio
+import threading
+from collections import deque
+from http import HTTPStatus
+from typing import NamedTuple
+
+import orjson
+from apiflask import HTTPError
+from flask import current_app
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from itsdangerous import BadData, URLSafeTimedSerializer
+from jwt import PyJWTError
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from event_horizon.alerting import alerts_fired
+from event_horizon.cache import auth_cache
+from event_horizon.extensions import db
+from event_horizon.ingest import data_ingested
+from event_horizon.models import Event
+
+_PING = b": ping\n\n"
+
+
+class Message(NamedTuple):
+    """A published message, encoded once for every subscriber."""
+
+    user_id: int | None
+    sse: bytes
+    text: str
+
+
+def encode(kind, payload, user_id=None):
+    data = orjson.dumps(payload).decode()
+    return Message(
+        user_id,
+        f"event: {kind}\ndata: {data}\n\n".encode(),
+        f'{{"event":"{kind}","data":{data}}}',
+    )
+
+
+class Subscription:
+    """A subscriber's bounded queue of messages.
+
+    Publishing never blocks. When the queue is full the oldest message is
+    dropped and counted, and the subscriber is told how many it missed, so a
+    slow client loses messages instead of stalling ingestion.
+
+    Subscriptions made with a `loop` are waited on with `wait()` from that
+    loop, the others with `get()` from a thread.
+    """
+
+    def __init__(self, event_id, user_id, size, loop=None):
+        self.event_id = event_id
+        self.user_id = user_id
+        self.size = size
+        self.closed = False
+        self._messages = deque()
+        self._dropped = 0
+        self._signalled = False
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop else threading.Event()
+
+    def put(self, message):
+        with self._lock:
+            if len(self._messages) >= self.size:
+                self._messages.popleft()
+                self._dropped += 1
+            self._messages.append(message)
+            if self._signalled:
+                return
+            self._signalled = True
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def get(self, timeout):
+        """Waits up to `timeout` seconds, then returns the queued messages
+        and the number dropped since the last call.
+        """
+        self._ready.wait(timeout)
+        return self._drain()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._drain()
+
+    def _wake(self):
+        if self._loop is None:
+            self._ready.set()
+        else:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _drain(self):
+        with self._lock:
+            messages = list(self._messages)
+            self._messages.clear()
+            dropped, self._dropped = self._dropped, 0
+            self._signalled = False
+            self._ready.clear()
+        return messages, dropped
+
+
+class StreamHub:
+    """Fans newly ingested event data and notifications out to the live
+    stream subscribers of this process.
+
+    Messages are encoded once and appended to each subscriber's bounded
+    queue, so publishing costs the same whether clients keep up or not.
+    Notifications only go to the user they belong to.
+
+    Every worker only sees what is ingested through it, so clients that
+    need everything must stream from the worker that ingests it, or
+    backfill with `GET /events/<id>/data`.
+
+    Ingestion and alert signals are sent inside the transaction that stores
+    the rows, so their messages are held by the session and published once
+    it commits. A rollback discards them.
+    """
+
+    def __init__(self, app=None):
+        self.subscribers = {}
+        self.queue_size = 1000
+        self.heartbeat = 15
+        self.max_subscribers = 10_000
+        self._count = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.queue_size = app.config["STREAM_QUEUE_SIZE"]
+        self.heartbeat = app.config["STREAM_HEARTBEAT"]
+        self.max_subscribers = app.config["STREAM_MAX_SUBSCRIBERS"]
+        data_ingested.connect(self._on_ingest)
+        alerts_fired.connect(self._on_alert)
+        app.extensions["streams"] = self
+
+    def subscribe(self, event_id, user_id, loop=None):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "too many streams")
+            subscription = Subscription(event_id, user_id, self.queue_size, loop)
+            # Copy on write, so publishers iterate without taking the lock.
+            subscribers = self.subscribers.get(event_id, frozenset())
+            self.subscribers[event_id] = subscribers | {subscription}
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self.subscribers.get(subscription.event_id, frozenset())
+            if subscription not in subscribers:
+                return
+            subscribers -= {subscription}
+            if subscribers:
+                self.subscribers[subscription.event_id] = subscribers
+            else:
+                del self.subscribers[subscription.event_id]
+            self._count -= 1
+
+    def publish(self, event_id, message):
+        for subscription in self.subscribers.get(event_id, ()):
+            if message.user_id is None or message.user_id == subscription.user_id:
+                subscription.put(message)
+
+    def sse(self, subscription):
+        """Yields the `text/event-stream` body of a subscription, for
+        streams served from a request thread.
+        """
+        try:
+            yield _PING
+            while not subscription.closed:
+                yield _frame(*subscription.get(self.heartbeat))
+        finally:
+            self.unsubscribe(subscription)
+
+    async def serve_sse(self, subscription, receive, send):
+        """Serves a subscription as an ASGI `text/event-stream` response."""
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.OK,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        reader = asyncio.create_task(_close_on(subscription, receive, "http"))
+        try:
+            await send({"type": "http.response.body", "body": _PING, "more_body": True})
+            while not subscription.closed:
+                body = _frame(*await subscription.wait(self.heartbeat))
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": True}
+                )
+        finally:
+            reader.cancel()
+            self.unsubscribe(subscription)
+
+    async def serve_websocket(self, subscription, receive, send):
+        """Serves a subscription over an accepted ASGI WebSocket."""
+        reader = asyncio.create_task(_close_on(subscription, receive, "websocket"))
+        try:
+            while not subscription.closed:
+                for message in _with_dropped(*await subscription.wait(self.heartbeat)):
+                    await send({"type": "websocket.send", "text": message.text})
+        finally:
+            reader.cancel()
+            self.unsubscribe(subscription)
+
+    def _on_ingest(self, sender, event_id, rows):
+        if event_id in self.subscribers:
+            payload = [
+                {"data": row["data"], "timestamp": row["timestamp"]} for row in rows
+            ]
+            self._publish_on_commit(
+                event_id, encode("data", {"eventId": event_id, "data": payload})
+            )
+
+    def _on_alert(self, sender, event_id, notifications):
+        if event_id in self.subscribers:
+            for notification in notifications:
+                self._publish_on_commit(
+                    event_id,
+                    encode(
+                        "notification",
+                        {"eventId": event_id, "message": notification["message"]},
+                        user_id=notification["user_id"],
+                    ),
+                )
+
+    def _publish_on_commit(self, event_id, message):
+        pending = db.session.info.setdefault("stream_messages", [])
+        pending.append((self, event_id, message))
+
+
+def stream_token(event_id, email):
+    """Returns a token that opens only the stream of `event_id`, for
+    clients that cannot send an Authorization header, such as EventSource
+    and browser WebSockets. It is passed as `?token=`, so it ends up in
+    access logs; it expires after STREAM_TOKEN_EXPIRES seconds and is no
+    use for anything else. Needs an app context.
+    """
+    return _stream_tokens().dumps({"event": event_id, "sub": email})
+
+
+def authorize(event_id, token=None, stream_token=None):
+    """Applies the checks of the stream view to a stream served outside of
+    Flask: `token` must be a valid, unrevoked access token, or
+    `stream_token` one made by `stream_token()` for the event, and the
+    event must exist. Returns the id of the token's user. Needs an app
+    context.
+    """
+    if token:
+        try:
+            claims = decode_token(token)
+        except (JWTExtendedException, PyJWTError):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid token")
+        if claims["type"] != "access" or auth_cache.is_revoked(claims["jti"]):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid token")
+    else:
+        try:
+            claims = _stream_tokens().loads(
+                stream_token or "",
+                max_age=current_app.config["STREAM_TOKEN_EXPIRES"],
+            )
+        except BadData:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid token")
+        if claims["event"] != event_id:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid token")
+    user = auth_cache.load_user(claims["sub"])
+    if user is None:
+        raise HTTPError(HTTPStatus.UNAUTHORIZED, "invalid token")
+    if db.session.get(Event, event_id) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, "event not found")
+    return user.id
+
+
+def _stream_tokens():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="stream")
+
+
+def _with_dropped(messages, dropped):
+    if dropped:
+        messages.insert(0, encode("dropped", {"count": dropped}))
+    return messages
+
+
+def _frame(messages, dropped):
+    messages = _with_dropped(messages, dropped)
+    if not messages:
+        return _PING
+    return b"".join(message.sse for message in messages)
+
+
+async def _close_on(subscription, receive, protocol):
+    while (await receive())["type"] != f"{protocol}.disconnect":
+        pass
+    subscription.close()
+
+
+stream_hub = StreamHub()
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    for hub, event_id, message in session.info.pop("stream_messages", ()):
+        hub.publish(event_id, message)
+
+
+@sa_event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop("stream_messages", None)
@@ -1,27 +1,75 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from sqlalchemy.ext.mutable import Mutable
 
 
 class PasswordHash(Mutable):
+    #: Shared by every hash; `configure_passwords` applies the app's costs.
+    hasher = PasswordHasher()
+    #: Runs hashing and verification when set, bounding how many run at once.
+    executor = None
+
     def __init__(self, hash: str) -> None:
-        self.ph = PasswordHasher()
         self.hash = hash
 
-    def __eq__(self, value: str) -> bool:
-        try:
-            self.ph.verify(self.hash, value)
-            if self.ph.check_needs_rehash(self.hash):
-                self.changed()
-            return True
-        except Exception:
-            pass
+    def __eq__(self, value) -> bool:
+        if isinstance(value, PasswordHash):
+            return self.hash == value.hash
+        return self._run(self._verify, value)
 
-        return False
+    async def verify(self, password: str):
+        """Checks `password` on the executor without blocking the event loop.
+
+        Returns whether it matches and, when the hash was made with other
+        parameters than the current hasher's, a new hash of the password.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._check, password)
 
     @classmethod
     def new(cls, password: str):
-        ph = PasswordHasher()
-        return cls(ph.hash(password))
+        return cls(cls._run(cls.hasher.hash, password))
+
+    def _check(self, password):
+        if not self._verify(password):
+            return False, None
+        if self.hasher.check_needs_rehash(self.hash):
+            return True, PasswordHash(self.hasher.hash(password))
+        return True, None
+
+    def _verify(self, password):
+        try:
+            return self.hasher.verify(self.hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    @classmethod
+    def _run(cls, fn, *args):
+        if cls.executor is None:
+            return fn(*args)
+        return cls.executor.submit(fn, *args).result()
+
+
+def configure_passwords(app):
+    """Shares one Argon2 hasher with the app's cost parameters, run by a pool
+    of `PASSWORD_HASH_WORKERS` threads.
+
+    Argon2 releases the GIL while hashing, so the pool lets logins hash in
+    parallel while capping the CPU and memory a burst of them can take.
+    """
+    PasswordHash.hasher = PasswordHasher(
+        time_cost=app.config["ARGON2_TIME_COST"],
+        memory_cost=app.config["ARGON2_MEMORY_COST"],
+        parallelism=app.config["ARGON2_PARALLELISM"],
+    )
+    if PasswordHash.executor is not None:
+        PasswordHash.executor.shutdown(wait=False)
+    PasswordHash.executor = ThreadPoolExecutor(
+        app.config["PASSWORD_HASH_WORKERS"], thread_name_prefix="argon2"
+    )
 
 
 def generate_links(rel: str, hrefs: list[str]):
@@ -0,0 +1,124 @@
+import re
+from collections import deque
+from datetime import datetime, timezone
+from numbers import Real
+
+AGGREGATES = ("count", "sum", "avg", "min", "max")
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_EPOCH = datetime(1970, 1, 1)
+_WINDOW_RE = re.compile(r"^(\d+)([smhd])$")
+
+
+def parse_window(spec):
+    """Returns the length in seconds of a window such as `30s`, `5m` or `1h`."""
+    if isinstance(spec, int) and not isinstance(spec, bool) and spec > 0:
+        return spec
+    match = _WINDOW_RE.match(spec) if isinstance(spec, str) else None
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"invalid window {spec!r}")
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def _seconds(timestamp):
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH).total_seconds()
+
+
+def is_number(value):
+    """Whether `value` is a JSON number. Booleans are not."""
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+class SlidingWindow:
+    """Count, sum, avg, min and max over the last `seconds` of event time.
+
+    Points are accumulated into `buckets` time buckets held in a ring, with
+    running totals for count and sum and monotonic deques of bucket minima
+    and maxima, so in-order updates and reads are O(1) amortized. Points
+    older than the window are dropped; late points that still fall inside
+    it are added to their bucket and the min/max deques are rebuilt.
+    """
+
+    def __init__(self, seconds, buckets=60):
+        self.width = seconds / buckets
+        self.buckets = buckets
+        self.count = 0
+        self.total = 0.0
+        self._ring = deque()
+        self._mins = deque()
+        self._maxs = deque()
+
+    def add(self, timestamp, value=None):
+        index = int(_seconds(timestamp) // self.width)
+        head = self._ring[-1][0] if self._ring else None
+        if head is None or index > head:
+            self._advance(index)
+            head = index
+        elif index <= head - self.buckets:
+            return
+        # A late point before the oldest bucket of a ring that is not full yet,
+        # as after a reset: the buckets in between are added empty.
+        for i in range(self._ring[0][0] - 1, index - 1, -1):
+            self._ring.appendleft([i, 0, 0.0, None, None])
+
+        bucket = self._ring[index - self._ring[0][0]]
+        bucket[1] += 1
+        self.count += 1
+        if not is_number(value):
+            return
+
+        bucket[2] += value
+        self.total += value
+        bucket[3] = value if bucket[3] is None else min(bucket[3], value)
+        bucket[4] = value if bucket[4] is None else max(bucket[4], value)
+        if index == head:
+            _push(self._mins, index, value, lambda last, new: last >= new)
+            _push(self._maxs, index, value, lambda last, new: last <= new)
+        else:
+            self._rebuild_extrema()
+
+    def value(self, aggregate):
+        if aggregate == "count":
+            return self.count
+        if aggregate == "sum":
+            return self.total
+        if aggregate == "avg":
+            return self.total / self.count if self.count else None
+        extrema = self._mins if aggregate == "min" else self._maxs
+        return extrema[0][1] if extrema else None
+
+    def _advance(self, index):
+        if not self._ring or index - self._ring[-1][0] >= self.buckets:
+            self._ring.clear()
+            self._mins.clear()
+            self._maxs.clear()
+            self.count, self.total = 0, 0.0
+            self._ring.append([index, 0, 0.0, None, None])
+            return
+
+        for i in range(self._ring[-1][0] + 1, index + 1):
+            self._ring.append([i, 0, 0.0, None, None])
+        oldest = index - self.buckets
+        while self._ring[0][0] <= oldest:
+            _, count, total, _, _ = self._ring.popleft()
+            self.count -= count
+            self.total -= total
+        for extrema in (self._mins, self._maxs):
+            while extrema and extrema[0][0] <= oldest:
+                extrema.popleft()
+
+    def _rebuild_extrema(self):
+        self._mins.clear()
+        self._maxs.clear()
+        for index, _, _, low, high in self._ring:
+            if low is not None:
+                _push(self._mins, index, low, lambda last, new: last >= new)
+                _push(self._maxs, index, high, lambda last, new: last <= new)
+
+
+def _push(extrema, index, value, dominated):
+    while extrema and dominated(extrema[-1][1], value):
+        extrema.pop()
+    extrema.append((index, value))
@@ -1,99 +1,285 @@
+"""Runs the tests that use the app against a local, throwaway PostgreSQL.
+
+The server is the one at `TEST_POSTGRES_URL`, given as the URL of a database
+to connect to for `CREATE DATABASE`, or otherwise a cluster initialized once
+in the pytest cache with the binaries on `PATH` (or in `PG_BIN`) and
+started for the session, listening only on a Unix socket. Without either,
+those tests are skipped.
+
+The schema is built once per version of the models into a template
+database, and each session works in a copy of it made with
+`CREATE DATABASE ... TEMPLATE`, which takes milliseconds.
+
+Every test is wrapped in a transaction that is rolled back after it, so the
+commits of `db.session` only release savepoints. Tests whose data must be
+seen by other connections, such as those of async views, background threads
+or `db.engine.begin()`, are marked `committed`: they commit for real, and
+the database is copied from the template again after them.
+"""
+
+import hashlib
 import os
+import secrets
+import shutil
+import subprocess
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
 
 import pytest
-import requests
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateIndex, CreateTable
 
-from event_horizon import create_app
+from event_horizon import create_app, partitions
+from event_horizon.aio import adb
+from event_horizon.alerting import alert_engine
+from event_horizon.cache import auth_cache
+from event_horizon.config import BaseConfig
+from event_horizon.extensions import cache, db
+from event_horizon.models import Event, User
 
-HEADERS = {
-    "accept": "application/json",
-    "content-type": "application/json",
-    "authorization": f"Bearer {os.getenv('NEON_TOKEN')}",
-}
+
+def pytest_configure(config):
+    pytest.test_user_id = None  # type: ignore
+    config.addinivalue_line(
+        "markers",
+        "committed: commit for real instead of rolling back, for data that"
+        " other connections must see",
+    )
 
 
-def get_test_db_connection():
-    try:
-        res = requests.post(
-            f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/branches",
-            json={
-                "branch": {"name": "test", "parent_id": os.getenv("NEON_DEV_BRANCH_ID")}
-            },
-            headers=HEADERS,
+class LocalServer:
+    """A PostgreSQL cluster in `directory` run with the binaries in `bindir`.
+
+    Durability is turned off, since the data is thrown away.
+    """
+
+    def __init__(self, bindir, directory):
+        self.bindir = Path(bindir)
+        self.directory = Path(directory)
+        self.data = self.directory / "data"
+        self.log = self.directory / "postgres.log"
+        # Socket paths are limited to about 100 bytes, so it is kept short.
+        digest = hashlib.sha1(str(self.directory).encode()).hexdigest()[:8]
+        self.socket = Path(tempfile.gettempdir()) / f"eh-pg-{digest}"
+        self.started = False
+
+    @property
+    def url(self):
+        return make_url(f"postgresql+psycopg2://postgres@/postgres?host={self.socket}")
+
+    def start(self):
+        if not (self.data / "PG_VERSION").exists():
+            self._run(
+                "initdb", "-D", self.data, "-U", "postgres", "-A", "trust",
+                "-E", "UTF8", "--no-sync",
+            )  # fmt: skip
+        if self._run("pg_ctl", "status", "-D", self.data, check=False) == 0:
+            return
+        self.socket.mkdir(exist_ok=True)
+        options = (
+            f"-k {self.socket} -c listen_addresses='' -F"
+            " -c synchronous_commit=off -c full_page_writes=off"
+        )
+        self._run(
+            "pg_ctl", "start", "-w", "-D", self.data, "-l", self.log, "-o", options
         )
-        data = res.json()
-        branch_id = data.get("branch", {}).get("id")
-        roles = data.get("roles", [])
-        databases = data.get("databases", [])
+        self.started = True
 
-        try:
-            compute_res = requests.post(
-                f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/endpoints",
-                headers=HEADERS,
-                json={"endpoint": {"branch_id": branch_id, "type": "read_write"}},
+    def stop(self):
+        if self.started:
+            self._run("pg_ctl", "stop", "-D", self.data, "-m", "fast")
+            self.started = False
+
+    def _run(self, command, *args, check=True):
+        result = subprocess.run(
+            [self.bindir / command, *map(str, args)], capture_output=True, text=True
+        )
+        if check and result.returncode != 0:
+            log = self.log.read_text()[-2000:] if self.log.exists() else ""
+            raise RuntimeError(f"{command} failed:\n{result.stderr}{log}")
+        return result.returncode
+
+
+class Database:
+    """The session's database on `server_url`, copied from the template
+    database of the current models.
+    """
+
+    def __init__(self, server_url):
+        self.server_url = server_url
+        self.admin = create_engine(
+            server_url, poolclass=NullPool, isolation_level="AUTOCOMMIT"
+        )
+        self.template = f"eventhorizon_template_{schema_version()}"
+        self.name = f"eventhorizon_test_{os.getpid()}"
+        self.url = server_url.set(database=self.name)
+
+    def create(self):
+        with self.admin.connect() as conn:
+            exists = conn.scalar(
+                text("SELECT 1 FROM pg_database WHERE datname = :name"),
+                {"name": self.template},
+            )
+        if not exists:
+            self._build_template()
+        self.reset()
+
+    def reset(self):
+        """Replaces the database with a fresh copy of the template."""
+        with self.admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {self.name} WITH (FORCE)"))
+            conn.execute(text(f"CREATE DATABASE {self.name} TEMPLATE {self.template}"))
+
+    def drop(self):
+        with self.admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {self.name} WITH (FORCE)"))
+        self.admin.dispose()
+
+    def _build_template(self):
+        # Built under another name and renamed, so a session running at the
+        # same time never copies a half-built template.
+        building = f"{self.template}_{os.getpid()}"
+        with self.admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {building}"))
+            conn.execute(text(f"CREATE DATABASE {building}"))
+
+        engine = create_engine(
+            self.server_url.set(database=building), poolclass=NullPool
+        )
+        with engine.begin() as conn:
+            available = conn.scalar(
+                text("SELECT 1 FROM pg_available_extensions WHERE name = 'uuid-ossp'")
             )
-            endpoint_id = compute_res.json()["endpoint"]["id"]
+            if available:
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"'))
+            else:
+                # Builds without the contrib modules still have the core
+                # equivalent of the models' default.
+                conn.execute(
+                    text(
+                        "CREATE FUNCTION uuid_generate_v4() RETURNS uuid"
+                        " LANGUAGE sql AS 'SELECT gen_random_uuid()'"
+                    )
+                )
+            db.metadata.create_all(conn)
+            conn.execute(
+                text(
+                    f"CREATE TABLE {partitions.DEFAULT_PARTITION}"
+                    f" PARTITION OF {partitions.TABLE} DEFAULT"
+                )
+            )
+            current = partitions.month_start(datetime.now(timezone.utc))
+            for n in range(BaseConfig.EVENT_DATA_PARTITION_MONTHS + 1):
+                partitions.create_partition(conn, partitions.add_months(current, n))
+        engine.dispose()
 
+        with self.admin.connect() as conn:
             try:
-                requests.post(
-                    f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/endpoints/{endpoint_id}/start",
-                    headers=HEADERS,
+                conn.execute(
+                    text(f"ALTER DATABASE {building} RENAME TO {self.template}")
                 )
+            except ProgrammingError:
+                # Another session built it first.
+                conn.execute(text(f"DROP DATABASE {building}"))
 
-                try:
-                    conn_res = requests.get(
-                        f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/connection_uri",
-                        headers=HEADERS,
-                        params={
-                            "branch_id": branch_id,
-                            "database_name": databases[0]["name"],
-                            "role_name": roles[0]["name"],
-                        },
-                    )
-                    return (
-                        conn_res.json()["uri"],
-                        branch_id,
-                        endpoint_id,
-                    )
-                except Exception:
-                    raise
-            except Exception:
-                raise
-        except Exception:
-            raise
-    except Exception:
-        raise
-
-
-def delete_test_branch(branch, endpoint):
-    res = requests.delete(
-        f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/endpoints/{endpoint}",
-        headers=HEADERS,
-    )
-    res = requests.delete(
-        f"https://console.neon.tech/api/v2/projects/{os.getenv('NEON_PROJECT_ID')}/branches/{branch}",
-        headers=HEADERS,
-    )
 
-    if res.status_code != 200:
-        raise RuntimeError("failed to delete test branch")
+def schema_version():
+    """Fingerprints the DDL of the models, so the template is rebuilt when
+    they change.
+    """
+    dialect = postgresql.dialect()
+    ddl = []
+    for table in db.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(i).compile(dialect=dialect)) for i in table.indexes)
+    return hashlib.sha1("\n".join(ddl).encode()).hexdigest()[:12]
 
 
-def pytest_configure():
-    pytest.test_user_id = None  # type: ignore
+@pytest.fixture(scope="session")
+def database(request):
+    url = os.getenv("TEST_POSTGRES_URL")
+    server = None
+    if url:
+        url = make_url(url).set(drivername="postgresql+psycopg2")
+    else:
+        bindir = os.getenv("PG_BIN") or os.path.dirname(shutil.which("pg_ctl") or "")
+        if not bindir:
+            pytest.skip("no PostgreSQL: set TEST_POSTGRES_URL or put pg_ctl on PATH")
+        server = LocalServer(bindir, request.config.cache.mkdir("postgres"))
+        server.start()
+        url = server.url
+
+    database = Database(url)
+    database.create()
+    yield database
+
+    database.drop()
+    if server is not None:
+        server.stop()
 
 
 @pytest.fixture(scope="session")
-def test_app():
-    (test_db_uri, test_branch_id, endpoint_id) = get_test_db_connection()
+def test_app(database):
+    app = create_app("test", database.url.render_as_string(hide_password=False))
+    # Without SECRET_KEY in the environment, sign tokens with a throwaway key.
+    for key in ("SECRET_KEY", "JWT_SECRET_KEY"):
+        app.config[key] = app.config[key] or secrets.token_hex(32)
+    return app
+
 
-    _, uri = test_db_uri.split("://")
-    formatted_uri = "://".join(["postgresql+psycopg2", uri])
-    app = create_app("test", formatted_uri)
+@pytest.fixture
+def make_user(test_app):
+    """Returns a function adding a user and returning it with the headers
+    of a fresh access token for it.
+    """
 
-    yield app
+    def make(is_admin=False, password="Password123!"):
+        with test_app.app_context():
+            user = User(email=f"{uuid.uuid4().hex[:12]}@example.com", password=password)
+            user.is_admin = is_admin
+            db.session.add(user)
+            db.session.commit()
+            db.session.refresh(user)
+            token = create_access_token(
+                identity=user.email,
+                additional_claims={"is_admin": is_admin},
+                fresh=True,
+            )
+            return user, {"Authorization": f"Bearer {token}"}
+
+    return make
 
-    delete_test_branch(test_branch_id, endpoint_id)
+
+@pytest.fixture
+def make_event(test_app, make_user):
+    """Returns a function adding an event of `author`, or of a new user,
+    and returning it.
+    """
+
+    def make(author=None, retention=None):
+        with test_app.app_context():
+            author = author or make_user()[0]
+            event = Event(
+                "event",
+                "test event",
+                datetime(2024, 1, 1),
+                datetime(2025, 1, 1),
+                author.id,
+                retention,
+            )
+            db.session.add(event)
+            db.session.commit()
+            db.session.refresh(event)
+            return event
+
+    return make
 
 
 @pytest.fixture(scope="session")
@@ -104,3 +290,45 @@ def client(test_app):
 @pytest.fixture(scope="session")
 def runner(test_app):
     return test_app.test_cli_runner()
+
+
+@pytest.fixture(autouse=True)
+def transaction(request):
+    """Rolls back what the test wrote, for tests that use the app."""
+    if "test_app" not in request.fixturenames:
+        yield
+        return
+    app = request.getfixturevalue("test_app")
+
+    if request.node.get_closest_marker("committed"):
+        yield
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        adb.async_to_sync(adb.dispose)()
+        request.getfixturevalue("database").reset()
+    else:
+        with app.app_context():
+            connection = db.engine.connect()
+            outer = connection.begin()
+            # Every session, including those of requests, is bound to the
+            # connection and joins the outer transaction through a savepoint.
+            db.session.configure(
+                bind=connection, join_transaction_mode="create_savepoint"
+            )
+        try:
+            yield
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.session.configure(
+                    bind=None, join_transaction_mode="conditional_savepoint"
+                )
+            outer.rollback()
+            connection.close()
+
+    # Cached users, responses and alert state may be of rows that are gone.
+    with app.app_context():
+        cache.clear()
+        auth_cache.init_app(app)
+        alert_engine.init_app(app)
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from event_horizon.aio import AsyncDatabase, async_uri
+from event_horizon.api import Page
+
+
+def test_async_uri():
+    assert (
+        async_uri("postgresql+psycopg2://u:p@host/db?sslmode=require")
+        == "postgresql+asyncpg://u:p@host/db?ssl=require"
+    )
+    assert async_uri("postgresql://u@host/db") == "postgresql+asyncpg://u@host/db"
+    assert async_uri("sqlite:///app.db") == "sqlite+aiosqlite:///app.db"
+
+
+def test_async_to_sync_shares_one_loop():
+    adb = AsyncDatabase()
+    var = contextvars.ContextVar("var")
+    var.set("request")
+
+    async def view(n):
+        await asyncio.sleep(0)
+        return n, var.get(), asyncio.get_running_loop()
+
+    run = adb.async_to_sync(view)
+    first, second = run(1), run(2)
+    assert first[:2] == (1, "request")
+    assert second[:2] == (2, "request")
+    assert first[2] is second[2]
+
+
+def test_async_to_sync_raises():
+    async def view():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        AsyncDatabase().async_to_sync(view)()
+
+
+def test_page():
+    page = Page(["a"], 2, 10, 25)
+    assert (page.pages, page.prev_num, page.next_num) == (3, 1, 3)
+    assert not Page([], 1, 10, 0).has_next
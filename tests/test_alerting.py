@@ -0,0 +1,191 @@
+from datetime import datetime
+
+import pytest
+
+from event_horizon.alerting import (
+    ConditionError,
+    EventAlertIndex,
+    alert_engine,
+    compile_condition,
+)
+from event_horizon.extensions import db
+from event_horizon.ingest import notify_ingested
+from event_horizon.models import Alert, EventData, Notification
+
+
+def test_compile_condition_comparisons():
+    predicate = compile_condition(
+        {
+            "all": [
+                {"field": "data.latency", "op": "gt", "value": 500},
+                {"not": {"field": "data.region", "op": "in", "value": ["eu"]}},
+            ]
+        }
+    )
+
+    assert predicate({"data": {"latency": 501, "region": "us"}})
+    assert not predicate({"data": {"latency": 501, "region": "eu"}})
+    assert not predicate({"data": {"latency": "slow", "region": "us"}})
+    assert not predicate({"data": {}})
+
+
+def test_booleans_are_not_ordered_as_numbers():
+    predicate = compile_condition({"field": "data.up", "op": "gt", "value": 0})
+
+    assert not predicate({"data": {"up": True}})
+    assert predicate({"data": {"up": 1}})
+
+
+@pytest.mark.parametrize("op", ["between", ["gt"], {}])
+def test_compile_condition_rejects_unknown_op(op):
+    with pytest.raises(ConditionError):
+        compile_condition({"field": "data.latency", "op": op, "value": 1})
+
+
+def test_index_matches_same_alerts_as_predicates():
+    conditions = [
+        {"field": "data.v", "op": op, "value": value}
+        for op in ("gt", "gte", "lt", "lte", "eq")
+        for value in (0, 10, 20, 30)
+    ] + [
+        {"field": "data.v", "op": "ne", "value": 10},
+        {
+            "all": [
+                {"field": "data.v", "op": "gte", "value": 10},
+                {"field": "data.v", "op": "lt", "value": 40},
+            ]
+        },
+    ]
+    index = EventAlertIndex()
+    for i, condition in enumerate(conditions):
+        index.add(i, condition)
+
+    for v in (-5, 0, 10, 15, 30, 45, "x", None, True, False):
+        record = {"data": {"v": v}}
+        expected = {i for i, c in enumerate(conditions) if compile_condition(c)(record)}
+        assert set(index.match(record)) == expected
+
+
+def add_alerts(event, conditions):
+    db.session.execute(
+        db.insert(Alert),
+        [
+            {"user_id": event.author_id, "event_id": event.id, "condition": c}
+            for c in conditions
+        ],
+    )
+    db.session.commit()
+
+
+def test_invalid_stored_conditions_are_skipped(test_app, make_event):
+    event = make_event()
+    valid = {"field": "data.v", "op": "gt", "value": 1}
+
+    with test_app.app_context():
+        add_alerts(
+            event, [5, "text", ["list"], {"field": "data.v", "op": ["gt"]}, valid]
+        )
+        alert_engine.invalidate(event.id)
+        index = alert_engine.index_for(event.id)
+
+    assert index.size == 1
+
+
+def test_notifications_are_left_to_the_callers_transaction(test_app, make_event):
+    event = make_event()
+    record = {"data": {"v": 2}, "timestamp": datetime(2024, 1, 1)}
+    notifications = db.select(db.func.count()).where(Notification.event_id == event.id)
+
+    with test_app.app_context():
+        add_alerts(event, [{"field": "data.v", "op": "gt", "value": 1}])
+        notify_ingested(event.id, [record])
+        db.session.rollback()
+        assert db.session.scalar(notifications) == 0
+
+        notify_ingested(event.id, [record])
+        db.session.commit()
+        assert db.session.scalar(notifications) == 1
+
+
+def test_windowed_alerts_fire_once_until_rearmed(test_app, make_event, monkeypatch):
+    event = make_event()
+    condition = {"aggregate": "count", "op": "gte", "value": 2, "window": "1m"}
+    backfill = alert_engine._backfill
+
+    def unlocked_backfill(*args):
+        assert not alert_engine._lock.locked()
+        return backfill(*args)
+
+    monkeypatch.setattr(alert_engine, "_backfill", unlocked_backfill)
+
+    def ingest(second):
+        record = {"data": {}, "timestamp": datetime(2024, 1, 1, 0, 0, second)}
+        db.session.execute(db.insert(EventData), [{**record, "event_id": event.id}])
+        return len(alert_engine.evaluate(event.id, [record]))
+
+    with test_app.app_context():
+        add_alerts(event, [condition])
+        (alert,) = db.session.scalars(
+            db.select(Alert.id).where(Alert.event_id == event.id)
+        )
+        alert_engine.invalidate(event.id)
+
+        assert [ingest(s) for s in (0, 1, 2)] == [0, 1, 0]
+        assert alert_engine._active[event.id] == {alert}
+
+        db.session.delete(db.session.get(Alert, alert))
+        db.session.commit()
+        assert event.id not in alert_engine._active
+
+
+def test_rebuilt_indexes_prune_alerts_that_are_gone(test_app, make_event):
+    event = make_event()
+
+    with test_app.app_context():
+        alert_engine._active[event.id] = {-1}
+        alert_engine.invalidate(event.id)
+        alert_engine.index_for(event.id)
+
+    assert event.id not in alert_engine._active
+
+
+def test_late_points_in_later_batches(client, test_app, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(author=user)
+    # 10s buckets: 00:20 resets the window, and 00:19 lands before its oldest.
+    condition = {"aggregate": "count", "op": "gte", "value": 2, "window": "10m"}
+    with test_app.app_context():
+        add_alerts(event, [condition])
+        alert_engine.invalidate(event.id)
+
+    for minutes in ([0], [20, 19]):
+        body = [{"data": {}, "timestamp": f"2024-01-01T00:{m:02}:00"} for m in minutes]
+        res = client.post(f"/events/{event.id}/data:batch", json=body, headers=headers)
+        assert res.status_code == 200
+        assert res.get_json()["data"]["accepted"] == len(minutes)
+
+    with test_app.app_context():
+        notifications = db.select(db.func.count()).where(
+            Notification.event_id == event.id
+        )
+        assert db.session.scalar(notifications) == 1
+
+
+def test_rolled_back_windows_are_rebuilt(test_app, make_event):
+    event = make_event()
+    condition = {"aggregate": "count", "op": "gte", "value": 1, "window": "1m"}
+    record = {"data": {}, "timestamp": datetime(2024, 1, 1)}
+
+    with test_app.app_context():
+        add_alerts(event, [condition])
+        alert_engine.invalidate(event.id)
+        db.session.execute(db.insert(EventData), [{**record, "event_id": event.id}])
+        assert len(alert_engine.evaluate(event.id, [record])) == 1
+        db.session.rollback()
+
+        # Neither the point nor the alert having fired outlived the rollback.
+        assert len(alert_engine.windows) == 0
+        assert event.id not in alert_engine._active
+        db.session.execute(db.insert(EventData), [{**record, "event_id": event.id}])
+        assert len(alert_engine.evaluate(event.id, [record])) == 1
+        db.session.commit()
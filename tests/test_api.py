@@ -0,0 +1,211 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from apiflask import HTTPError
+from flask import Flask
+
+from event_horizon.api import cursor_link, decode_cursor, encode_cursor
+from event_horizon.extensions import db
+from event_horizon.models import EventData
+
+START = datetime(2024, 1, 1)
+
+
+def token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor(datetime(2024, 1, 2, 3, 4, 5, 6), 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (datetime(2024, 1, 2, 3, 4, 5, 6), 42)
+
+
+def test_cursor_offsets_are_converted_to_utc():
+    cursor = token(["2024-01-01T02:00:00+02:00", 1])
+
+    assert decode_cursor(cursor) == (datetime(2024, 1, 1), 1)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "not base64!",
+        base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        token("2024-01-01T00:00:00"),
+        token(["2024-01-01T00:00:00"]),
+        token(["yesterday", 1]),
+        token(["2024-01-01T00:00:00", "one"]),
+        token([20240101, 1]),
+    ],
+)
+def test_invalid_cursors_are_a_bad_request(cursor):
+    with pytest.raises(HTTPError) as e:
+        decode_cursor(cursor)
+
+    assert e.value.status_code == 400
+
+
+def test_cursor_link_keeps_the_other_arguments():
+    app = Flask(__name__)
+    with app.test_request_context("/events/1/data?order=asc&after=old&where=a&where=b"):
+        link = cursor_link("after", "new")
+
+    assert link == "/events/1/data?order=asc&after=new&where=a&where=b"
+
+
+@pytest.fixture
+def data(test_app, make_user, make_event):
+    """Adds an event with a data point every hour of the first day of 2024,
+    returning its id and the headers of its author.
+    """
+    user, headers = make_user()
+    event = make_event(user)
+    with test_app.app_context():
+        db.session.execute(
+            db.insert(EventData),
+            [
+                {
+                    "event_id": event.id,
+                    "data": {"hour": hour},
+                    "timestamp": START + timedelta(hours=hour),
+                }
+                for hour in range(24)
+            ],
+        )
+        db.session.commit()
+    return event.id, headers
+
+
+def hours(res):
+    return [row["data"]["hour"] for row in res.get_json()["data"]]
+
+
+def next_link(res):
+    links = res.get_json().get("links", [])
+    return next((link["href"] for link in links if link["rel"] == "next"), None)
+
+
+# The data view is async and reads on its own connection.
+@pytest.mark.committed
+def test_data_pages_follow_the_cursor(client, data):
+    id, headers = data
+    seen, url = [], f"/events/{id}/data?order=asc&limit=10"
+    while url:
+        res = client.get(url, headers=headers)
+        assert res.status_code == 200
+        seen += hours(res)
+        url = next_link(res)
+
+    assert seen == list(range(24))
+
+
+@pytest.mark.committed
+def test_data_is_bounded_by_from_and_to(client, data):
+    id, headers = data
+
+    res = client.get(
+        f"/events/{id}/data?from=2024-01-01T05:00:00&to=2024-01-01T08:00:00"
+        "&order=asc&limit=2",
+        headers=headers,
+    )
+    assert hours(res) == [5, 6]
+
+    following = client.get(next_link(res), headers=headers)
+    assert hours(following) == [7]
+    assert next_link(following) is None
+
+
+@pytest.mark.committed
+def test_tampered_cursor_is_a_bad_request(client, data):
+    id, headers = data
+
+    res = client.get(f"/events/{id}/data?after=tampered", headers=headers)
+
+    assert res.status_code == 400
+
+
+@pytest.mark.committed
+def test_bounds_with_an_offset_are_utc(client, data):
+    id, headers = data
+
+    res = client.get(
+        f"/events/{id}/data?from=2024-01-01T07:00:00%2B02:00&to=2024-01-01T07:00:00Z"
+        "&order=asc",
+        headers=headers,
+    )
+    assert hours(res) == [5, 6]
+
+
+@pytest.fixture
+def users(make_user):
+    """Adds an admin and four users, returning the admin's headers and the
+    emails of all five, newest first.
+    """
+    admin, headers = make_user(is_admin=True)
+    emails = [admin.email] + [make_user()[0].email for _ in range(4)]
+    return headers, emails[::-1]
+
+
+def emails(res):
+    return [user["email"] for user in res.get_json()["data"]]
+
+
+# The user list is async and reads on its own connection.
+@pytest.mark.committed
+def test_pages_are_counted(client, users):
+    headers, _ = users
+
+    res = client.get("/users?perPage=2&page=2", headers=headers)
+
+    pagination = res.get_json()["pagination"]
+    assert (pagination["total"], pagination["pages"]) == (5, 3)
+    assert pagination["next"] == "/users?perPage=2&page=3"
+    assert pagination["prev"] == "/users?perPage=2&page=1"
+    assert pagination["last"] == "/users?perPage=2&page=3"
+    assert "nextCursor" not in res.get_json()
+    assert client.get("/users?perPage=2&page=4", headers=headers).status_code == 404
+
+
+@pytest.mark.committed
+def test_pages_without_a_count_still_know_the_next(client, users):
+    headers, _ = users
+
+    first = client.get("/users?perPage=2&count=false", headers=headers)
+    last = client.get("/users?perPage=2&page=3&count=false", headers=headers)
+
+    pagination = first.get_json()["pagination"]
+    assert not {"total", "pages", "last"} & set(pagination)
+    assert pagination["next"] == "/users?perPage=2&count=false&page=2"
+    assert len(emails(last)) == 1
+    assert not last.get_json()["pagination"]["next"]
+
+
+@pytest.mark.committed
+def test_cursor_pages_are_newest_first(client, users):
+    headers, expected = users
+    seen, url = [], "/users?cursor=&perPage=2"
+    while url:
+        body = (res := client.get(url, headers=headers)).get_json()
+        assert "total" not in body["pagination"]
+        seen += emails(res)
+        url = next_link(res)
+        if url:
+            assert url.endswith(f"cursor={body['nextCursor']}&perPage=2")
+        else:
+            assert "nextCursor" not in body
+
+    assert seen == expected
+
+
+@pytest.mark.committed
+def test_cursor_pages_are_counted_on_request(client, users):
+    headers, _ = users
+
+    res = client.get("/users?cursor=&perPage=2&count=true", headers=headers)
+
+    assert res.get_json()["pagination"] == {"per_page": 2, "total": 5}
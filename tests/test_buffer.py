@@ -0,0 +1,182 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from event_horizon import buffer
+from event_horizon.buffer import RowRejected, WriteAheadLog, ingest_buffer
+from event_horizon.extensions import db
+from event_horizon.models import EventData
+
+ROWS = [
+    {"event_id": 1, "data": {"x": 1}, "timestamp": datetime(2024, 1, 1)},
+    {"event_id": 2, "data": {}, "timestamp": datetime(2024, 1, 1, tzinfo=timezone.utc)},
+]
+
+
+def test_segments_are_recovered_once_released(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    segment, end = wal.append(ROWS)
+    segment.sync(end)
+    assert segment.synced == end
+
+    # Live segments are skipped, including those of this process.
+    reader = WriteAheadLog(str(tmp_path))
+    assert list(reader.recover()) == []
+
+    old = wal.rotate()
+    old.close()
+    [(recovered, rows)] = list(reader.recover())
+    assert recovered.path == old.path
+    assert rows == ROWS
+
+    recovered.remove()
+    reader.close()
+    wal.close()
+    assert not any(tmp_path.iterdir())
+
+
+def test_recovery_stops_at_a_torn_write(tmp_path):
+    (tmp_path / "1-1.wal").write_bytes(
+        b'{"event_id":1,"data":{},"timestamp":"2024-01-01T00:00:00"}\n{"event_'
+    )
+    [(segment, rows)] = list(WriteAheadLog(str(tmp_path)).recover())
+    assert rows == [{"event_id": 1, "data": {}, "timestamp": datetime(2024, 1, 1)}]
+
+
+@pytest.fixture
+def buffering(test_app, tmp_path, monkeypatch):
+    """Returns a function turning the ingest buffer on in `mode`. It is
+    closed and turned off again after the test.
+    """
+
+    def start(mode, interval=50, rows=1000):
+        config = {
+            "INGEST_BUFFER": mode,
+            "INGEST_BUFFER_INTERVAL": interval,
+            "INGEST_BUFFER_ROWS": rows,
+            "INGEST_WAL_DIR": str(tmp_path),
+        }
+        for key, value in config.items():
+            monkeypatch.setitem(test_app.config, key, value)
+        ingest_buffer.init_app(test_app)
+
+    yield start
+    ingest_buffer.close()
+    monkeypatch.undo()
+    ingest_buffer.init_app(test_app)
+
+
+def row(event, **data):
+    return {"event_id": event.id, "data": data, "timestamp": datetime(2024, 1, 1)}
+
+
+def stored(test_app, event):
+    with test_app.app_context():
+        return db.session.scalars(
+            db.select(EventData.data)
+            .where(EventData.event_id == event.id)
+            .order_by(EventData.id)
+        ).all()
+
+
+# The flusher writes on connections of its own.
+@pytest.mark.committed
+def test_flush_writes_buffered_rows(test_app, buffering, make_event):
+    event = make_event()
+    # Long enough that only the explicit flush writes.
+    buffering("memory", interval=60_000)
+
+    assert ingest_buffer.append(row(event, n=1)) is None
+    assert ingest_buffer.append(row(event, n=2)) is None
+    assert stored(test_app, event) == []
+
+    ingest_buffer.flush()
+    assert stored(test_app, event) == [{"n": 1}, {"n": 2}]
+
+
+@pytest.mark.committed
+def test_commit_mode_returns_stored_rows_or_rejects_them(
+    test_app, buffering, make_event
+):
+    event = make_event()
+    # The batch is written once both rows are in, so they share it.
+    buffering("commit", interval=60_000, rows=2)
+
+    with ThreadPoolExecutor(2) as pool:
+        good = pool.submit(ingest_buffer.append, row(event, n=1))
+        # PostgreSQL refuses NUL characters in JSONB.
+        bad = pool.submit(ingest_buffer.append, row(event, note="\u0000"))
+
+    assert good.result()["data"] == {"n": 1}
+    assert good.result()["resource_id"] is not None
+    with pytest.raises(RowRejected):
+        bad.result()
+    assert stored(test_app, event) == [{"n": 1}]
+
+
+@pytest.mark.committed
+def test_failed_flushes_are_retried(test_app, buffering, make_event, monkeypatch):
+    event = make_event()
+    insert_rows = buffer.insert_rows
+    calls = []
+
+    def fail_once(rows, reject, returning=False):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("connection reset"))
+        return insert_rows(rows, reject, returning)
+
+    monkeypatch.setattr(buffer, "insert_rows", fail_once)
+    buffering("memory", interval=10)
+    ingest_buffer.append(row(event, n=1))
+
+    deadline = time.monotonic() + 5
+    while not stored(test_app, event) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored(test_app, event) == [{"n": 1}]
+    assert len(calls) == 2
+
+
+@pytest.mark.committed
+@pytest.mark.parametrize("mode", ["memory", "wal"])
+def test_buffered_view_accepts(client, buffering, make_user, make_event, mode):
+    user, headers = make_user()
+    event = make_event(author=user)
+    buffering(mode)
+
+    res = client.post(
+        f"/events/{event.id}/data",
+        json={"data": {"n": 1}, "timestamp": "2024-01-01T00:00:00"},
+        headers=headers,
+    )
+
+    assert res.status_code == 202
+    assert "id" not in res.get_json()["data"]
+
+
+@pytest.mark.committed
+def test_commit_mode_view_creates_or_rejects(client, buffering, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(author=user)
+    buffering("commit", interval=10)
+    url = f"/events/{event.id}/data"
+
+    res = client.post(
+        url,
+        json={"data": {"n": 1}, "timestamp": "2024-01-01T00:00:00"},
+        headers=headers,
+    )
+    assert res.status_code == 201
+    data = res.get_json()["data"]
+    assert data["data"] == {"n": 1}
+    assert data["id"]
+
+    res = client.post(
+        url,
+        json={"data": {"note": "\u0000"}, "timestamp": "2024-01-01T00:00:00"},
+        headers=headers,
+    )
+    assert res.status_code == 422
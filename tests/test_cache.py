@@ -0,0 +1,169 @@
+import time
+import uuid
+
+import pytest
+
+from event_horizon.cache import BloomFilter, TTLCache, auth_cache, response_cache
+from event_horizon.extensions import db
+from event_horizon.models import User
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", False)
+    assert cache.get("a") is False
+
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"jti-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+@pytest.mark.parametrize("bloom", [False, True])
+def test_logout_revokes_the_cached_token(
+    test_app, client, make_user, monkeypatch, bloom
+):
+    monkeypatch.setitem(test_app.config, "AUTH_BLOOM_FILTER", bloom)
+    auth_cache.init_app(test_app)
+    _, headers = make_user()
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    assert client.delete("/auth/logout", headers=headers).status_code == 200
+
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+
+def test_updating_a_user_drops_the_cached_one(test_app, client, make_user):
+    user, headers = make_user()
+    client.get("/auth/me", headers=headers)
+    assert auth_cache.users.get(user.email) is not None
+
+    with test_app.app_context():
+        db.session.get(User, user.id).fname = "New"
+        db.session.commit()
+
+    assert auth_cache.users.get(user.email) is None
+    res = client.get("/auth/me", headers=headers)
+    assert res.get_json()["data"]["fname"] == "New"
+
+
+def test_changing_the_email_drops_the_old_one(test_app, client, make_user):
+    user, headers = make_user()
+    client.get("/auth/me", headers=headers)
+
+    with test_app.app_context():
+        db.session.get(User, user.id).email = "renamed@example.com"
+        db.session.commit()
+
+    assert auth_cache.users.get(user.email) is None
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+
+def test_deleting_a_user_drops_the_cached_one(test_app, client, make_user):
+    user, headers = make_user()
+    client.get("/auth/me", headers=headers)
+
+    with test_app.app_context():
+        db.session.delete(db.session.get(User, user.id))
+        db.session.commit()
+
+    assert auth_cache.users.get(user.email) is None
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+
+def counts():
+    return response_cache.hits, response_cache.misses
+
+
+def test_cached_responses_are_counted_and_tagged(client, make_user):
+    _, headers = make_user()
+    hits, misses = counts()
+
+    first = client.get("/events", headers=headers)
+    second = client.get("/events", headers=headers)
+
+    assert counts() == (hits + 1, misses + 1)
+    assert first.data == second.data
+    assert first.headers["ETag"] and first.headers["ETag"] == second.headers["ETag"]
+
+
+def test_matching_etag_is_not_modified(client, make_user):
+    _, headers = make_user()
+    etag = client.get("/events", headers=headers).headers["ETag"]
+
+    for tag in (etag, f"W/{etag}"):
+        res = client.get("/events", headers={**headers, "If-None-Match": tag})
+        assert res.status_code == 304
+        assert res.data == b""
+    stale = client.get("/events", headers={**headers, "If-None-Match": '"stale"'})
+    assert stale.status_code == 200
+
+
+def test_errors_are_not_cached(client, make_user):
+    _, headers = make_user()
+    _, misses = counts()
+
+    for _ in range(2):
+        res = client.get(f"/users/{uuid.uuid4()}", headers=headers)
+        assert res.status_code == 404
+
+    assert counts()[1] == misses + 2
+
+
+# The list views are async and read on their own connections.
+@pytest.mark.committed
+def test_invalidation_drops_every_page_of_the_namespace(client, make_user):
+    _, headers = make_user(is_admin=True)
+    before = {
+        page: client.get(f"/users?perPage=1&page={page}", headers=headers).get_json()
+        for page in (1, 2)
+    }
+    res = client.post(
+        "/users",
+        json={"fname": "New", "password": "Password123!", "email": "new@example.com"},
+        headers=headers,
+    )
+    assert res.status_code == 201
+
+    after = {
+        page: client.get(f"/users?perPage=1&page={page}", headers=headers).get_json()
+        for page in (1, 2)
+    }
+    assert before[1]["pagination"]["total"] == 1
+    assert after[1]["pagination"]["total"] == 2
+    assert after[2]["data"][0]["email"] == "new@example.com"
+
+
+@pytest.mark.committed
+def test_user_list_is_shared_by_admins(client, make_user):
+    _, headers = make_user(is_admin=True)
+    _, other = make_user(is_admin=True)
+    hits, _ = counts()
+
+    first = client.get("/users", headers=headers)
+    second = client.get("/users", headers=other)
+
+    assert counts()[0] == hits + 1
+    assert first.data == second.data
+    assert client.get("/users", headers=make_user()[1]).status_code == 403
@@ -0,0 +1,35 @@
+import uuid
+
+import pytest
+
+from event_horizon.extensions import db
+from event_horizon.models import User
+
+
+def add_user():
+    user = User(email=f"{uuid.uuid4().hex[:12]}@example.com", password="Password123!")
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def count_users(conn):
+    return conn.scalar(db.select(db.func.count(User.id)))
+
+
+@pytest.mark.committed
+def test_committed_rows_are_seen_by_other_connections(test_app):
+    with test_app.app_context():
+        add_user()
+        with db.engine.connect() as conn:
+            assert count_users(conn) == 1
+
+
+@pytest.mark.parametrize("attempt", [1, 2])
+def test_every_test_starts_from_the_template(test_app, attempt):
+    with test_app.app_context():
+        assert count_users(db.session) == 0
+        id = add_user()
+
+    with test_app.app_context():
+        assert db.session.get(User, id) is not None
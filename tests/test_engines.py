@@ -0,0 +1,141 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from event_horizon.engines import (
+    WAIT_BUCKETS,
+    QueryBudgetExceeded,
+    RoutingSession,
+    TimedQueuePool,
+    count_queries,
+    pool_stats,
+)
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+class Note(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app whose primary and replica are two SQLite databases, each
+    holding a note with its own name.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'primary.db'}"
+    app.config["SQLALCHEMY_BINDS"] = {"replica": f"sqlite:///{tmp_path / 'replica.db'}"}
+    db.init_app(app)
+    with app.app_context():
+        for name, engine in (
+            ("primary", db.engine),
+            ("replica", db.engines["replica"]),
+        ):
+            with engine.begin() as conn:
+                db.metadata.create_all(conn)
+                conn.execute(db.insert(Note).values(name=name))
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def names(engine):
+    with engine.connect() as conn:
+        return conn.scalars(db.select(Note.name).order_by(Note.id)).all()
+
+
+@pytest.mark.parametrize(
+    "method, expected", [("GET", "replica"), ("HEAD", "replica"), ("POST", "primary")]
+)
+def test_reads_of_get_requests_go_to_the_replica(app, method, expected):
+    with app.test_request_context(method=method):
+        assert db.session.scalar(db.select(Note.name)) == expected
+
+
+def test_reads_outside_requests_go_to_the_primary(app):
+    with app.app_context():
+        assert db.session.scalar(db.select(Note.name)) == "primary"
+
+
+def test_writes_of_get_requests_go_to_the_primary(app):
+    with app.test_request_context(method="GET"):
+        db.session.add(Note(name="flushed"))
+        # The autoflush before the read goes to the primary, the read itself
+        # to the replica, which has not seen the note.
+        assert db.session.scalars(db.select(Note.name)).all() == ["replica"]
+        db.session.execute(db.insert(Note).values(name="inserted"))
+        db.session.commit()
+
+        assert names(db.engine) == ["primary", "flushed", "inserted"]
+        assert names(db.engines["replica"]) == ["replica"]
+
+
+def test_bound_session_uses_only_its_bind(app):
+    with app.test_request_context(method="GET"):
+        with db.engine.connect() as conn:
+            session = RoutingSession(db, bind=conn)
+            assert session.scalar(db.select(Note.name)) == "primary"
+            session.close()
+
+
+def test_timed_pool_records_waits_and_timeouts():
+    engine = create_engine(
+        "sqlite://",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    with engine.connect():
+        # The only connection is checked out, so this one waits until the
+        # pool timeout and gives up.
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    with engine.connect():
+        pass
+
+    wait = pool_stats({"default": engine})["default"]["wait"]
+    assert wait["checkouts"] == 3
+    assert wait["timeouts"] == 1
+    assert wait["wait_seconds_max"] >= 0.05
+    assert wait["wait_seconds_total"] >= wait["wait_seconds_max"]
+    assert sum(wait["buckets"].values()) == 3
+    assert wait["buckets"][str(WAIT_BUCKETS[-1])] == 0
+
+    # The stats survive the pool being replaced, as on `dispose()`.
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert engine.pool.wait_stats.count == 4
+
+
+def test_count_queries():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        with count_queries(budget=2) as statements:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        assert statements == ["SELECT 1", "SELECT 2"]
+
+        with pytest.raises(QueryBudgetExceeded, match="3 queries, budget is 2"):
+            with count_queries(budget=2):
+                for _ in range(3):
+                    conn.execute(text("SELECT 1"))
+
+        # Listening stops at the end of the block.
+        conn.execute(text("SELECT 3"))
+        assert len(statements) == 2
+
+
+async def test_count_queries_async():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    with count_queries() as statements:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await engine.dispose()
+    assert statements == ["SELECT 1"]
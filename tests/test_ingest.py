@@ -0,0 +1,160 @@
+import io
+import json
+
+import pytest
+
+from event_horizon.extensions import db
+from event_horizon.ingest import (
+    LineTooLong,
+    ingest_records,
+    iter_lines,
+    parse_csv,
+    parse_ndjson,
+)
+from event_horizon.models import EventData
+
+
+def stored(event_id):
+    stmt = db.select(EventData.data).where(EventData.event_id == event_id)
+    return sorted(data["n"] for data in db.session.scalars(stmt))
+
+
+def test_iter_lines_splits_across_chunks():
+    stream = io.BytesIO(b"a,b\n1,2\n3")
+
+    assert list(iter_lines(stream, chunk_size=3)) == ["a,b\n", "1,2\n", "3"]
+
+
+def test_iter_lines_caps_the_line_length():
+    lines = iter_lines(io.BytesIO(b"short\n" + b"x" * 100), chunk_size=8, max_line=10)
+
+    assert next(lines) == "short\n"
+    with pytest.raises(LineTooLong):
+        next(lines)
+
+
+def test_parse_csv_converts_only_json_numbers():
+    lines = [
+        "timestamp,count,ratio,code,missing,big,note\n",
+        "2024-01-01T00:00:00,-3,1.5e2,007,nan,1e999,inf\n",
+    ]
+
+    (record,) = parse_csv(lines)
+
+    assert record["timestamp"] == "2024-01-01T00:00:00"
+    assert record["data"] == {
+        "count": -3,
+        "ratio": 150.0,
+        "code": "007",
+        "missing": "nan",
+        "big": "1e999",
+        "note": "inf",
+    }
+
+
+def test_parse_ndjson_rejects_non_finite_numbers():
+    records = list(parse_ndjson(['{"n": 1}\n', "\n", '{"n": NaN}\n']))
+
+    assert records[0] == {"n": 1}
+    assert len(records) == 2
+    assert records[1].messages == {"_schema": ["Invalid JSON."]}
+
+
+def test_chunks_fall_back_to_rows_to_reject_only_the_bad_one(test_app, make_event):
+    event = make_event()
+    records = [{"data": {"n": n}, "timestamp": "2024-01-01T00:00:00"} for n in range(5)]
+    records[1] = {"data": {"n": 1}}  # Fails validation.
+    records[3]["data"]["text"] = "\u0000"  # Fails in the database.
+
+    with test_app.app_context():
+        result = ingest_records(event.id, records, chunk_size=2)
+
+        assert result.accepted == 3
+        assert result.rejected == 2
+        assert [error["index"] for error in result.errors] == [1, 3]
+        assert stored(event.id) == [0, 2, 4]
+
+
+def test_errors_are_capped(test_app, make_event):
+    event = make_event()
+
+    with test_app.app_context():
+        result = ingest_records(event.id, [{}] * 5, max_errors=2)
+
+    assert result.rejected == 5
+    assert len(result.errors) == 2
+
+
+def test_batch_view_accepts_ndjson(test_app, client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+    lines = [
+        json.dumps({"data": {"n": 0}, "timestamp": "2024-01-01T00:00:00"}),
+        "{not json",
+        json.dumps({"data": {"n": 2}, "timestamp": "2024-01-01T00:00:00"}),
+    ]
+
+    res = client.post(
+        f"/events/{event.id}/data:batch",
+        data="\n".join(lines),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert res.status_code == 200
+    body = res.get_json()["data"]
+    assert (body["accepted"], body["rejected"]) == (2, 1)
+    assert body["errors"][0]["index"] == 1
+    with test_app.app_context():
+        assert stored(event.id) == [0, 2]
+
+
+def test_batch_view_requires_an_array(client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+
+    res = client.post(f"/events/{event.id}/data:batch", json={}, headers=headers)
+
+    assert res.status_code == 400
+
+
+def test_stream_view_reads_csv(test_app, client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+    body = "timestamp,n\n2024-01-01T00:00:00,0\nnot a date,1\n2024-01-01T00:00:00,2\n"
+
+    res = client.post(
+        f"/events/{event.id}/data:stream",
+        data=body,
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+
+    assert res.status_code == 200
+    body = res.get_json()["data"]
+    assert (body["accepted"], body["rejected"]) == (2, 1)
+    with test_app.app_context():
+        assert stored(event.id) == [0, 2]
+
+
+def test_stream_view_rejects_long_lines(
+    test_app, client, make_user, make_event, monkeypatch
+):
+    user, headers = make_user()
+    event = make_event(user)
+    monkeypatch.setitem(test_app.config, "INGEST_MAX_LINE", 16)
+
+    res = client.post(
+        f"/events/{event.id}/data:stream",
+        data=json.dumps({"data": {"text": "x" * 100}}),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+
+    assert res.status_code == 413
+
+
+def test_stream_view_requires_csv_or_ndjson(client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+
+    res = client.post(f"/events/{event.id}/data:stream", json=[], headers=headers)
+
+    assert res.status_code == 415
@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Flask, current_app
+
+from event_horizon.jobs import JobQueue
+
+
+def make_queue(mode):
+    app = Flask(__name__)
+    app.config.update(
+        JOB_QUEUE=mode,
+        JOB_WORKERS=1,
+        FLASK_ENV="test",
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+    )
+    return app, JobQueue(app)
+
+
+def app_name():
+    return current_app.name
+
+
+def test_sync_jobs_run_inline():
+    app, queue = make_queue("sync")
+
+    with app.app_context():
+        assert queue.submit(app_name) == app.name
+    assert queue.executor is None
+
+
+def test_thread_jobs_run_in_the_app():
+    app, queue = make_queue("thread")
+
+    assert queue.submit(app_name).result(timeout=5) == app.name
+    queue.executor.shutdown()
+
+
+def test_process_pool_is_created_on_first_use():
+    _, queue = make_queue("process")
+    assert queue.executor is None
+
+    executor = queue._executor()
+
+    assert isinstance(executor, ProcessPoolExecutor)
+    assert queue._executor() is executor
+    executor.shutdown()
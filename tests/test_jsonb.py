@@ -0,0 +1,111 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from event_horizon.alerting import ConditionError, compile_condition
+from event_horizon.extensions import db
+from event_horizon.jsonb import parse_where, to_sql
+from event_horizon.models import EventData
+
+
+def _sql(spec):
+    compiled = to_sql(EventData.data, parse_where(spec)).compile(
+        dialect=postgresql.dialect()
+    )
+    return str(compiled), compiled.params
+
+
+def test_parse_where():
+    assert parse_where("data.region:eq:us-east") == {
+        "field": "data.region",
+        "op": "eq",
+        "value": "us-east",
+    }
+    assert parse_where("data.latency:gt:500")["value"] == 500
+    assert parse_where('data.code:eq:"500"')["value"] == "500"
+    assert parse_where("data.tier:in:1,gold")["value"] == [1, "gold"]
+    assert parse_where("data.trace:exists") == {"field": "data.trace", "op": "exists"}
+    with pytest.raises(ConditionError):
+        parse_where("data.region:like:us")
+    with pytest.raises(ConditionError):
+        parse_where("data.region:eq")
+
+
+def test_equality_uses_containment():
+    sql, params = _sql("data.geo.region:eq:us-east")
+    assert sql == "event_data.data @> %(param_1)s"
+    assert params == {"param_1": {"geo": {"region": "us-east"}}}
+
+
+def test_range_compares_typed_jsonb():
+    sql, params = _sql("data.latency:gte:500")
+    assert "jsonb_typeof((event_data.data #> %(param_1)s))" in sql
+    assert "(event_data.data #> %(param_1)s) >= %(param_2)s" in sql
+    assert params["jsonb_typeof_1"] == "number"
+
+
+def test_string_range_compares_code_points():
+    sql, params = _sql("data.region:lt:eu")
+    assert '((event_data.data #>> %(param_2)s) COLLATE "C") < %(param_3)s' in sql
+    assert params["param_3"] == "eu"
+
+
+def test_only_data_fields():
+    with pytest.raises(ConditionError):
+        _sql("timestamp:gt:1")
+
+
+PAYLOADS = [
+    {"region": "a"},
+    {"region": "B"},
+    {"region": "Z"},
+    {"region": "aa"},
+    {"region": "\u00e9"},
+    {"region": 5},
+    {"region": True},
+    {"region": None},
+    {"tags": ["a", "b"], "geo": {"region": "a"}},
+    {},
+]
+
+
+def canonical(data):
+    return json.dumps(data, sort_keys=True)
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "data.region:gt:B",
+        "data.region:lte:a",
+        "data.region:gte:5",
+        "data.region:eq:a",
+        "data.region:ne:a",
+        "data.region:in:a,5",
+        "data.tags:contains:b",
+        "data.region:exists",
+        "data.geo.region:eq:a",
+    ],
+)
+def test_queries_match_the_alert_predicates(test_app, make_event, spec):
+    event = make_event()
+    condition = parse_where(spec)
+    predicate = compile_condition(condition)
+
+    with test_app.app_context():
+        db.session.execute(
+            db.insert(EventData),
+            [
+                {"event_id": event.id, "data": data, "timestamp": datetime(2024, 1, 1)}
+                for data in PAYLOADS
+            ],
+        )
+        stmt = db.select(EventData.data).where(
+            EventData.event_id == event.id, to_sql(EventData.data, condition)
+        )
+        matched = db.session.scalars(stmt).all()
+
+    expected = [data for data in PAYLOADS if predicate({"data": data})]
+    assert sorted(map(canonical, matched)) == sorted(map(canonical, expected))
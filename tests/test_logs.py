@@ -0,0 +1,48 @@
+import logging
+import sys
+
+import orjson
+import pytest
+
+from event_horizon.logs import BoundedQueueHandler, JSONFormatter
+
+
+def _record(message, **extra):
+    return logging.makeLogRecord({"msg": message, "levelname": "INFO", **extra})
+
+
+@pytest.mark.parametrize(
+    "policy, kept", [("drop_new", ["a", "b"]), ("drop_oldest", ["b", "c"])]
+)
+def test_full_queue_drops_records(policy, kept):
+    handler = BoundedQueueHandler(2, policy)
+    for message in "abc":
+        handler.emit(_record(message))
+
+    assert handler.dropped == 1
+    assert handler.depth == 2
+    assert [handler.queue.get_nowait().msg for _ in kept] == kept
+
+
+def test_unknown_drop_policy():
+    with pytest.raises(ValueError):
+        BoundedQueueHandler(2, "discard")
+
+
+def test_json_formatter_includes_extra_fields_and_exception():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "failed %s", ("twice",), None
+        )
+        record.exc_info = sys.exc_info()
+    record.request_id = "abc"
+    record = BoundedQueueHandler(1).prepare(record)
+
+    entry = orjson.loads(JSONFormatter().format(record))
+
+    assert entry["message"] == "failed twice"
+    assert entry["level"] == "ERROR"
+    assert entry["request_id"] == "abc"
+    assert "ZeroDivisionError" in entry["exception"]
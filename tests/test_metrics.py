@@ -0,0 +1,55 @@
+from event_horizon.metrics import Counter, Histogram, Metrics
+
+
+def test_histogram_samples_are_cumulative():
+    histogram = Histogram("latency", "Latency.", ("route",), (0.1, 1.0, float("inf")))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, ("a",))
+
+    assert list(histogram.samples()) == [
+        ("latency_bucket", {"route": "a", "le": 0.1}, 1),
+        ("latency_bucket", {"route": "a", "le": 1.0}, 3),
+        ("latency_bucket", {"route": "a", "le": float("inf")}, 4),
+        ("latency_sum", {"route": "a"}, 4.25),
+        ("latency_count", {"route": "a"}, 4),
+    ]
+
+
+def test_render_text_format():
+    metrics = Metrics()
+    metrics.collectors.clear()
+    metrics.families.clear()
+    counter = metrics.counter("hits_total", "Hits.", ("path",))
+    counter.inc(('/a"b\\',), 2)
+    histogram = metrics.histogram("wait_seconds", "Wait.", buckets=(1, float("inf")))
+    histogram.observe(0.5)
+    metrics.collector(lambda: [Counter("collected_total", "Collected.")])
+
+    assert metrics.render() == (
+        "# HELP hits_total Hits.\n"
+        "# TYPE hits_total counter\n"
+        'hits_total{path="/a\\"b\\\\"} 2\n'
+        "# HELP wait_seconds Wait.\n"
+        "# TYPE wait_seconds histogram\n"
+        'wait_seconds_bucket{le="1"} 1\n'
+        'wait_seconds_bucket{le="+Inf"} 1\n'
+        "wait_seconds_sum 0.5\n"
+        "wait_seconds_count 1\n"
+        "# HELP collected_total Collected.\n"
+        "# TYPE collected_total counter\n"
+    )
+
+
+def test_endpoint_needs_the_token(test_app, client, monkeypatch):
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setitem(test_app.config, "METRICS_ENABLED", True)
+    monkeypatch.setitem(test_app.config, "METRICS_TOKEN", "scraper-token")
+    assert client.get("/metrics").status_code == 401
+    headers = {"Authorization": "Bearer other"}
+    assert client.get("/metrics", headers=headers).status_code == 401
+
+    headers = {"Authorization": "Bearer scraper-token"}
+    res = client.get("/metrics", headers=headers)
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain")
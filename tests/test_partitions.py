@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from event_horizon.extensions import db
+from event_horizon.models import Event, EventData, User
+from event_horizon.partitions import add_months, month_start, partition_name
+
+
+def test_month_arithmetic():
+    month = month_start(datetime(2024, 11, 17, 8, 30))
+    assert month == datetime(2024, 11, 1)
+    assert add_months(month, 1) == datetime(2024, 12, 1)
+    assert add_months(month, 2) == datetime(2025, 1, 1)
+    assert add_months(month, -11) == datetime(2023, 12, 1)
+
+
+def test_partition_name():
+    assert partition_name(datetime(2024, 3, 1)) == "event_data_y2024m03"
+
+
+def test_primary_key_includes_the_partition_key_only_on_postgresql():
+    table = EventData.__table__
+    assert [c.name for c in table.primary_key.columns] == ["id"]
+
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+    assert "PARTITION BY RANGE (timestamp)" in ddl
+
+
+def test_schema_is_created_on_sqlite():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        user = User(email="sqlite@example.com", password="Password123!")
+        session.add(user)
+        session.flush()
+        event = Event("e", "d", datetime(2024, 1, 1), datetime(2024, 2, 1), user.id)
+        session.add(event)
+        session.flush()
+        rows = [EventData(event.id, {"x": i}, datetime(2024, 1, 1)) for i in range(2)]
+        session.add_all(rows)
+        session.commit()
+
+        assert [row.id for row in rows] == [1, 2]
+        assert rows[0].resource_id != rows[1].resource_id
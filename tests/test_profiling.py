@@ -0,0 +1,34 @@
+import itertools
+import time
+
+from event_horizon.profiling import Profile, _profile, profiled
+
+
+def test_profiled_counts_nested_phases_once(monkeypatch):
+    with profiled("validation"):
+        pass  # No profile: a no-op.
+
+    # A clock that advances by one per reading: the outer block spans one
+    # tick, and timing the nested block as well would add more.
+    monkeypatch.setattr(time, "perf_counter", itertools.count().__next__)
+    profile = Profile(sampled=True, max_statements=1)
+    _profile.set(profile)
+    try:
+        with profiled("serialization"):
+            with profiled("serialization"):
+                pass
+    finally:
+        _profile.set(None)
+
+    assert profile.phases["serialization"] == 1
+    assert profile.phases["validation"] == 0.0
+
+
+def test_statements_are_capped():
+    profile = Profile(sampled=False, max_statements=1)
+    profile.record_statement("SELECT 1", 0.5)
+    profile.record_statement("SELECT 2", 0.25)
+
+    assert profile.statements == [{"sql": "SELECT 1", "seconds": 0.5}]
+    assert profile.dropped_statements == 1
+    assert profile.phases["sql"] == 0.75
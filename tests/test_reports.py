@@ -0,0 +1,200 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from event_horizon import reports
+from event_horizon.extensions import db
+from event_horizon.models import EventData, Report
+from event_horizon.reports import generate_report
+
+# Status is written on a separate connection, which only sees committed rows.
+pytestmark = pytest.mark.committed
+
+
+@pytest.fixture
+def report_dir(test_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_app.config, "REPORT_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def statuses(monkeypatch):
+    """Records the status of every update of a report."""
+    seen = []
+    update = reports._update
+
+    def record(report_id, generation, **values):
+        if "status" in values:
+            seen.append(values["status"])
+        return update(report_id, generation, **values)
+
+    monkeypatch.setattr(reports, "_update", record)
+    return seen
+
+
+@pytest.fixture
+def event(test_app, make_event):
+    event = make_event()
+    start = datetime(2024, 1, 1)
+    with test_app.app_context():
+        db.session.execute(
+            db.insert(EventData),
+            [
+                {
+                    "event_id": event.id,
+                    "data": {"n": n},
+                    "timestamp": start + timedelta(n),
+                }
+                for n in range(3)
+            ],
+        )
+        db.session.commit()
+    return event
+
+
+def add_report(event, format="csv"):
+    report = Report(event.author_id, event.id, {}, format)
+    db.session.add(report)
+    db.session.commit()
+    return report.id
+
+
+def test_reports_go_from_pending_to_done(test_app, report_dir, statuses, event):
+    with test_app.app_context():
+        id = add_report(event)
+        assert db.session.get(Report, id).status == "pending"
+
+        generate_report(id)
+
+        db.session.expire_all()
+        report = db.session.get(Report, id)
+        assert statuses == ["running", "done"]
+        assert report.rows_written == 3
+        with open(report.file_path) as f:
+            assert len(f.readlines()) == 4
+        assert os.listdir(report_dir) == [os.path.basename(report.file_path)]
+
+
+def test_failed_reports_leave_no_partial_file(
+    test_app, report_dir, statuses, event, monkeypatch
+):
+    def fail(out, report_id, generation, rows):
+        out.write("id,timestamp,data\n")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(reports, "_write_csv", fail)
+    with test_app.app_context():
+        id = add_report(event)
+
+        with pytest.raises(OSError):
+            generate_report(id)
+
+        db.session.expire_all()
+        report = db.session.get(Report, id)
+        assert statuses == ["running", "failed"]
+        assert (report.error, report.file_path) == ("disk full", None)
+    assert os.listdir(report_dir) == []
+
+
+def test_superseded_jobs_do_not_publish(
+    test_app, report_dir, statuses, event, monkeypatch
+):
+    write_csv = reports._write_csv
+
+    def regenerate_midway(out, report_id, generation, rows):
+        written = write_csv(out, report_id, generation, rows)
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(Report)
+                .where(Report.id == report_id)
+                .values(status="pending", generation=Report.generation + 1)
+            )
+        return written
+
+    monkeypatch.setattr(reports, "_write_csv", regenerate_midway)
+    with test_app.app_context():
+        id = add_report(event)
+
+        generate_report(id, 0)
+
+        db.session.expire_all()
+        report = db.session.get(Report, id)
+        # The job tried to finish, but the report kept its new generation.
+        assert statuses == ["running", "done"]
+        assert (report.status, report.file_path) == ("pending", None)
+        assert os.listdir(report_dir) == []
+
+        # A job of an older generation does not even start.
+        monkeypatch.setattr(reports, "_write_csv", write_csv)
+        generate_report(id, 0)
+        db.session.expire_all()
+        assert db.session.get(Report, id).status == "pending"
+        assert os.listdir(report_dir) == []
+
+
+def test_sync_queue_generates_on_create(client, report_dir, event):
+    res = client.post(
+        "/reports",
+        json={
+            "userId": event.author_id,
+            "eventId": event.id,
+            "filters": {"from": "2024-01-02T00:00:00"},
+            "format": "json",
+        },
+    )
+
+    assert res.status_code == 201
+    data = client.get(f"/reports/{res.get_json()['data']['id']}").get_json()["data"]
+    assert (data["status"], data["rowsWritten"]) == ("done", 2)
+
+
+def test_regenerated_reports_replace_their_file(client, report_dir, event):
+    res = client.post(
+        "/reports",
+        json={
+            "userId": event.author_id,
+            "eventId": event.id,
+            "filters": {},
+            "format": "json",
+        },
+    )
+    url = f"/reports/{res.get_json()['data']['id']}"
+
+    res = client.patch(url, json={"format": "csv"})
+
+    assert res.status_code == 200
+    data = client.get(url).get_json()["data"]
+    assert (data["status"], data["rowsWritten"]) == ("done", 3)
+    assert [name.rsplit(".", 1)[1] for name in os.listdir(report_dir)] == ["csv"]
+
+
+def test_report_links_to_its_event(test_app, client, event):
+    with test_app.app_context():
+        add_report(event)
+        resource_id = db.session.scalar(db.select(Report.resource_id))
+
+    res = client.get(f"/reports/{resource_id}")
+
+    assert res.status_code == 200
+    assert res.get_json()["links"] == [
+        {"rel": "events", "href": f"/events/{event.resource_id}"}
+    ]
+
+
+def test_only_the_owner_and_admins_download(
+    test_app, client, report_dir, make_user, make_event
+):
+    owner, owner_headers = make_user()
+    _, other_headers = make_user()
+    _, admin_headers = make_user(is_admin=True)
+    event = make_event(owner)
+    with test_app.app_context():
+        id = add_report(event)
+        generate_report(id)
+        resource_id = db.session.get(Report, id).resource_id
+    url = f"/reports/{resource_id}/download"
+
+    assert client.get(url, headers=owner_headers).status_code == 200
+    assert client.get(url, headers=other_headers).status_code == 403
+    assert client.get(url, headers=admin_headers).status_code == 200
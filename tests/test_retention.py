@@ -0,0 +1,96 @@
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+from marshmallow import ValidationError
+
+from event_horizon import rollups
+from event_horizon.extensions import db
+from event_horizon.ingest import ingest_records
+from event_horizon.models import EventData, EventRollup
+from event_horizon.retention import cutoffs, enforce, validate_retention
+
+NOW = datetime(2024, 6, 1)
+
+
+def test_cutoffs_merge_event_policy_over_defaults():
+    result = cutoffs(
+        {"raw": "30d", "day": None}, {"minute": "365d", "day": "2000d"}, NOW
+    )
+    assert result == {
+        "raw": NOW - timedelta(days=30),
+        "minute": NOW - timedelta(days=365),
+        "hour": None,
+        "day": None,
+    }
+
+
+def test_validate_retention():
+    validate_retention({"raw": "30d", "minute": None})
+    with pytest.raises(ValidationError):
+        validate_retention({"seconds": "30d"})
+    with pytest.raises(ValidationError):
+        validate_retention({"raw": "a month"})
+
+
+def timestamps(event_id):
+    stmt = (
+        db.select(EventData.timestamp)
+        .where(EventData.event_id == event_id)
+        .order_by(EventData.timestamp)
+    )
+    return db.session.scalars(stmt).all()
+
+
+# Deletes commit every batch.
+@pytest.mark.committed
+def test_batched_deletes_stop_at_the_cutoff(test_app, make_event, monkeypatch):
+    monkeypatch.setitem(test_app.config, "RETENTION_BATCH_SIZE", 2)
+    expiring = make_event(retention={"raw": "1d", "hour": "1d"})
+    kept = make_event()
+    cutoff = NOW - timedelta(days=1)
+    seconds = (-7200, -60, -2, -1, -1, 0, 1, 3600)
+    records = [
+        {"data": {"v": 1}, "timestamp": (cutoff + timedelta(seconds=s)).isoformat()}
+        for s in seconds
+    ]
+
+    with test_app.app_context():
+        for event in (expiring, kept):
+            assert ingest_records(event.id, records).accepted == len(seconds)
+
+        removed = enforce(now=NOW)
+
+        # Two hours before the cutoff, each with a `*` and a `v` rollup.
+        assert (removed["raw"], removed["hour"], removed["minute"]) == (5, 4, 0)
+        assert timestamps(expiring.id) == [
+            cutoff,
+            cutoff + timedelta(seconds=1),
+            cutoff + timedelta(hours=1),
+        ]
+        hours = db.select(EventRollup.bucket).where(
+            EventRollup.event_id == expiring.id, EventRollup.granularity == "hour"
+        )
+        assert set(db.session.scalars(hours)) == {cutoff, cutoff + timedelta(hours=1)}
+        assert len(timestamps(kept.id)) == 8
+
+
+@pytest.mark.committed
+def test_rebuilt_rollups_keep_days_past_raw_retention(test_app, make_event):
+    event = make_event(retention={"raw": "1d"})
+    today = datetime.combine(datetime.now(timezone.utc).date(), time())
+    records = [
+        {"data": {"v": 1}, "timestamp": (today - timedelta(days=d)).isoformat()}
+        for d in (3, 0)
+    ]
+    days = db.select(EventRollup.bucket).where(
+        EventRollup.event_id == event.id,
+        EventRollup.granularity == "day",
+        EventRollup.field == "v",
+    )
+
+    with test_app.app_context():
+        ingest_records(event.id, records)
+        assert enforce()["raw"] == 1
+        rollups.rebuild(event.id)
+
+        assert sorted(db.session.scalars(days)) == [today - timedelta(days=3), today]
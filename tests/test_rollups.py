@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+
+from event_horizon import rollups
+from event_horizon.extensions import db
+from event_horizon.models import EventData, EventRollup
+from event_horizon.rollups import RECORDS, RollupWriter, aggregate
+
+START = datetime(2024, 1, 1)
+
+
+def _rows(rows, granularity, field):
+    return [
+        row
+        for row in rows
+        if row["granularity"] == granularity and row["field"] == field
+    ]
+
+
+def test_aggregate_buckets_numeric_fields():
+    records = [
+        {
+            "timestamp": START + timedelta(seconds=30 * i),
+            "data": {"latency": i, "ok": True, "name": "x"},
+        }
+        for i in range(240)
+    ]
+    rows = aggregate(1, records)
+
+    minutes = _rows(rows, "minute", "latency")
+    assert len(minutes) == 120
+    assert minutes[0] == {
+        "event_id": 1,
+        "granularity": "minute",
+        "bucket": START,
+        "field": "latency",
+        "count": 2,
+        "sum": 1.0,
+        "min": 0,
+        "max": 1,
+    }
+
+    [hour, next_hour] = _rows(rows, "hour", "latency")
+    assert (hour["count"], hour["min"], hour["max"]) == (120, 0, 119)
+    assert next_hour["bucket"] == START + timedelta(hours=1)
+
+    [day] = _rows(rows, "day", RECORDS)
+    assert day["count"] == 240
+    assert day["min"] is None
+
+    # Booleans and strings are not aggregated.
+    assert not _rows(rows, "day", "ok")
+    assert not _rows(rows, "day", "name")
+
+
+def test_aggregate_normalizes_timezones():
+    records = [
+        {"timestamp": datetime(2024, 1, 1, 1, 30, tzinfo=timezone(timedelta(hours=2)))}
+    ]
+    [hour] = _rows(aggregate(1, records), "hour", RECORDS)
+    assert hour["bucket"] == datetime(2023, 12, 31, 23)
+
+
+def test_rollups_are_off_on_other_databases():
+    app = Flask(__name__)
+    app.config.update(
+        ROLLUPS_ENABLED=True, SQLALCHEMY_DATABASE_URI="mysql://localhost/events"
+    )
+
+    assert not RollupWriter(app).enabled
+
+
+def stored_rollups(event_id):
+    stmt = db.select(EventRollup).where(EventRollup.event_id == event_id)
+    columns = ("granularity", "bucket", "field", "count", "sum", "min", "max")
+    return sorted(
+        tuple(getattr(rollup, c) for c in columns)
+        for rollup in db.session.scalars(stmt)
+    )
+
+
+def test_replacing_data_recomputes_its_days(test_app, client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+    body = [
+        {"data": {"v": v}, "timestamp": f"2024-01-0{day}T12:00:00"}
+        for day, v in ((1, 5), (1, 7), (2, 9))
+    ]
+    res = client.post(f"/events/{event.id}/data:batch", json=body, headers=headers)
+    assert res.get_json()["data"]["accepted"] == 3
+    with test_app.app_context():
+        first = db.session.scalar(
+            db.select(EventData.id)
+            .where(EventData.event_id == event.id)
+            .order_by(EventData.id)
+        )
+
+    res = client.put(
+        f"/events/{event.id}/data/{first}",
+        json={"data": {"v": 1}, "timestamp": "2024-01-03T00:00:00"},
+        headers=headers,
+    )
+
+    assert res.status_code == 200
+    with test_app.app_context():
+        after = stored_rollups(event.id)
+        rollups.rebuild(event.id)
+        assert after == stored_rollups(event.id)
+    assert ("day", START, "v", 1, 7.0, 7.0, 7.0) in after
+
+
+def test_replacing_missing_data_is_not_found(client, make_user, make_event):
+    user, headers = make_user()
+    event = make_event(user)
+
+    res = client.put(
+        f"/events/{event.id}/data/1",
+        json={"data": {}, "timestamp": "2024-01-01T00:00:00"},
+        headers=headers,
+    )
+
+    assert res.status_code == 404
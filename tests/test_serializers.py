@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from event_horizon.api import ResponseSchema
+from event_horizon.api.alert.schemas import AlertDTO
+from event_horizon.api.event.schemas import EventDataDTO, EventDTO
+from event_horizon.api.report.schemas import ReportDTO
+from event_horizon.api.user.schemas import UserDTO
+from event_horizon.models import Alert, Event, EventData, Report, User
+from event_horizon.serializers import RowSerializer
+
+NOW = datetime(2024, 5, 17, 9, 30, 12, 250)
+
+
+def _metadata(obj, id):
+    obj.id = id
+    obj.resource_id = uuid.UUID(int=id)
+    obj.created_at = NOW
+    obj.updated_at = None
+    return obj
+
+
+EXAMPLES = [
+    (
+        UserDTO(),
+        User,
+        User(email="a@example.com", password="Password123!", fname="Ada"),
+    ),
+    (
+        EventDTO(),
+        Event,
+        Event("launch", "d", NOW, NOW, 1, retention={"raw": "30d", "day": None}),
+    ),
+    (
+        EventDataDTO(),
+        EventData,
+        EventData(1, {"latency": 12.5, "tags": ["a", "é"], "ok": True}, NOW),
+    ),
+    (AlertDTO(), Alert, Alert(1, 1, {"field": "data.x", "op": "gt", "value": 3})),
+    (ReportDTO(), Report, Report(1, 1, {}, "csv")),
+]
+
+
+@pytest.mark.parametrize("schema,model,obj", EXAMPLES)
+def test_rows_dump_like_the_schema(schema, model, obj):
+    obj = _metadata(obj, 7)
+    rows = RowSerializer(schema, model)
+    row = tuple(getattr(obj, column.key) for column in rows.columns)
+
+    assert rows.dump(row) == schema.dump(obj)
+
+
+def test_body_matches_response_schema():
+    schema, model = EventDTO(), Event
+    events = [_metadata(Event("e", "d", NOW, NOW, 1), i) for i in range(3)]
+    rows = RowSerializer(schema, model)
+    payload = {
+        "pagination": {"per_page": 3},
+        "links": [{"rel": "next", "href": "/events?cursor=x"}],
+        "next_cursor": "x",
+    }
+
+    expected = ResponseSchema().dump(
+        {**payload, "data": schema.dump(events, many=True)}
+    )
+    data = [tuple(getattr(e, c.key) for c in rows.columns) for e in events]
+    assert rows.body({**payload, "data": data}) == expected
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime
+
+from event_horizon.extensions import db
+from event_horizon.streams import StreamHub, Subscription, encode
+
+
+def test_full_queue_drops_oldest():
+    subscription = Subscription(1, 1, size=2)
+    for i in range(5):
+        subscription.put(encode("data", i))
+
+    messages, dropped = subscription.get(timeout=0)
+    assert [m.text for m in messages] == [
+        '{"event":"data","data":3}',
+        '{"event":"data","data":4}',
+    ]
+    assert dropped == 3
+    assert subscription.get(timeout=0) == ([], 0)
+
+
+ROWS = [{"event_id": 1, "data": {"x": 1}, "timestamp": datetime(2024, 1, 1)}]
+
+
+def test_hub_fans_out_per_event_and_user(test_app):
+    hub = StreamHub()
+    alice, bob = hub.subscribe(1, user_id=1), hub.subscribe(1, user_id=2)
+    other = hub.subscribe(2, user_id=1)
+
+    with test_app.app_context():
+        hub._on_ingest(None, 1, ROWS)
+        hub._on_alert(None, 1, [{"user_id": 2, "event_id": 1, "message": "fired"}])
+        # Published once the transaction commits.
+        assert alice.get(0) == ([], 0)
+        db.session.commit()
+
+    assert [m.sse for m in alice.get(0)[0]] == [
+        b'event: data\ndata: {"eventId":1,"data":'
+        b'[{"data":{"x":1},"timestamp":"2024-01-01T00:00:00"}]}\n\n'
+    ]
+    assert len(bob.get(0)[0]) == 2
+    assert other.get(0) == ([], 0)
+
+    for subscription in (alice, bob, other):
+        hub.unsubscribe(subscription)
+    assert hub.subscribers == {}
+
+
+def test_rolled_back_messages_are_never_published(test_app):
+    hub = StreamHub()
+    subscription = hub.subscribe(1, user_id=1)
+
+    with test_app.app_context():
+        # The signal is sent in the transaction that wrote the rows.
+        db.session.execute(db.select(1))
+        hub._on_ingest(None, 1, ROWS)
+        db.session.rollback()
+        db.session.commit()
+
+    assert subscription.get(0) == ([], 0)
+    hub.unsubscribe(subscription)
+
+
+def test_sse_reports_dropped_messages():
+    hub = StreamHub()
+    hub.queue_size = 1
+    subscription = hub.subscribe(1, 1)
+    body = hub.sse(subscription)
+    assert next(body) == b": ping\n\n"
+
+    hub.publish(1, encode("data", 1))
+    hub.publish(1, encode("data", 2))
+    assert next(body) == (
+        b'event: dropped\ndata: {"count":1}\n\nevent: data\ndata: 2\n\n'
+    )
+    body.close()
+    assert hub.subscribers == {}
+
+
+async def test_async_subscription_wakes_from_other_threads():
+    hub = StreamHub()
+    loop = asyncio.get_running_loop()
+    subscription = hub.subscribe(1, 1, loop)
+
+    await loop.run_in_executor(None, hub.publish, 1, encode("data", 1))
+    messages, _ = await asyncio.wait_for(subscription.wait(timeout=5), 1)
+    assert len(messages) == 1
+    assert await subscription.wait(timeout=0.01) == ([], 0)
+
+
+def open_stream(client, event_id, **kwargs):
+    res = client.get(f"/events/{event_id}/stream", buffered=False, **kwargs)
+    status = res.status_code
+    res.close()
+    return status
+
+
+def test_stream_accepts_header_or_stream_token(client, make_user, make_event):
+    _, headers = make_user()
+    event = make_event()
+
+    assert open_stream(client, event.id, headers=headers) == 200
+    res = client.post(f"/events/{event.id}/stream/token", headers=headers)
+    assert res.status_code == 200
+    token = res.get_json()["data"]["token"]
+    assert open_stream(client, event.id, query_string={"token": token}) == 200
+    assert open_stream(client, event.id) == 401
+
+
+def test_stream_rejects_access_tokens_in_the_query_string(
+    client, make_user, make_event
+):
+    _, headers = make_user()
+    event = make_event()
+    access_token = headers["Authorization"].removeprefix("Bearer ")
+
+    for name in ("jwt", "token"):
+        query = {name: access_token}
+        assert open_stream(client, event.id, query_string=query) == 401
+
+
+def test_stream_token_opens_one_event_for_a_while(
+    test_app, client, make_user, make_event, monkeypatch
+):
+    _, headers = make_user()
+    event, other = make_event(), make_event()
+    res = client.post(f"/events/{event.id}/stream/token", headers=headers)
+    query = {"token": res.get_json()["data"]["token"]}
+
+    assert open_stream(client, other.id, query_string=query) == 401
+    # The token can't be used as a bearer token either.
+    bearer = {"Authorization": f"Bearer {query['token']}"}
+    assert client.get(f"/events/{event.resource_id}", headers=bearer).status_code == 422
+
+    monkeypatch.setitem(test_app.config, "STREAM_TOKEN_EXPIRES", -1)
+    assert open_stream(client, event.id, query_string=query) == 401
@@ -1,61 +1,80 @@
 import json
 
-UID = None
+import pytest
 
 
-def test_list_users(client):
-    res = client.get("/users")
+# The list and detail views are async and read on their own connections.
+@pytest.mark.committed
+def test_list_users(client, make_user):
+    _, headers = make_user(is_admin=True)
+    emails = {make_user()[0].email for _ in range(3)}
+
+    res = client.get("/users", headers=headers)
 
     assert res.status_code == 200
-    data = json.loads(res.data)["data"]
-    data = [d for d in data if d["username"] != "julians"]
-    assert len(data) == 10
-    assert data[0]["username"] == "demoUser0"
+    body = json.loads(res.data)
+    data = [d for d in body["data"] if d["email"] in emails]
+    assert len(data) == 3
     assert "password" not in data[0]
-    assert "pagination" in json.loads(res.data)
+    assert "pagination" in body
+
+
+def test_list_users_requires_admin(client, make_user):
+    _, headers = make_user()
+
+    assert client.get("/users", headers=headers).status_code == 403
 
 
-def test_get_user(client):
-    res = client.get("/users/2")
+@pytest.mark.committed
+def test_get_user(client, make_user):
+    user, headers = make_user()
+
+    res = client.get(f"/users/{user.resource_id}", headers=headers)
 
     assert res.status_code == 200
     data = json.loads(res.data)["data"]
-    assert data["username"] == "demoUser0"
+    assert data["email"] == user.email
     assert "password" not in data
 
 
-def test_create_user(client):
-    global UID
+def test_create_user(client, make_user):
+    _, headers = make_user(is_admin=True)
 
     res = client.post(
         "/users",
         json={
-            "username": "testUser",
+            "fname": "Test",
             "password": "testPassword1234!",
             "email": "test@test.com",
         },
+        headers=headers,
     )
 
-    UID = json.loads(res.data)["data"]["id"]
-
     assert res.status_code == 201
-    assert json.loads(res.data)["data"]["username"] == "testUser"
+    data = json.loads(res.data)["data"]
+    assert data["fname"] == "Test"
+    assert data["email"] == "test@test.com"
 
 
-def test_patch_user(client):
-    global UID
+def test_patch_user(client, make_user):
+    user, headers = make_user()
 
     res = client.patch(
-        f"/users/{UID}",
-        json={"username": "newTestUser"},
+        f"/users/{user.resource_id}", json={"fname": "New"}, headers=headers
     )
 
     assert res.status_code == 200
-    assert json.loads(res.data)["data"]["username"] == "newTestUser"
+    assert json.loads(res.data)["data"]["fname"] == "New"
 
 
-def test_delete_user(client):
-    res = client.delete(f"/users/{UID}")
+def test_delete_user(client, make_user):
+    user, _ = make_user()
+    _, headers = make_user(is_admin=True)
+
+    res = client.delete(f"/users/{user.resource_id}", headers=headers)
 
     assert res.status_code == 204
     assert res.data == b""
+    assert (
+        client.delete(f"/users/{user.resource_id}", headers=headers).status_code == 404
+    )
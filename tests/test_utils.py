@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from argon2 import PasswordHasher
+
+from event_horizon.utils import PasswordHash
+
+CHEAP = PasswordHasher(time_cost=1, memory_cost=8, parallelism=1)
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    monkeypatch.setattr(PasswordHash, "hasher", CHEAP)
+    monkeypatch.setattr(PasswordHash, "executor", ThreadPoolExecutor(1))
+    yield CHEAP
+    PasswordHash.executor.shutdown()
+
+
+def test_compare(hasher):
+    password = PasswordHash.new("Password123!")
+    assert password == "Password123!"
+    assert password != "wrong"
+    assert password == PasswordHash(password.hash)
+    assert PasswordHash("not a hash") != "Password123!"
+
+
+def test_verify_rehashes_outdated_parameters(hasher):
+    outdated = PasswordHash(PasswordHasher(2, memory_cost=8, parallelism=1).hash("pw"))
+    assert asyncio.run(outdated.verify("wrong")) == (False, None)
+
+    matches, rehashed = asyncio.run(outdated.verify("pw"))
+    assert matches
+    assert hasher.check_needs_rehash(outdated.hash)
+    assert not hasher.check_needs_rehash(rehashed.hash)
+    assert asyncio.run(rehashed.verify("pw")) == (True, None)
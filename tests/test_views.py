@@ -0,0 +1,75 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from event_horizon.engines import count_queries
+from event_horizon.extensions import db
+from event_horizon.models import Alert, Event, Report, User
+
+# The seeded rows are read by async views, on their own connections.
+pytestmark = pytest.mark.committed
+
+# Auth (user lookup, revocation check) plus the record and one query per
+# eager-loaded collection.
+DETAIL_BUDGET = 4
+
+
+@pytest.fixture(scope="module")
+def seed(test_app):
+    def make(children):
+        with test_app.app_context():
+            user = User(
+                email=f"{uuid.uuid4().hex[:12]}@example.com", password="Password123!"
+            )
+            user.is_admin = True
+            db.session.add(user)
+            db.session.flush()
+            event = Event(
+                "n+1",
+                "detail views",
+                datetime(2024, 1, 1),
+                datetime(2024, 2, 1),
+                user.id,
+            )
+            db.session.add(event)
+            db.session.flush()
+            for _ in range(children):
+                db.session.add(
+                    Alert(user.id, event.id, {"field": "data.x", "op": "exists"})
+                )
+            report = Report(user.id, event.id, {}, "csv")
+            db.session.add(report)
+            db.session.commit()
+            token = create_access_token(
+                identity=user.email, additional_claims={"is_admin": True}, fresh=True
+            )
+            return {
+                "headers": {"Authorization": f"Bearer {token}"},
+                "user": str(user.resource_id),
+                "event": str(event.resource_id),
+                "report": str(report.resource_id),
+            }
+
+    return make
+
+
+@pytest.mark.parametrize(
+    "path", ["/events/{event}", "/users/{user}", "/reports/{report}"]
+)
+def test_detail_views_have_a_bounded_query_count(client, seed, path):
+    counts = []
+    for children in (1, 10):
+        ids = seed(children)
+        with count_queries(budget=DETAIL_BUDGET) as statements:
+            res = client.get(path.format(**ids), headers=ids["headers"])
+        assert res.status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_event_links_list_every_alert(client, seed):
+    ids = seed(3)
+    res = client.get(f"/events/{ids['event']}", headers=ids["headers"])
+    assert len(res.get_json()["links"]) == 3
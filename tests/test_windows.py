@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from event_horizon.windows import SlidingWindow, parse_window
+
+START = datetime(2024, 1, 1)
+
+
+def test_parse_window():
+    assert parse_window("30s") == 30
+    assert parse_window("5m") == 300
+    assert parse_window("1h") == 3600
+    with pytest.raises(ValueError):
+        parse_window("5 minutes")
+
+
+def test_sliding_window_matches_brute_force():
+    rng = random.Random(0)
+    window = SlidingWindow(60, buckets=60)
+    points = []
+    for i in range(2000):
+        # Mostly in order, with some late points inside the window.
+        offset = i * 0.5 - (rng.uniform(0, 20) if i % 7 == 0 else 0)
+        timestamp = START + timedelta(seconds=offset)
+        value = rng.uniform(0, 100)
+        window.add(timestamp, value)
+        points.append((timestamp, value))
+
+        latest = max(t for t, _ in points)
+        cutoff = int((latest - START).total_seconds()) - 59
+        live = [v for t, v in points if (t - START).total_seconds() >= cutoff]
+        assert window.value("count") == len(live)
+        assert window.value("sum") == pytest.approx(sum(live))
+        assert window.value("min") == min(live)
+        assert window.value("max") == max(live)
+
+
+def test_sliding_window_resets_after_gap():
+    window = SlidingWindow(60)
+    window.add(START, 5)
+    window.add(START + timedelta(hours=1), 7)
+
+    assert window.value("count") == 1
+    assert window.value("avg") == 7
+
+
+def test_late_points_before_the_oldest_bucket():
+    window = SlidingWindow(60)
+    window.add(START + timedelta(seconds=20), 5)
+    window.add(START + timedelta(seconds=19), 3)
+    window.add(START + timedelta(seconds=1), 9)
+
+    assert window.value("count") == 3
+    assert (window.value("min"), window.value("max")) == (3, 9)
+
+    # Right after a reset, the ring holds only the newest bucket again.
+    window.add(START + timedelta(hours=1, seconds=20), 7)
+    window.add(START + timedelta(hours=1, seconds=18), 1)
+    window.add(START + timedelta(hours=1, seconds=-30), 2)
+
+    assert window.value("count") == 3
+    assert window.value("sum") == 10
+    assert (window.value("min"), window.value("max")) == (1, 7)
+
+    # Points that fall out of the window as it moves leave the totals.
+    window.add(START + timedelta(hours=1, seconds=50), 4)
+    assert window.value("count") == 3
+    assert (window.value("min"), window.value("max")) == (1, 7)